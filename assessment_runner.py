@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Parallel assessment runner for the manufacturing line simulator
+
+Runs every episode of one or more assessment files against one or more policies,
+spreading the episodes over a pool of worker processes. Each episode gets its own
+seed derived from the base seed, the assessment file, the policy and the episode
+index, so the results do not depend on the number of workers or on which worker
+picked up the episode. With a cache directory, episodes whose config, policy, seed
+and simulator did not change since an earlier run are read from the cache instead
+of being simulated again, see episode_cache.py.
+
+Usage:
+    python assessment_runner.py --assessments assessments/*.json --policies heuristic random max bottleneck --workers 32
+    python assessment_runner.py --assessments assessments/machine_10_down.json --policies http://localhost:5000
+    python assessment_runner.py --policies heuristic http://localhost:5000 --brain-version v7 --cache-dir logs/episode_cache
+"""
+
+import concurrent.futures
+import datetime
+import json
+import os
+import time
+import zlib
+from functools import partial
+from typing import Dict, List
+
+import numpy as np
+import simpy
+
+from sim import manufacturing_env as MLS
+from episode_cache import EpisodeCache, policy_identity
+from iteration_logger import IterationLogger
+import policies
+
+POLICIES = {
+    "heuristic": policies.heuristic_policy,
+    "random": policies.random_policy,
+    "max": policies.max_policy,
+    "bottleneck": policies.max_bottleneck_policy,
+}
+
+LOG_PATH = "logs"
+
+
+def get_policy(policy_spec: str):
+    """Resolve a policy from its name in POLICIES or from the url of an exported brain
+
+    Parameters
+    ----------
+    policy_spec : str
+        name of a policy in policies.py (heuristic, random, max, bottleneck) or
+        url of an exported brain, e.g. http://localhost:5000
+
+    Returns
+    -------
+    Callable
+        policy that maps a state to an action
+    """
+    if policy_spec.startswith(("http://", "https://")):
+        return partial(policies.brain_policy, exported_brain_url=policy_spec)
+    if policy_spec not in POLICIES:
+        raise ValueError(
+            f"unknown policy: {policy_spec}, available policies: {', '.join(POLICIES)} or an exported brain url")
+    return POLICIES[policy_spec]
+
+
+def episode_seed(seed: int, scenario_file: str, policy_spec: str, episode: int) -> int:
+    """Derive the seed of a single episode, independent of the order the episodes run in"""
+    entropy = [seed,
+               zlib.crc32(os.path.basename(scenario_file).encode()),
+               zlib.crc32(policy_spec.encode()),
+               episode]
+    return int(np.random.SeedSequence(entropy).generate_state(1)[0])
+
+
+def make_jobs(scenario_files: List[str], policy_specs: List[str], num_iterations: int = 300,
+              seed: int = 0, log_iterations: bool = False, brain_version: str = None) -> List[Dict]:
+    """List the episodes to run, in the order the results are merged"""
+    jobs = []
+    for scenario_file in scenario_files:
+        with open(scenario_file) as fname:
+            scenario_configs = json.load(fname)['episodeConfigurations']
+        for policy_spec in policy_specs:
+            get_policy(policy_spec)  # fail early on unknown policies
+            for episode, config in enumerate(scenario_configs):
+                jobs.append({
+                    "assessment": os.path.basename(scenario_file),
+                    "policy": policy_spec,
+                    "episode": episode,
+                    "config": config,
+                    "num_iterations": num_iterations,
+                    "seed": episode_seed(seed, scenario_file, policy_spec, episode),
+                    "log_iterations": log_iterations,
+                    "policy_version": brain_version,
+                })
+    return jobs
+
+
+def run_episode(job: Dict, cache: EpisodeCache = None) -> Dict:
+    """Run a single assessment episode
+
+    The episode i of an assessment file runs its i-th configuration for exactly num_iterations steps and reports the
+    throughput, the simulated time and the illegal machine actions. This is not the loop of
+    bonsai_integration.test_policy: test_policy runs configuration i-1 for its episode i, stops an episode early once
+    the line halts and stores fewer kpis, so their results are not interchangeable and are cached under different
+    runners. Both seed the episode through the config the same way.
+
+    Parameters
+    ----------
+    job : Dict
+        episode from make_jobs
+    cache : EpisodeCache, optional
+        cache the episode is read from if it ran before and stored in otherwise, by default None
+
+    Returns
+    -------
+    Dict
+        kpis of the episode and, when log_iterations is set, the state and action of every iteration
+    """
+    start = time.perf_counter()
+    policy = get_policy(job["policy"])
+    labels = {"assessment": job["assessment"], "policy": job["policy"], "episode": job["episode"]}
+    # the downtime events and the stochastic policies draw from generators seeded from the config, like in
+    # bonsai_integration.test_policy
+    config = dict(job["config"], seed=job["seed"])
+    cache_key = None
+    if cache is not None:
+        identity = policy_identity(policy, job.get("policy_version"))
+        if identity is not None:
+            # the runner stays in the key: test_policy stores fewer kpis and stops the episodes that halt
+            cache_key = cache.key(config, identity, job["seed"], job["num_iterations"], runner="assessment")
+            entry = cache.get(cache_key, trajectory=job["log_iterations"])
+            if entry is not None:
+                kpis = dict(entry["kpis"], **labels, cached=True, wall_time=time.perf_counter() - start)
+                return {"kpis": kpis, "logs": entry["trajectory"] if job["log_iterations"] else []}
+    logs = []
+    simulator = MLS.DES(simpy.Environment(), headless=True)
+    simulator.reset(config)
+    policy = policies.with_rng(policy, simulator.policy_rng)
+    state = simulator.get_states()
+    if job["log_iterations"]:
+        action = {key: None for key in policy(state)}
+        logs.append({"iteration": 1, "state": state, "action": action})
+    illegal_actions = 0
+    for iteration in range(2, job["num_iterations"] + 2):
+        action = policy(state)
+        simulator.step(brain_actions=action)
+        state = simulator.get_states()
+        illegal_actions += sum(state["illegal_machine_actions"])
+        if job["log_iterations"]:
+            logs.append({"iteration": iteration, "state": state, "action": action})
+    kpis = dict(labels, **{
+        "seed": job["seed"],
+        "iterations": job["num_iterations"],
+        "env_time": state["env_time"],
+        "sink_throughput_absolute_sum": state["sink_throughput_absolute_sum"],
+        "illegal_machine_actions": illegal_actions,
+        "cached": False,
+        "wall_time": time.perf_counter() - start,
+    })
+    if cache_key is not None:
+        cache.put(cache_key, kpis, logs if job["log_iterations"] else None)
+    return {"kpis": kpis, "logs": logs}
+
+
+def run_assessments(scenario_files: List[str], policy_specs: List[str], num_iterations: int = 300,
+                    num_workers: int = None, seed: int = 0, log_file: str = None,
+                    cache: EpisodeCache = None, brain_version: str = None) -> List[Dict]:
+    """Run all the episodes of the assessment files for every policy on a pool of worker processes
+
+    Parameters
+    ----------
+    scenario_files : List[str]
+        assessment json files with episodeConfigurations
+    policy_specs : List[str]
+        policy names from policies.py or exported brain urls
+    num_iterations : int, optional
+        number of iterations to run for each episode, by default 300
+    num_workers : int, optional
+        number of worker processes, by default os.cpu_count(). 1 runs in the current process
+    seed : int, optional
+        base seed the seed of each episode is derived from, by default 0
+    log_file : str, optional
+        iteration log (csv, parquet or arrow) to write every iteration of every episode to, by default None
+    cache : EpisodeCache, optional
+        cache of the episode results shared by the workers, by default None
+    brain_version : str, optional
+        version of the exported brains, exported brain policies are only cached with a version, by default None
+
+    Returns
+    -------
+    List[Dict]
+        kpis per episode ordered by assessment, policy and episode
+    """
+    jobs = make_jobs(scenario_files, policy_specs, num_iterations, seed, log_file is not None, brain_version)
+    num_workers = num_workers or os.cpu_count() or 1
+    if num_workers == 1:
+        results = [run_episode(job, cache) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+            # map keeps the order of the jobs whichever worker finishes first
+            results = list(executor.map(partial(run_episode, cache=cache), jobs))
+    if log_file is not None:
+        with IterationLogger(log_file) as logger:
+            for job, result in zip(jobs, results):
+                keys = {"assessment": job["assessment"], "policy": job["policy"]}
+                logger.log_episode(job["episode"], job["config"], **keys)
+                for row in result["logs"]:
+                    logger.log(row["state"], row["action"], job["episode"], row["iteration"], **keys)
+    return [result["kpis"] for result in results]
+
+
+def summarize(kpis: List[Dict]) -> Dict:
+    '''
+    average throughput per assessment file and policy
+    '''
+    summary = {}
+    for kpi in kpis:
+        summary.setdefault((kpi["assessment"], kpi["policy"]), []).append(kpi["sink_throughput_absolute_sum"])
+    return {key: float(np.mean(values)) for key, values in summary.items()}
+
+
+def write_csv(rows: List[Dict], path: str):
+    import pandas as pd
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    pd.DataFrame(rows).to_csv(path, index=False)
+    print(f"wrote {len(rows)} rows to {path}")
+
+
+if __name__ == "__main__":
+
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(
+        description="Run assessment files against policies on a pool of worker processes")
+    parser.add_argument(
+        "--assessments",
+        type=str,
+        nargs="+",
+        default=sorted(glob.glob(os.path.join("assessments", "*.json"))),
+        help="assessment json files, by default every file in assessments/",
+    )
+    parser.add_argument(
+        "--policies",
+        type=str,
+        nargs="+",
+        default=list(POLICIES),
+        help=f"policies from policies.py ({', '.join(POLICIES)}) or exported brain urls",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="number of worker processes, by default one per cpu",
+    )
+    parser.add_argument(
+        "--iteration-limit", type=int, default=200, help="iterations per episode",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="base seed of the episodes",
+    )
+    parser.add_argument(
+        "--log-iterations", action="store_true", default=False, help="log every iteration of every episode",
+    )
+    parser.add_argument(
+        "--log-format", type=str, choices=["csv", "parquet", "arrow"], default="csv",
+        help="format of the iteration logs, parquet and arrow require pyarrow",
+    )
+    parser.add_argument(
+        "--output", type=str, default=None, help="csv file for the per-episode kpis",
+    )
+    parser.add_argument(
+        "--cache-dir", type=str, default=None,
+        help="directory of the episode cache, episodes that ran before are read from it instead of being simulated",
+    )
+    parser.add_argument(
+        "--cache-size-mb", type=int, default=1024, help="size of the episode cache, by default 1024 MB",
+    )
+    parser.add_argument(
+        "--brain-version", type=str, default=None,
+        help="version of the exported brains, exported brains are only cached with a version",
+    )
+
+    args = parser.parse_args()
+
+    current_time = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+    log_file = None
+    if args.log_iterations:
+        log_file = os.path.join(LOG_PATH, current_time + "_assessment_log." + args.log_format)
+
+    cache = None
+    if args.cache_dir:
+        cache = EpisodeCache(args.cache_dir, max_bytes=args.cache_size_mb * 2**20)
+
+    start = time.perf_counter()
+    kpis = run_assessments(args.assessments, args.policies, args.iteration_limit,
+                           args.workers, args.seed, log_file, cache, args.brain_version)
+    cached = sum(kpi["cached"] for kpi in kpis)
+    print(f"ran {len(kpis)} episodes in {time.perf_counter() - start:.1f} s, {cached} read from the cache")
+    for (assessment, policy), throughput in summarize(kpis).items():
+        print(f"{assessment:40s} {policy:20s} mean sink throughput {throughput:.1f}")
+
+    write_csv(kpis, args.output or os.path.join(LOG_PATH, current_time + "_assessment_kpis.csv"))
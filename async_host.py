@@ -0,0 +1,555 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Asyncio host running many Bonsai simulator sessions in one process
+
+Each session registers with the platform and runs the same event loop as
+bonsai_integration.main, with its own simulator. The sessions are coroutines
+that keep their advance calls in flight at once: while one waits on the
+network or idles on an Idle event, the others step their simulators. The host
+speaks the simulator session REST API of the platform with requests: every
+session keeps its own requests.Session, with its keep-alive connection, and
+makes its calls on a thread of its own, so proxies, TLS and the framing of the
+responses are handled as in the rest of the repo while the event loop runs the
+other sessions.
+
+FakeBonsaiServer is a local stand-in for the advance endpoint of the platform.
+It scripts episodes of a policy from policies.py with an optional latency, so
+the host can be tested and benchmarked without a workspace.
+
+Usage:
+    python async_host.py --num-sessions 16 --headless
+    python async_host.py --num-sessions 16 --workspace <workspace id> --accesskey <access key>
+    python async_host.py --num-sessions 64 --fake-server --fake-latency 0.05 --duration 30 --headless
+"""
+
+import asyncio
+import datetime
+import json
+import os
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+
+import numpy as np
+import requests
+import simpy
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from bonsai_integration import TemplateSimulatorSession, default_config
+import policies
+
+DEFAULT_SERVER = "https://api.bons.ai"
+
+
+class HttpError(Exception):
+    """Response of the platform with an error status"""
+
+    def __init__(self, status: int, body: bytes):
+        super().__init__(f"HTTP {status}: {body[:200].decode('utf-8', 'replace')}")
+        self.status = status
+        self.body = body
+
+
+def _json_default(value):
+    # the states of the simulator may hold numpy arrays and scalars
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dump_json(value) -> bytes:
+    return json.dumps(value, default=_json_default).encode()
+
+
+async def read_message(reader: asyncio.StreamReader):
+    """Read an HTTP/1.1 request of a client, a request with neither Content-Length nor chunked encoding has no body
+
+    Returns
+    -------
+    Tuple[str, Dict[str, str], bytes]
+        start line, headers with lower case names and body
+    """
+    start = await reader.readline()
+    if not start:
+        raise ConnectionResetError("connection closed")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                # trailers up to the blank line
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        body = b"".join(chunks)
+    else:
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return start.decode("latin-1").rstrip("\r\n"), headers, body
+
+
+class JsonConnection:
+    """Keep-alive HTTP connection sending and receiving JSON, on a requests session with a thread of its own
+
+    Parameters
+    ----------
+    url : str
+        server to connect to, e.g. https://api.bons.ai or http://localhost:8080
+    headers : Dict[str, str], optional
+        headers sent with every request, e.g. Authorization
+    timeout : float, optional
+        seconds to wait for the response of a request, by default 60
+    """
+
+    def __init__(self, url: str, headers: Dict[str, str] = None, timeout: float = 60):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        # only the connections that could not be opened are retried, an advance call is never sent twice
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1,
+                              max_retries=Retry(total=1, connect=1, read=0, redirect=0, status=0))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="session")
+
+    async def close(self):
+        # a call still in flight is not waited for, its session is closed under it
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+    def _send(self, method: str, path: str, body):
+        response = self.session.request(method, self.url + path, timeout=self.timeout,
+                                        data=dump_json(body) if body is not None else None,
+                                        headers={"Content-Type": "application/json"})
+        if response.status_code >= 400:
+            raise HttpError(response.status_code, response.content)
+        return json.loads(response.content) if response.content else None
+
+    async def request(self, method: str, path: str, body=None):
+        """Send a request and return the JSON body of its response, None if it has no body"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._send, method, path, body)
+
+
+class BonsaiSessionClient:
+    """Simulator session endpoints of the platform, on the connection of one session
+
+    Parameters
+    ----------
+    server : str
+        url of the platform, e.g. https://api.bons.ai
+    workspace : str
+        workspace id
+    access_key : str
+        access key of the workspace
+    timeout : float, optional
+        seconds to wait for a response, by default 60
+    """
+
+    def __init__(self, server: str, workspace: str, access_key: str, timeout: float = 60):
+        self.workspace = workspace
+        self.connection = JsonConnection(server, {"Authorization": access_key}, timeout=timeout)
+        self.path = f"/v2/workspaces/{urllib.parse.quote(workspace)}/simulatorSessions"
+
+    async def create(self, registration: Dict) -> str:
+        """Register a simulator session and return its id"""
+        response = await self.connection.request("POST", self.path, registration)
+        return response["sessionId"]
+
+    async def advance(self, session_id: str, sequence_id: int, state: Dict, halted: bool = False) -> Dict:
+        """Send the state of the simulator and return the next event"""
+        body = {"sequenceId": sequence_id, "state": state, "halted": halted}
+        return await self.connection.request("POST", f"{self.path}/{session_id}/advance", body)
+
+    async def delete(self, session_id: str):
+        await self.connection.request("DELETE", f"{self.path}/{session_id}")
+
+    async def close(self):
+        await self.connection.close()
+
+
+@dataclass
+class SessionStats:
+    """Counters of a session of the host"""
+    registrations: int = 0
+    episodes: int = 0
+    steps: int = 0
+    idles: int = 0
+    errors: int = 0
+    # wall time spent stepping the simulator and waiting on the platform
+    simulation_time: float = 0.0
+    network_time: float = 0.0
+
+
+class SimulatorHost:
+    """Run many simulator sessions concurrently in one event loop
+
+    Parameters
+    ----------
+    make_client : Callable[[], BonsaiSessionClient]
+        builds the client of a session, each session gets its own connection
+    num_sessions : int
+        number of simulator sessions
+    interface : Dict
+        registration of the simulator, i.e. interface.json
+    simulator_context : str, optional
+        simulator context of the registration, see BonsaiClientConfig
+    headless : bool, optional
+        run the simulators without printing, by default True
+    log_iterations : bool, optional
+        log the iterations of each session to its own file, by default False
+    """
+
+    def __init__(self, make_client, num_sessions: int, interface: Dict, simulator_context: str = None,
+                 headless: bool = True, log_iterations: bool = False):
+        self.make_client = make_client
+        self.num_sessions = num_sessions
+        self.interface = interface
+        self.simulator_context = simulator_context
+        self.headless = headless
+        self.log_iterations = log_iterations
+        self.stats = [SessionStats() for _ in range(num_sessions)]
+        self.sessions = []
+        self._stop = None
+        self._max_steps = None
+        self._started = None
+
+    def _registration(self) -> Dict:
+        registration = {
+            "name": self.interface["name"],
+            "timeout": self.interface["timeout"],
+            "description": self.interface["description"],
+        }
+        if self.simulator_context is not None:
+            registration["simulatorContext"] = self.simulator_context
+        return registration
+
+    async def _register(self, client: BonsaiSessionClient, index: int):
+        """Register a session, retrying with a growing delay while the platform cannot be reached"""
+        delay = 1.0
+        while True:
+            try:
+                session_id = await client.create(self._registration())
+                self.stats[index].registrations += 1
+                if not self.headless:
+                    print(f"[session {index}] registered simulator {session_id}")
+                return session_id, 1
+            except (HttpError, OSError, asyncio.TimeoutError, ValueError, KeyError) as err:
+                self.stats[index].errors += 1
+                print(f"[session {index}] error in registering session: {err}")
+                if self._stop.is_set():
+                    raise
+                await asyncio.sleep(delay)
+                delay = min(2 * delay, 60.0)
+
+    def _done(self) -> bool:
+        if self._max_steps is not None and sum(stats.steps for stats in self.stats) >= self._max_steps:
+            self._stop.set()
+        return self._stop.is_set()
+
+    async def run_session(self, index: int):
+        """Event loop of one session, see bonsai_integration.main"""
+        stats = self.stats[index]
+        log_file_name = None
+        if self.log_iterations:
+            current_time = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+            log_file_name = f"{current_time}_MLSim_session{index}_log.csv"
+        sim = TemplateSimulatorSession(log_data=self.log_iterations, log_file_name=log_file_name,
+                                       headless=self.headless, env=simpy.Environment())
+        self.sessions.append(sim)
+        client = self.make_client()
+        session_id = None
+        episode = iteration = 0
+        # advance calls failed in a row, the session waits longer before registering again each time
+        failures = 0
+        try:
+            session_id, sequence_id = await self._register(client, index)
+            while not self._done():
+                start = time.perf_counter()
+                try:
+                    event = await client.advance(session_id, sequence_id, sim.get_state(), sim.halted())
+                    sequence_id = event["sequenceId"]
+                    failures = 0
+                except (HttpError, OSError, asyncio.TimeoutError, ValueError, KeyError) as err:
+                    # the session may have been dropped by the platform, register again and go on
+                    stats.errors += 1
+                    failures += 1
+                    print(f"[session {index}] error in advance: {err}")
+                    if failures > 1:
+                        await asyncio.sleep(min(0.1 * 2 ** failures, 60.0))
+                    session_id, sequence_id = await self._register(client, index)
+                    continue
+                finally:
+                    stats.network_time += time.perf_counter() - start
+
+                start = time.perf_counter()
+                event_type = event.get("type")
+                if not self.headless:
+                    print(f"[{time.strftime('%H:%M:%S')}] [session {index}] Last Event: {event_type}")
+                if event_type == "Idle":
+                    stats.idles += 1
+                    await asyncio.sleep(event.get("idle", {}).get("callbackTime", 0))
+                elif event_type == "EpisodeStart":
+                    sim.episode_start(event.get("episodeStart", {}).get("config") or None)
+                    stats.episodes += 1
+                    episode += 1
+                elif event_type == "EpisodeStep":
+                    action = event["episodeStep"]["action"]
+                    sim.episode_step(action)
+                    stats.steps += 1
+                    iteration += 1
+                    if sim.log_data:
+                        sim.log_iterations(episode=episode, iteration=iteration, state=sim.get_state(), action=action)
+                elif event_type == "EpisodeFinish":
+                    iteration = 0
+                elif event_type == "Unregister":
+                    print(f"[session {index}] unregistered by platform because "
+                          f"'{event.get('unregister', {}).get('details')}', registering again")
+                    session_id, sequence_id = await self._register(client, index)
+                if event_type != "Idle":
+                    stats.simulation_time += time.perf_counter() - start
+                # give the other sessions a turn, their responses may be waiting
+                await asyncio.sleep(0)
+        finally:
+            if session_id is not None:
+                try:
+                    await client.delete(session_id)
+                except (HttpError, OSError, asyncio.TimeoutError):
+                    pass
+            await client.close()
+            sim.close_log()
+
+    async def run(self, duration: Optional[float] = None, max_steps: Optional[int] = None) -> Dict:
+        """Run the sessions until stopped, for duration seconds or until max_steps steps in total
+
+        Returns
+        -------
+        Dict
+            summary, see summary
+        """
+        self._stop = asyncio.Event()
+        self._max_steps = max_steps
+        self._started = time.perf_counter()
+        tasks = [asyncio.ensure_future(self.run_session(index)) for index in range(self.num_sessions)]
+        try:
+            if duration is not None:
+                await asyncio.wait(tasks, timeout=duration, return_when=asyncio.FIRST_EXCEPTION)
+                self._stop.set()
+            await asyncio.gather(*tasks)
+        finally:
+            self._stop.set()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return self.summary()
+
+    def stop(self):
+        """Let the sessions finish their current event and unregister"""
+        if self._stop is not None:
+            self._stop.set()
+
+    def summary(self) -> Dict:
+        """Totals of the sessions with the steps per second of the host since it started"""
+        wall_time = time.perf_counter() - self._started if self._started is not None else 0.0
+        totals = {name: sum(getattr(stats, name) for stats in self.stats) for name in asdict(SessionStats())}
+        totals.update(sessions=self.num_sessions, wall_time=wall_time,
+                      steps_per_second=totals["steps"] / wall_time if wall_time > 0 else 0.0)
+        return totals
+
+
+class FakeBonsaiServer:
+    """Local stand-in for the simulator session endpoints of the platform
+
+    Every session plays episodes of steps_per_episode steps, whose actions are
+    computed by a policy from the state sent by the simulator, after an optional
+    latency. Every idle_every events, an Idle event is sent instead.
+
+    Parameters
+    ----------
+    policy : Callable, optional
+        policy from policies.py, by default heuristic_policy
+    steps_per_episode : int, optional
+        by default 100
+    latency : float, optional
+        seconds before each advance response, by default 0
+    idle_every : int, optional
+        period of the Idle events in events, by default no Idle event
+    idle_time : float, optional
+        callback time of the Idle events, by default 0.01
+    config : Dict, optional
+        config of the EpisodeStart events, by default the default config of bonsai_integration.py
+    """
+
+    def __init__(self, policy=policies.heuristic_policy, steps_per_episode: int = 100, latency: float = 0.0,
+                 idle_every: int = None, idle_time: float = 0.01, config: Dict = None):
+        self.policy = policy
+        self.steps_per_episode = steps_per_episode
+        self.latency = latency
+        self.idle_every = idle_every
+        self.idle_time = idle_time
+        self.config = config if config is not None else default_config
+        # per session: last sequence id, events sent, step of the episode
+        self.sessions = {}
+        self.deleted = []
+        self.sequence_errors = 0
+        self.requests = 0
+        self.server = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        self.server = await asyncio.start_server(self._handle, host, port)
+        return self
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line, _, body = await read_message(reader)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    break
+                method, path = request_line.split()[:2]
+                status, response = await self._route(method, path, json.loads(body) if body else None)
+                data = dump_json(response) if response is not None else b""
+                writer.write((f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+                              f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n"
+                              ).encode("latin-1") + data)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, body):
+        self.requests += 1
+        parts = path.strip("/").split("/")
+        # v2/workspaces/<workspace>/simulatorSessions[/<session id>[/advance]]
+        if len(parts) < 4 or parts[:2] != ["v2", "workspaces"] or parts[3] != "simulatorSessions":
+            return 404, {"error": f"unknown path {path}"}
+        if method == "POST" and len(parts) == 4:
+            session_id = f"fake-{len(self.sessions)}"
+            self.sessions[session_id] = {"sequence_id": 1, "events": 0, "step": None}
+            return 201, {"sessionId": session_id, "name": body.get("name")}
+        session = self.sessions.get(parts[4]) if len(parts) > 4 else None
+        if session is None:
+            return 404, {"error": "unknown session"}
+        if method == "DELETE" and len(parts) == 5:
+            self.deleted.append(parts[4])
+            return 204, None
+        if method == "POST" and len(parts) == 6 and parts[5] == "advance":
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return 200, self._next_event(session, body)
+        return 405, {"error": f"{method} is not supported on {path}"}
+
+    def _next_event(self, session: Dict, body: Dict) -> Dict:
+        if body.get("sequenceId") != session["sequence_id"]:
+            self.sequence_errors += 1
+        session["sequence_id"] += 1
+        session["events"] += 1
+        event = {"sequenceId": session["sequence_id"]}
+        if self.idle_every and session["events"] % self.idle_every == 0:
+            event.update(type="Idle", idle={"callbackTime": self.idle_time})
+        elif session["step"] is None:
+            session["step"] = 0
+            event.update(type="EpisodeStart", episodeStart={"config": self.config})
+        elif session["step"] < self.steps_per_episode:
+            session["step"] += 1
+            action = {name: float(value) for name, value in self.policy(body["state"]).items()}
+            event.update(type="EpisodeStep", episodeStep={"action": action})
+        else:
+            session["step"] = None
+            event.update(type="EpisodeFinish", episodeFinish={"reason": "EpisodeComplete"})
+        return event
+
+
+async def run_fake(num_sessions: int, duration: float = None, max_steps: int = None, headless: bool = True,
+                   **server_options) -> Dict:
+    """Run the host against a local FakeBonsaiServer, see FakeBonsaiServer for the server options"""
+    server = await FakeBonsaiServer(**server_options).start()
+    try:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "interface.json")) as file:
+            interface = json.load(file)
+        host = SimulatorHost(lambda: BonsaiSessionClient(server.url, "fake-workspace", "fake-key"),
+                             num_sessions, interface, headless=headless)
+        summary = await host.run(duration=duration, max_steps=max_steps)
+        summary.update(sequence_errors=server.sequence_errors, requests=server.requests,
+                       unregistered=len(server.deleted))
+        return summary
+    finally:
+        await server.close()
+
+
+def print_summary(summary: Dict):
+    print(f"{summary['sessions']} sessions, {summary['episodes']} episodes, {summary['steps']} steps, "
+          f"{summary['idles']} idles, {summary['errors']} errors in {summary['wall_time']:.1f} s: "
+          f"{summary['steps_per_second']:.1f} steps/s")
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run many Bonsai simulator sessions in one process")
+    parser.add_argument("--num-sessions", type=int, default=8, help="number of simulator sessions")
+    parser.add_argument("--duration", type=float, default=None, help="seconds to run for, by default until interrupted")
+    parser.add_argument("--max-steps", type=int, default=None, help="steps of all the sessions to stop after")
+    parser.add_argument("--headless", action="store_true", default=False,
+                        help="Run the simulators without printing states, actions and simulation events")
+    parser.add_argument("--log-iterations", action="store_true", default=False,
+                        help="Log the iterations of each session to its own file")
+    parser.add_argument("--workspace", type=str, default=None, help="your workspace id, by default SIM_WORKSPACE")
+    parser.add_argument("--accesskey", type=str, default=None, help="your access key, by default SIM_ACCESS_KEY")
+    parser.add_argument("--server", type=str, default=None, help=f"url of the platform, by default SIM_API_HOST or "
+                                                                 f"{DEFAULT_SERVER}")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for a response of the platform")
+    parser.add_argument("--fake-server", action="store_true", default=False,
+                        help="Run against a local fake advance endpoint instead of the platform")
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="latency of the fake endpoint in seconds")
+    parser.add_argument("--fake-steps", type=int, default=100, help="steps per episode of the fake endpoint")
+    parser.add_argument("--fake-idle-every", type=int, default=None, help="period of the Idle events of the fake endpoint")
+
+    args = parser.parse_args()
+
+    if args.fake_server:
+        summary = asyncio.run(run_fake(args.num_sessions, args.duration, args.max_steps, args.headless,
+                                       latency=args.fake_latency, steps_per_episode=args.fake_steps,
+                                       idle_every=args.fake_idle_every))
+    else:
+        workspace = args.workspace or os.environ.get("SIM_WORKSPACE")
+        access_key = args.accesskey or os.environ.get("SIM_ACCESS_KEY")
+        if not (workspace and access_key):
+            parser.error("a workspace and an access key are needed, from the command line or from "
+                         "SIM_WORKSPACE and SIM_ACCESS_KEY")
+        server = args.server or os.environ.get("SIM_API_HOST", DEFAULT_SERVER)
+        with open("interface.json") as file:
+            interface = json.load(file)
+        host = SimulatorHost(lambda: BonsaiSessionClient(server, workspace, access_key, args.timeout),
+                             args.num_sessions, interface, simulator_context=os.environ.get("SIM_CONTEXT"),
+                             headless=args.headless, log_iterations=args.log_iterations)
+        try:
+            summary = asyncio.run(host.run(duration=args.duration, max_steps=args.max_steps))
+        except KeyboardInterrupt:
+            summary = host.summary()
+            print("Unregistered simulators.")
+    print_summary(summary)
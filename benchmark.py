@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Performance benchmark of the manufacturing line simulator
+
+Sweeps control types, number of conveyor bins, line lengths, policies,
+engines and event schedulers and reports for every combination:
+    - simulated seconds per wall second of DES.step + get_states
+    - p50/p99 latency of DES.step + get_states
+    - p50/p99 latency of an in-place DES.reset
+    - peak memory traced while building, resetting and stepping the simulator
+
+When several engines run the same case, the speedup of each engine over the loop engine
+is reported against TARGET_SPEEDUP, the 10x asked of the vectorized engine. It is only met
+on long lines, not on the 12 machines of the default line.
+
+The line lengths are serial lines built with sim.line_config.serial_line and passed
+to the simulator as a LineTopology. Each line length runs in its own freshly
+spawned worker process, so that the peak resident memory of a worker covers a
+single line length. Results are written as JSON and can be compared against a
+stored baseline, e.g.
+
+Usage:
+    python benchmark.py --output logs/benchmark.json
+    python benchmark.py --control-types 0 1 --engines loop analytic --baseline logs/benchmark.json --fail-on-regression
+    python benchmark.py --line-lengths 12 100 500 --engines loop vectorized --control-types 0 --policies heuristic
+    python benchmark.py --control-types 1 2 --schedulers simpy heap
+"""
+
+import concurrent.futures
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Dict, List
+
+import numpy as np
+
+ASSESSMENT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assessments",
+                          "three_random_machine_down.json")
+
+CASE_KEYS = ("line_length", "control_type", "num_conveyor_bins", "policy", "engine", "scheduler")
+# value of the case keys missing from the results of earlier runs
+CASE_DEFAULTS = {"scheduler": "simpy"}
+
+# simulated seconds per wall second the array engines were asked to reach over the loop engine. The vectorized engine
+# only reaches it on long lines: at 12 machines it is 1.5x with control type 0 and no faster with control type 1, at 500
+# machines 5.5x and 19.5x, see speedups
+TARGET_SPEEDUP = 10.0
+
+# metric name -> True when higher is better
+METRICS = {
+    "sim_seconds_per_wall_second": True,
+    "step_p50_ms": False,
+    "step_p99_ms": False,
+    "reset_p50_ms": False,
+    "reset_p99_ms": False,
+    "peak_memory_kb": False,
+}
+
+
+def make_cases(control_types: List[int], num_conveyor_bins: List[int], line_lengths: List[int],
+               policies: List[str], engines: List[str], schedulers: List[str] = ("simpy",)) -> List[Dict]:
+    """List every combination of the swept parameters"""
+    return [dict(zip(CASE_KEYS, values)) for values in
+            itertools.product(line_lengths, control_types, num_conveyor_bins, policies, engines, schedulers)]
+
+
+def _case_key(case: Dict) -> tuple:
+    return tuple(case.get(key, CASE_DEFAULTS.get(key)) for key in CASE_KEYS)
+
+
+def _percentiles(samples: List[float]) -> Dict:
+    p50, p99 = np.percentile(np.asarray(samples) * 1e3, [50, 99])
+    return {"p50_ms": float(p50), "p99_ms": float(p99)}
+
+
+def _episode(simulator, config, policy, num_steps, seed):
+    '''
+    reset the simulator and step it num_steps times, returns the wall time of every step + get_states
+    '''
+    from policies import with_rng
+    simulator.reset(dict(config, seed=seed))
+    policy = with_rng(policy, simulator.policy_rng)
+    state = simulator.get_states()
+    latencies = []
+    for _ in range(num_steps):
+        action = policy(state)
+        start = time.perf_counter()
+        simulator.step(brain_actions=action)
+        state = simulator.get_states()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run_case(case: Dict, config: Dict, num_steps: int = 200, num_resets: int = 50, seed: int = 0) -> Dict:
+    """Benchmark a single combination of the swept parameters in the current process
+
+    Parameters
+    ----------
+    case : Dict
+        swept parameters, see CASE_KEYS. line_length is the number of machines of the serial line
+    config : Dict
+        episode configuration the swept parameters are applied to
+    num_steps : int, optional
+        number of DES.step + get_states calls to time, by default 200
+    num_resets : int, optional
+        number of in-place resets to time, by default 50
+    seed : int, optional
+        seed of the simulator and of the policy, by default 0
+
+    Returns
+    -------
+    Dict
+        the case with its metrics, or with an error if the simulator failed on it
+    """
+    import simpy
+    from sim import manufacturing_env as MLS
+    from sim.line_config import serial_line
+    from sim.topology import LineTopology
+    from assessment_runner import get_policy
+
+    result = dict(case)
+    config = dict(config, control_type=case["control_type"], num_conveyor_bins=case["num_conveyor_bins"],
+                  engine=case["engine"], scheduler=case.get("scheduler", CASE_DEFAULTS["scheduler"]))
+    try:
+        topology = LineTopology(*serial_line(case["line_length"]))
+        policy = get_policy(case["policy"])
+        simulator = MLS.DES(simpy.Environment(), headless=True, topology=topology)
+
+        latencies = _episode(simulator, config, policy, num_steps, seed)
+        simulated = simulator.now - simulator.initial_time
+
+        resets = []
+        for _ in range(num_resets):
+            start = time.perf_counter()
+            simulator.reset(config)
+            resets.append(time.perf_counter() - start)
+
+        # separate pass since tracing slows down every allocation
+        tracemalloc.start()
+        try:
+            _episode(MLS.DES(simpy.Environment(), headless=True, topology=topology), config, policy, num_steps, seed)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    except Exception as err:
+        result["error"] = f"{type(err).__name__}: {err}"
+        return result
+
+    step, reset = _percentiles(latencies), _percentiles(resets)
+    result.update({
+        "steps": num_steps,
+        "sim_seconds": float(simulated),
+        "sim_seconds_per_wall_second": float(simulated / sum(latencies)),
+        "step_p50_ms": step["p50_ms"],
+        "step_p99_ms": step["p99_ms"],
+        "reset_p50_ms": reset["p50_ms"],
+        "reset_p99_ms": reset["p99_ms"],
+        "peak_memory_kb": peak / 1024,
+    })
+    return result
+
+
+def _run_cases(cases, config, num_steps, num_resets, seed):
+    results = [run_case(case, config, num_steps, num_resets, seed) for case in cases]
+    try:
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:  # not available on windows
+        max_rss = None
+    for result in results:
+        result["worker_max_rss_kb"] = max_rss
+    return results
+
+
+def run_benchmarks(cases: List[Dict], config: Dict = None, num_steps: int = 200, num_resets: int = 50,
+                   seed: int = 0) -> List[Dict]:
+    """Benchmark every case, one fresh worker process per line length
+
+    Parameters
+    ----------
+    cases : List[Dict]
+        cases from make_cases
+    config : Dict, optional
+        episode configuration, by default the first episode of assessments/three_random_machine_down.json
+    num_steps, num_resets, seed
+        see run_case
+
+    Returns
+    -------
+    List[Dict]
+        the cases in their original order with their metrics
+    """
+    if config is None:
+        with open(ASSESSMENT) as fname:
+            config = json.load(fname)["episodeConfigurations"][0]
+    by_length = {}
+    for index, case in enumerate(cases):
+        by_length.setdefault(case["line_length"], []).append(index)
+    results = [None] * len(cases)
+    for line_length, indices in by_length.items():
+        # spawned rather than forked so that the memory of the worker is only the one of its line length
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            worker_results = executor.submit(
+                _run_cases, [cases[i] for i in indices], config, num_steps, num_resets, seed).result()
+        for index, result in zip(indices, worker_results):
+            results[index] = result
+    return results
+
+
+def metadata() -> Dict:
+    '''
+    environment the benchmark ran in
+    '''
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float = 0.1) -> List[Dict]:
+    """Compare results against the results of a baseline run
+
+    Parameters
+    ----------
+    results, baseline : List[Dict]
+        results of run_benchmarks, matched on CASE_KEYS
+    tolerance : float, optional
+        relative change beyond which a metric counts as a regression, by default 0.1
+
+    Returns
+    -------
+    List[Dict]
+        one row per metric of every case found in both runs, with its ratio to the baseline and
+        whether it regressed
+    """
+    baseline = {_case_key(b): b for b in baseline if "error" not in b}
+    rows = []
+    for result in results:
+        reference = baseline.get(_case_key(result))
+        if reference is None or "error" in result:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if not reference.get(metric):
+                continue
+            ratio = result[metric] / reference[metric]
+            regression = ratio < 1 - tolerance if higher_is_better else ratio > 1 + tolerance
+            rows.append(dict({key: result[key] for key in CASE_KEYS}, metric=metric, baseline=reference[metric],
+                             value=result[metric], ratio=ratio, regression=regression))
+    return rows
+
+
+def speedups(results: List[Dict], reference: str = "loop") -> List[Dict]:
+    """Simulated seconds per wall second of every engine over the reference engine on the same case
+
+    Parameters
+    ----------
+    results : List[Dict]
+        results of run_benchmarks
+    reference : str, optional
+        engine the others are compared to, by default loop
+
+    Returns
+    -------
+    List[Dict]
+        one row per result of another engine whose case also ran with the reference engine, with its speedup and
+        whether it reaches TARGET_SPEEDUP
+    """
+    metric = "sim_seconds_per_wall_second"
+    by_case = {_case_key(r): r for r in results if r["engine"] == reference and "error" not in r}
+    rows = []
+    for result in results:
+        base = by_case.get(_case_key(dict(result, engine=reference)))
+        if result["engine"] == reference or "error" in result or base is None or not base[metric]:
+            continue
+        speedup = result[metric] / base[metric]
+        rows.append(dict({key: result[key] for key in CASE_KEYS}, speedup=speedup,
+                         target_met=speedup >= TARGET_SPEEDUP))
+    return rows
+
+
+def print_results(results: List[Dict]):
+    print(f"{'K':>4s} {'ctrl':>4s} {'bins':>4s} {'policy':>10s} {'engine':>10s} {'sched':>6s} {'sim s/s':>10s} "
+          f"{'step p50':>9s} {'step p99':>9s} {'reset p50':>9s} {'peak kB':>9s}")
+    for r in results:
+        prefix = (f"{r['line_length']:4d} {r['control_type']:4d} {r['num_conveyor_bins']:4d} "
+                  f"{r['policy']:>10s} {r['engine']:>10s} {r['scheduler']:>6s} ")
+        if "error" in r:
+            print(prefix + r["error"])
+        else:
+            print(prefix + f"{r['sim_seconds_per_wall_second']:10.0f} {r['step_p50_ms']:9.3f} "
+                  f"{r['step_p99_ms']:9.3f} {r['reset_p50_ms']:9.3f} {r['peak_memory_kb']:9.0f}")
+    rows = speedups(results)
+    if rows:
+        print(f"speedup in sim s/s over the loop engine, target {TARGET_SPEEDUP:.0f}x:")
+    for row in rows:
+        print(f"{row['line_length']:4d} {row['control_type']:4d} {row['num_conveyor_bins']:4d} {row['policy']:>10s} "
+              f"{row['engine']:>10s} {row['scheduler']:>6s} {row['speedup']:9.1f}x "
+              f"{'target met' if row['target_met'] else 'target not met'}")
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the manufacturing line simulator")
+    parser.add_argument("--control-types", type=int, nargs="+", default=[-1, 0, 1, 2])
+    parser.add_argument("--num-conveyor-bins", type=int, nargs="+", default=[10])
+    parser.add_argument("--line-lengths", type=int, nargs="+", default=[12],
+                        help="number of machines of the serial line, see sim/line_config.serial_line")
+    parser.add_argument("--policies", type=str, nargs="+", default=["heuristic", "random", "max", "bottleneck"],
+                        help="policies from policies.py")
+    parser.add_argument("--engines", type=str, nargs="+", default=["loop"],
+                        help="engines of the simulator: loop, vectorized, analytic")
+    parser.add_argument("--schedulers", type=str, nargs="+", default=["simpy"],
+                        help="event schedulers of the simulator: simpy, heap")
+    parser.add_argument("--steps", type=int, default=200, help="timed DES.step + get_states calls per case")
+    parser.add_argument("--resets", type=int, default=50, help="timed resets per case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None, help="json file to write the results to")
+    parser.add_argument("--baseline", type=str, default=None, help="json results of an earlier run to compare to")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative change of a metric reported as a regression, by default 0.1")
+    parser.add_argument("--fail-on-regression", action="store_true", default=False,
+                        help="exit with status 1 when a metric regressed against the baseline")
+
+    args = parser.parse_args()
+
+    cases = make_cases(args.control_types, args.num_conveyor_bins, args.line_lengths, args.policies, args.engines,
+                       args.schedulers)
+    results = run_benchmarks(cases, num_steps=args.steps, num_resets=args.resets, seed=args.seed)
+    print_results(results)
+
+    report = {"metadata": metadata(), "settings": vars(args), "results": results, "speedups": speedups(results)}
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as fname:
+            json.dump(report, fname, indent=2)
+        print(f"wrote {len(results)} results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as fname:
+            rows = compare(results, json.load(fname)["results"], args.tolerance)
+        regressions = [row for row in rows if row["regression"]]
+        for row in regressions:
+            print(f"regression: {' '.join(str(row[key]) for key in CASE_KEYS)} {row['metric']} "
+                  f"{row['baseline']:.4g} -> {row['value']:.4g} ({row['ratio']:.2f}x)")
+        print(f"{len(regressions)} of {len(rows)} metrics regressed by more than {args.tolerance:.0%}")
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
@@ -14,37 +14,34 @@ Usage:
 import simpy
 from sim.line_config import adj, adj_conv
 from sim import manufacturing_env as MLS
-from policies import brain_policy, random_policy, max_policy, max_bottleneck_policy, heuristic_policy
+from sim.vector_env import VectorDES
+from policies import (brain_policy, random_policy, max_policy, max_bottleneck_policy, heuristic_policy, with_rng,
+                      predict_batch)
+from iteration_logger import IterationLogger
+from episode_cache import EpisodeCache, policy_identity
+from assessment_runner import episode_seed
+from sim.trace import EventTrace
+import atexit
 import datetime
 import json
 import os
 import pathlib
-import random
 import sys
 import time
-import pandas as pd
 import numpy as np
 from typing import Dict, Union
-from scipy.stats import truncnorm
-from dotenv import load_dotenv, set_key
-from microsoft_bonsai_api.simulator.client import BonsaiClient, BonsaiClientConfig
-from microsoft_bonsai_api.simulator.generated.models import (
-    SimulatorInterface,
-    SimulatorState,
-    SimulatorSessionResponse,
-)
-from azure.core.exceptions import HttpResponseError
 from functools import partial
-import threading
-import pdb
+# python-dotenv and the Bonsai/Azure SDK are only needed to connect to the platform, they are imported by
+# env_setup and main so that local tests and worker processes start without them
 
 MACHINES, CONVEYORS, _, _ = MLS.get_machines_conveyors_sources_sets(
     adj, adj_conv)
 ENV = simpy.Environment()
 no_machines = len(MACHINES)
 no_conveyors = len(CONVEYORS)
-machines_min_speed = MLS.General.machine_min_speed
-machines_max_speed = MLS.General.machine_max_speed
+# speed limits of the default line, repeated for lines with more machines, see SimConfig.sized
+machines_min_speed = MLS.per_machine(MLS.General.machine_min_speed, no_machines)
+machines_max_speed = MLS.per_machine(MLS.General.machine_max_speed, no_machines)
 
 DIR_PATH = os.path.dirname(os.path.realpath(__file__))
 LOG_PATH = "logs"
@@ -75,25 +72,30 @@ default_config = {
     "num_products_at_infeed_index1": 50,
     "num_products_at_infeed_index2": 350
 }
+# the default config is built before any simulator exists, its initial speeds are drawn from their own seeded generator
+default_config_rng = np.random.default_rng(10)
 for i in range(no_machines):
-    default_config["machine" + str(i) + "_initial_speed"] = random.randint(
-        machines_min_speed[i], machines_max_speed[i])
+    default_config["machine" + str(i) + "_initial_speed"] = int(default_config_rng.integers(
+        machines_min_speed[i], machines_max_speed[i], endpoint=True))
 
 
-def ensure_log_dir(log_full_path):
+def ensure_log_dir(log_full_path, headless: bool = False):
     """
-    Ensure the directory for logs exists — create if needed.
+    Ensure the directory for logs exists — create if needed, without printing anything if headless.
 
     """
-    print(f"logfile: {log_full_path}")
+    if not headless:
+        print(f"logfile: {log_full_path}")
     logs_directory = pathlib.Path(log_full_path).parent.absolute()
-    print(f"Checking {logs_directory}")
+    if not headless:
+        print(f"Checking {logs_directory}")
     if not pathlib.Path(logs_directory).exists():
-        print(
-            "Directory does not exist at {0}, creating now...".format(
-                str(logs_directory)
+        if not headless:
+            print(
+                "Directory does not exist at {0}, creating now...".format(
+                    str(logs_directory)
+                )
             )
-        )
         logs_directory.mkdir(parents=True, exist_ok=True)
 
 
@@ -104,6 +106,10 @@ class TemplateSimulatorSession:
         env_name: str = "MLSim",
         log_data: bool = False,
         log_file_name: str = None,
+        log_format: str = "csv",
+        headless: bool = False,
+        tracer: EventTrace = None,
+        env: simpy.Environment = None,
     ):
         """Simulator Interface with the Bonsai Platform
 
@@ -117,21 +123,36 @@ class TemplateSimulatorSession:
             Whether to log data, by default False
         log_file_name : str, optional
             where to log data, by default None. If not specified, will generate a name.
+        log_format : str, optional
+            format of the logs: csv, parquet or arrow, by default csv
+        headless : bool, optional
+            Whether to run without printing states, actions and simulation events, by default False
+        tracer : EventTrace, optional
+            ring buffer recording downtime, machine state and control events, by default None
+        env : simpy.Environment, optional
+            environment of the simulator, by default the one of the module. sessions that run in the same
+            process need their own, see async_host.py
         """
 
-        self.simulator = MLS.DES(ENV)
+        self.headless = headless
+        self.tracer = tracer
+        self.simulator = MLS.DES(env if env is not None else ENV, headless=headless, tracer=tracer)
         self._episode_count = 0
 
         self.count_view = False
         self.env_name = env_name
         self.render = render
         self.log_data = log_data
+        self.log_format = log_format
         if not log_file_name:
             current_time = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
-            log_file_name = current_time + "_" + env_name + "_log.csv"
+            log_file_name = current_time + "_" + env_name + "_log." + log_format
 
         self.log_full_path = os.path.join(LOG_PATH, log_file_name)
-        ensure_log_dir(self.log_full_path)
+        ensure_log_dir(self.log_full_path, headless)
+        # created on the first logged iteration
+        self.logger = None
+        self._logged_episode = None
 
     def get_state(self) -> Dict[str, float]:
         """Extract current states from the simulator
@@ -143,14 +164,15 @@ class TemplateSimulatorSession:
         """
         sim_states = self.simulator.get_states()
 
-        print('---Summary Status of Simulator States---')
-        print('machine states are', sim_states['machines_state'])
-        print('actual machine speeds are', sim_states['machines_actual_speed'])
-        print('brain speeds are', sim_states['brain_speed'])
-        # print('levels of conveyors are', sim_states['conveyors_level'])
-        for i in range(no_conveyors):
-            conveyor_level = sim_states['conveyor_buffers'][i]
-            print(f'level of conveyor {i} is {conveyor_level}')
+        if not self.headless:
+            print('---Summary Status of Simulator States---')
+            print('machine states are', sim_states['machines_state'])
+            print('actual machine speeds are', sim_states['machines_actual_speed'])
+            print('brain speeds are', sim_states['brain_speed'])
+            # print('levels of conveyors are', sim_states['conveyors_level'])
+            for i in range(no_conveyors):
+                conveyor_level = sim_states['conveyor_buffers'][i]
+                print(f'level of conveyor {i} is {conveyor_level}')
 
         if self.render:
             pass
@@ -180,13 +202,13 @@ class TemplateSimulatorSession:
         if config is None:
             config = default_config
 
-        print('------------------------resetting new episode------------------------')
-        print(config)
-        # re-intializing the simulator to make sure all the processes are killed
-        ENV = simpy.Environment()
-        self.simulator = MLS.DES(ENV)
-
-        # seset the simulator to create new processes
+        if not self.headless:
+            print('------------------------resetting new episode------------------------')
+            print(config)
+        self._episode_count += 1
+        if self.tracer is not None:
+            self.tracer.record(0, 'episode_start', episode=self._episode_count)
+        # reset the simulator in place: the processes of the previous episode are dropped and new ones are created
         self.simulator.reset(config)
         self.config_flattened = config.copy()
 
@@ -200,7 +222,7 @@ class TemplateSimulatorSession:
         episode: int = 0,
         iteration: int = 1,
     ):
-        """Log iterations during training to a CSV.
+        """Log iterations during training, the config is logged once per episode in a separate table.
 
         Parameters
         ----------
@@ -208,42 +230,20 @@ class TemplateSimulatorSession:
         action : Dict
         episode : int, optional
         iteration : int, optional
-        sim_speed_delay : float, optional
         """
-
-        def add_prefixes(d, prefix: str):
-            return {f"{prefix}_{k}": v for k, v in d.items()}
-
-        # custom way to turn lists into strings for logging
-        log_state = state.copy()
-        log_action = action.copy()
-
-        for key, value in log_state.items():
-            if type(value) == list:
-                log_state[key] = str(log_state[key])
-
-        for key, value in log_action.items():
-            if type(value) == list:
-                log_action[key] = str(log_action[key])
-
-        log_state = add_prefixes(log_state, "state")
-        log_action = add_prefixes(log_action, "action")
-        log_config = add_prefixes(self.config_flattened, "config")
-
-        data = {**log_state, **log_action, **log_config}
-
-        data["episode"] = episode
-        data["iteration"] = iteration
-        log_df = pd.DataFrame(data, index=[0])
-
-        if os.path.exists(self.log_full_path):
-            log_df.to_csv(
-                path_or_buf=self.log_full_path, mode="a", header=False, index=False
-            )
-        else:
-            log_df.to_csv(
-                path_or_buf=self.log_full_path, mode="w", header=True, index=False
-            )
+        if self.logger is None:
+            self.logger = IterationLogger(self.log_full_path, format=self.log_format)
+        if episode != self._logged_episode:
+            self.logger.log_episode(episode, self.config_flattened)
+            self._logged_episode = episode
+        self.logger.log(state, action, episode, iteration)
+
+    def close_log(self):
+        """Write the buffered iterations and close the log files."""
+        if self.logger is not None:
+            self.logger.close()
+            self.logger = None
+            self._logged_episode = None
 
     def episode_step(self, action: Dict):
         """Step through the environment for a single iteration.
@@ -255,7 +255,8 @@ class TemplateSimulatorSession:
         """
 
         sim_action = action
-        print('sim action is:\n', sim_action)
+        if not self.headless:
+            print('sim action is:\n', sim_action)
         self.simulator.step(brain_actions=sim_action)
 
 
@@ -267,6 +268,7 @@ def env_setup(env_file: str = ".env"):
     Tuple
         workspace, and access_key
     """
+    from dotenv import load_dotenv, set_key
 
     load_dotenv(verbose=True, override=True)
     workspace = os.getenv("SIM_WORKSPACE")
@@ -300,13 +302,30 @@ def test_policy(
     policy=heuristic_policy,
     policy_name: str = "test_policy",
     scenario_file: str = "machine_10_down.json",
-    exported_brain_url: str = "http://5200:5000"
+    exported_brain_url: str = "http://5200:5000",
+    log_format: str = "csv",
+    headless: bool = False,
+    tracer: EventTrace = None,
+    seed: int = None,
+    cache: EpisodeCache = None,
+    policy_version: str = None,
 ):
     """Test a policy using random actions over a fixed number of episodes
     Parameters
     ----------
     num_episodes : int, optional
         number of iterations to run, by default 10
+    headless : bool, optional
+        run without printing anything, by default False
+    tracer : EventTrace, optional
+        ring buffer recording the simulation events, by default None
+    seed : int, optional
+        base seed of the episodes, see assessment_runner.episode_seed, by default None
+    cache : EpisodeCache, optional
+        cache episodes are read from if they ran before with the same seed and stored in otherwise, by default None.
+        Only used with a seed, since episodes without a seed cannot be reproduced
+    policy_version : str, optional
+        version of the policy, policies querying an exported brain are only cached with a version, by default None
     """
     # Use custom assessment scenario configs
     with open(scenario_file) as fname:
@@ -315,39 +334,126 @@ def test_policy(
     num_episodes = len(scenario_configs)
 
     current_time = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
-    log_file_name = current_time + "_" + policy_name + "_log.csv"
+    log_file_name = current_time + "_" + policy_name + "_log." + log_format
     sim = TemplateSimulatorSession(
         render=render,
         log_data=log_iterations,
-        log_file_name=log_file_name
+        log_file_name=log_file_name,
+        log_format=log_format,
+        headless=headless,
+        tracer=tracer,
     )
+    identity = policy_identity(policy, policy_version) if cache is not None and seed is not None else None
     for episode in range(0, num_episodes):
         iteration = 1
         terminal = False
+        config = scenario_configs[episode-1]
+        trajectory = []
+        cache_key = None
+        if seed is not None:
+            seed_of_episode = episode_seed(seed, scenario_file, policy_name, episode)
+            # the downtime events and the stochastic policies draw from generators seeded from the config
+            config = dict(config, seed=seed_of_episode)
+            if identity is not None:
+                cache_key = cache.key(config, identity, seed_of_episode, num_iterations, runner="test_policy")
+                entry = cache.get(cache_key, trajectory=log_iterations)
+                if entry is not None:
+                    replay_episode(sim, entry, config, episode, log_iterations, headless)
+                    continue
         # sim_state = sim.episode_start(config=default_config)
-        sim_state = sim.episode_start(config=scenario_configs[episode-1])
+        sim_state = sim.episode_start(config=config)
+        episode_policy = with_rng(policy, sim.simulator.policy_rng)
         sim_state = sim.get_state()
         if log_iterations:
-            action = policy(sim_state)
+            action = episode_policy(sim_state)
             for key, value in action.items():
                 action[key] = None
             sim.log_iterations(sim_state, action, episode, iteration)
-        print('------------------------------------------------------')
-        print(f"Running iteration #{iteration} for episode #{episode}")
+            trajectory.append({"iteration": iteration, "state": sim_state, "action": action})
+        if not headless:
+            print('------------------------------------------------------')
+            print(f"Running iteration #{iteration} for episode #{episode}")
         iteration += 1
         while not terminal:
-            action = policy(sim_state)
+            action = episode_policy(sim_state)
             sim.episode_step(action)
             sim_state = sim.get_state()
             if log_iterations:
                 sim.log_iterations(sim_state, action, episode, iteration)
-            print('------------------------------------------------------')
-            print(f"Running iteration #{iteration} for episode #{episode}")
+                trajectory.append({"iteration": iteration, "state": sim_state, "action": action})
+            if not headless:
+                print('------------------------------------------------------')
+                print(f"Running iteration #{iteration} for episode #{episode}")
             iteration += 1
             terminal = iteration >= num_iterations+2 or sim.halted()
+        if cache_key is not None:
+            kpis = {
+                "iterations": iteration - 2,
+                "env_time": sim_state["env_time"],
+                "sink_throughput_absolute_sum": sim_state["sink_throughput_absolute_sum"],
+            }
+            cache.put(cache_key, kpis, trajectory if log_iterations else None)
+    sim.close_log()
     return sim
 
 
+def replay_episode(sim, entry: Dict, config: Dict, episode: int, log_iterations: bool, headless: bool):
+    """Log an episode read from the episode cache as if it had been simulated"""
+    if log_iterations:
+        sim.config_flattened = config.copy()
+        for row in entry["trajectory"]:
+            sim.log_iterations(row["state"], row["action"], episode, row["iteration"])
+    if not headless:
+        print('------------------------------------------------------')
+        print(f"Episode #{episode} read from the episode cache, "
+              f"sink throughput {entry['kpis']['sink_throughput_absolute_sum']}")
+
+
+def test_policy_batched(
+    num_iterations: int = 300,
+    policy=heuristic_policy,
+    policy_name: str = "test_policy",
+    scenario_file: str = "machine_10_down.json",
+    seed: int = None,
+    headless: bool = False,
+):
+    """Test a policy on all the episodes of an assessment file at once, stepping the episodes in lockstep
+    Parameters
+    ----------
+    num_iterations : int, optional
+        number of iterations to run for each episode, by default 300
+    seed : int, optional
+        base seed of the episodes, see assessment_runner.episode_seed, by default None
+    headless : bool, optional
+        run without printing anything, by default False
+    Returns
+    -------
+    List
+        final state of each episode
+    """
+    with open(scenario_file) as fname:
+        assess_info = json.load(fname)
+    scenario_configs = assess_info['episodeConfigurations']
+    if seed is not None:
+        # the downtime events are seeded from the config like in test_policy
+        scenario_configs = [dict(config, seed=episode_seed(seed, scenario_file, policy_name, episode))
+                            for episode, config in enumerate(scenario_configs)]
+
+    vsim = VectorDES(scenario_configs)
+    episode_states = vsim.get_episode_states()
+    for iteration in range(2, num_iterations + 2):
+        # the states of all the episodes go to an exported brain together
+        actions = predict_batch(policy, episode_states)
+        episode_states = vsim.get_episode_states(vsim.step(actions))
+        if not headless:
+            print(f"Running iteration #{iteration} for {vsim.num_episodes} episodes")
+    if not headless:
+        print('------------------------------------------------------')
+        for episode, sim_state in enumerate(episode_states):
+            print(f"{policy_name} episode #{episode}: sink throughput {sim_state['sink_throughput_absolute_sum']}")
+    return episode_states
+
+
 def main(
     render: bool = False,
     log_iterations: bool = False,
@@ -355,6 +461,9 @@ def main(
     env_file: Union[str, bool] = ".env",
     workspace: str = None,
     accesskey: str = None,
+    log_format: str = "csv",
+    headless: bool = False,
+    tracer: EventTrace = None,
 ):
     """Main entrypoint for running simulator connections
 
@@ -364,6 +473,12 @@ def main(
         visualize steps in environment, by default True, by default False
     log_iterations: bool, optional
         log iterations during training to a CSV file
+    log_format: str, optional
+        format of the iteration logs: csv, parquet or arrow, by default csv
+    headless: bool, optional
+        run the simulator without printing anything, by default False
+    tracer: EventTrace, optional
+        ring buffer recording the simulation events, by default None
     config_setup: bool, optional
         if enabled then uses a local `.env` file to find sim workspace id and access_key
     env_file: str, optional
@@ -373,6 +488,14 @@ def main(
     accesskey: str, optional
         optional flag from CLI for accesskey to override
     """
+    from dotenv import load_dotenv
+    from microsoft_bonsai_api.simulator.client import BonsaiClient, BonsaiClientConfig
+    from microsoft_bonsai_api.simulator.generated.models import (
+        SimulatorInterface,
+        SimulatorState,
+        SimulatorSessionResponse,
+    )
+    from azure.core.exceptions import HttpResponseError
 
     # check if workspace or access-key passed in CLI
     use_cli_args = all([workspace, accesskey])
@@ -400,7 +523,8 @@ def main(
         pass
 
     # grab standardized way to interact with sim API
-    sim = TemplateSimulatorSession(render=render, log_data=log_iterations)
+    sim = TemplateSimulatorSession(render=render, log_data=log_iterations, log_format=log_format,
+                                   headless=headless, tracer=tracer)
 
     # configure client to interact with Bonsai service
     config_client = BonsaiClientConfig()
@@ -425,15 +549,17 @@ def main(
         """
 
         try:
-            print(
-                "config: {}, {}".format(
-                    config_client.server, config_client.workspace)
-            )
+            if not headless:
+                print(
+                    "config: {}, {}".format(
+                        config_client.server, config_client.workspace)
+                )
             registered_session: SimulatorSessionResponse = client.session.create(
                 workspace_name=config_client.workspace, body=registration_info
             )
-            print("Registered simulator. {}".format(
-                registered_session.session_id))
+            if not headless:
+                print("Registered simulator. {}".format(
+                    registered_session.session_id))
 
             return registered_session, 1
         except HttpResponseError as ex:
@@ -470,10 +596,11 @@ def main(
                     body=sim_state,
                 )
                 sequence_id = event.sequence_id
-                print(
-                    "[{}] Last Event: {}".format(
-                        time.strftime("%H:%M:%S"), event.type)
-                )
+                if not headless:
+                    print(
+                        "[{}] Last Event: {}".format(
+                            time.strftime("%H:%M:%S"), event.type)
+                    )
             except HttpResponseError as ex:
                 print(
                     "HttpResponseError in Advance: StatusCode: {}, Error: {}, Exception: {}".format(
@@ -499,9 +626,11 @@ def main(
             # event loop
             if event.type == "Idle":
                 time.sleep(event.idle.callback_time)
-                print("Idling...")
+                if not headless:
+                    print("Idling...")
             elif event.type == "EpisodeStart":
-                print(event.episode_start.config)
+                if not headless:
+                    print(event.episode_start.config)
                 sim.episode_start(event.episode_start.config)
                 episode += 1
             elif event.type == "EpisodeStep":
@@ -515,7 +644,8 @@ def main(
                         action=event.episode_step.action,
                     )
             elif event.type == "EpisodeFinish":
-                print("Episode Finishing...")
+                if not headless:
+                    print("Episode Finishing...")
                 iteration = 0
             elif event.type == "Unregister":
                 print(
@@ -535,7 +665,9 @@ def main(
             workspace_name=config_client.workspace,
             session_id=registered_session.session_id,
         )
-        print("Unregistered simulator.")
+        if not headless:
+            print("Unregistered simulator.")
+        sim.close_log()
     # except Exception as err:
     #     # gracefully unregister for any other exceptions
     #     client.session.delete(
@@ -560,6 +692,26 @@ if __name__ == "__main__":
         default=False,
         help="Log iterations during training",
     )
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        default=False,
+        help="Run the simulator without printing states, actions and simulation events",
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        metavar="TRACE_FILE",
+        default=None,
+        help="Record the most recent downtime, machine state and control events and write them to TRACE_FILE at exit",
+    )
+    parser.add_argument(
+        "--log-format",
+        type=str,
+        choices=["csv", "parquet", "arrow"],
+        default="csv",
+        help="Format of the iteration logs, parquet and arrow require pyarrow",
+    )
     parser.add_argument(
         "--config-setup",
         action="store_true",
@@ -617,11 +769,59 @@ if __name__ == "__main__":
         help="Custom assess config json filename",
     )
 
+    parser.add_argument(
+        "--batched",
+        action="store_true",
+        default=False,
+        help="Run all the episodes of the assessment at once when running local test",
+    )
+
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Base seed of the episodes when running local test",
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Episode cache directory, episodes that ran before with the same seed are read from it when running local test",
+    )
+
+    parser.add_argument(
+        "--brain-version",
+        type=str,
+        default=None,
+        help="Version of the exported brain, exported brains are only cached with a version",
+    )
+
     args, _ = parser.parse_known_args()
 
-    if args.test_random:
+    cache = EpisodeCache(args.cache_dir) if args.cache_dir else None
+
+    tracer = None
+    if args.trace:
+        tracer = EventTrace()
+        atexit.register(tracer.dump, args.trace)
+
+    if args.test_random and args.batched:
+        scenario_file = 'machine_10_down.json'
+        if args.custom_assess:
+            scenario_file = args.custom_assess
+        test_policy_batched(
+            policy=heuristic_policy,
+            num_iterations=args.iteration_limit,
+            scenario_file=scenario_file,
+            seed=args.seed,
+            headless=args.headless,
+        )
+    elif args.test_random:
         test_policy(
-            render=args.render, log_iterations=args.log_iterations, policy=heuristic_policy
+            render=args.render, log_iterations=args.log_iterations, policy=heuristic_policy,
+            log_format=args.log_format, headless=args.headless, tracer=tracer,
+            seed=args.seed, cache=cache
         )
     elif args.test_exported:
         port = args.test_exported
@@ -631,14 +831,30 @@ if __name__ == "__main__":
         if args.custom_assess:
             scenario_file = args.custom_assess
         trained_brain_policy = partial(brain_policy, exported_brain_url=url)
-        test_policy(
-            render=args.render,
-            log_iterations=args.log_iterations,
-            policy=trained_brain_policy,
-            policy_name="exported",
-            num_iterations=args.iteration_limit,
-            scenario_file=scenario_file
-        )
+        if args.batched:
+            test_policy_batched(
+                policy=trained_brain_policy,
+                policy_name="exported",
+                num_iterations=args.iteration_limit,
+                scenario_file=scenario_file,
+                seed=args.seed,
+                headless=args.headless,
+            )
+        else:
+            test_policy(
+                render=args.render,
+                log_iterations=args.log_iterations,
+                policy=trained_brain_policy,
+                policy_name="exported",
+                num_iterations=args.iteration_limit,
+                scenario_file=scenario_file,
+                log_format=args.log_format,
+                headless=args.headless,
+                tracer=tracer,
+                seed=args.seed,
+                cache=cache,
+                policy_version=args.brain_version
+            )
     else:
         main(
             config_setup=args.config_setup,
@@ -647,4 +863,7 @@ if __name__ == "__main__":
             env_file=args.env_file,
             workspace=args.workspace,
             accesskey=args.accesskey,
+            log_format=args.log_format,
+            headless=args.headless,
+            tracer=tracer,
         )
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Load generator for exported brains
+
+Runs --lines simulated lines at once, each in its own thread with its own DES,
+and asks the brain for the action of every step through one pooled BrainClient,
+see policies.py. Reports the latency percentiles of the requests, the requests
+per second and the steps per second of the whole sim to brain loop. Without --url,
+a local stand-in brain is started, see brain_server.py.
+
+Usage:
+    python brain_load.py --lines 16 --steps 200
+    python brain_load.py --lines 64 --duration 30 --policy random --latency 0.005 --jitter 0.002
+    python brain_load.py --lines 32 --duration 60 --url http://localhost:5000
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+import requests
+import simpy
+
+from sim import manufacturing_env as MLS
+from policies import BrainClient
+
+PERCENTILES = (50, 90, 99)
+
+
+def run_line(client: BrainClient, config: Dict, steps: Optional[int], deadline: Optional[float],
+             episode_steps: int, latencies: list, errors: list, stop: threading.Event):
+    """Step one simulated line with the actions of the brain, appending the latency of each request"""
+    des = MLS.DES(simpy.Environment(), headless=True)
+    des.reset(config)
+    step = 0
+    while not stop.is_set() and (steps is None or step < steps) and (deadline is None or time.monotonic() < deadline):
+        if step and step % episode_steps == 0:
+            des.reset(config)
+        state = des.get_states()
+        start = time.perf_counter()
+        try:
+            action = client.predict(state)
+        except (requests.RequestException, ValueError) as error:
+            errors.append(error)
+            continue
+        finally:
+            latencies.append(time.perf_counter() - start)
+            step += 1
+        des.step(action)
+
+
+def run_load(url: str, num_lines: int = 16, steps: int = None, duration: float = None, episode_steps: int = 300,
+             seed: int = 0, timeout: float = 30, config: Dict = None) -> Dict:
+    """Drive the brain at url from num_lines lines at once
+
+    Parameters
+    ----------
+    url : str
+        url of the exported brain
+    num_lines : int, optional
+        number of lines stepping at once, by default 16
+    steps : int, optional
+        requests of each line, by default until the duration is over
+    duration : float, optional
+        seconds to run for, by default until every line made its steps
+    episode_steps : int, optional
+        steps after which a line starts a new episode, by default 300
+    seed : int, optional
+        seed of the first line, the next lines get the next seeds, by default 0
+    config : Dict, optional
+        config of the episodes, by default the defaults of the simulator
+
+    Returns
+    -------
+    Dict
+        number of requests and errors, latency percentiles in seconds, requests per second and wall time
+    """
+    if steps is None and duration is None:
+        raise ValueError("either steps or duration is needed")
+    deadline = time.monotonic() + duration if duration is not None else None
+    latencies, errors, stop = [], [], threading.Event()
+    with BrainClient(url, timeout=timeout, pool_size=num_lines) as client:
+        threads = [threading.Thread(target=run_line, name=f"line-{line}",
+                                    args=(client, dict(config or {}, seed=seed + line), steps, deadline,
+                                          episode_steps, latencies, errors, stop), daemon=True)
+                   for line in range(num_lines)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        wall_time = time.perf_counter() - start
+    summary = {"lines": num_lines, "requests": len(latencies), "errors": len(errors), "wall_time": wall_time,
+               "requests_per_second": len(latencies) / wall_time if wall_time > 0 else 0.0}
+    values = np.percentile(latencies, PERCENTILES) if latencies else [np.nan] * len(PERCENTILES)
+    summary.update({f"p{percentile}": float(value) for percentile, value in zip(PERCENTILES, values)})
+    summary["max"] = float(max(latencies)) if latencies else np.nan
+    return summary
+
+
+def print_summary(summary: Dict):
+    print(f"{summary['lines']} lines, {summary['requests']} requests, {summary['errors']} errors "
+          f"in {summary['wall_time']:.1f} s: {summary['requests_per_second']:.1f} requests/s")
+    print("latency " + ", ".join(f"{name} {summary[name] * 1000:.2f} ms"
+                                 for name in [f"p{percentile}" for percentile in PERCENTILES] + ["max"]))
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    from brain_server import start_brain_server
+    from assessment_runner import POLICIES
+
+    parser = argparse.ArgumentParser(description="Drive an exported brain from many simulated lines at once")
+    parser.add_argument("--lines", type=int, default=16, help="number of lines stepping at once")
+    parser.add_argument("--steps", type=int, default=None, help="requests of each line")
+    parser.add_argument("--duration", type=float, default=None, help="seconds to run for")
+    parser.add_argument("--episode-steps", type=int, default=300, help="steps of the episodes of the lines")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the episodes of the first line")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for a prediction")
+    parser.add_argument("--url", type=str, default=None,
+                        help="url of the exported brain, by default a local stand-in is started")
+    parser.add_argument("--policy", type=str, default="heuristic", choices=sorted(POLICIES),
+                        help="policy of the local stand-in")
+    parser.add_argument("--latency", type=float, default=0.0, help="latency of the local stand-in in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="mean added latency of the local stand-in")
+
+    args = parser.parse_args()
+    if args.steps is None and args.duration is None:
+        args.steps = 100
+
+    server = None
+    url = args.url
+    if url is None:
+        server, url = start_brain_server(args.policy, latency=args.latency, jitter=args.jitter, seed=args.seed)
+        print(f"Started the {args.policy} stand-in brain at {url}")
+    try:
+        print_summary(run_load(url, args.lines, steps=args.steps, duration=args.duration,
+                               episode_steps=args.episode_steps, seed=args.seed, timeout=args.timeout))
+    finally:
+        if server is not None:
+            server.terminate()
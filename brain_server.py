@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Local stand-in for an exported brain
+
+Serves the prediction endpoint of an exported Bonsai brain, /v1/prediction, by
+running a policy from policies.py on the posted state, after an optional latency.
+The states of many lines can also be predicted in one request to /v1/predictions,
+see BrainClient.batch_path in policies.py. Use it in place of the exported brain
+container to run --test-exported, assessment_runner.py and brain_load.py offline.
+
+Usage:
+    python brain_server.py --policy heuristic --port 5000
+    python brain_server.py --policy random --port 5000 --latency 0.005 --jitter 0.002
+    python bonsai_integration.py --test-exported 5000
+"""
+
+import asyncio
+import json
+import multiprocessing
+import signal
+from typing import Callable, Dict
+
+import numpy as np
+
+from assessment_runner import POLICIES
+from async_host import dump_json, read_message
+from policies import with_rng
+
+PREDICTION_PATH = "/v1/prediction"
+BATCH_PATH = "/v1/predictions"
+
+
+class BrainServer:
+    """Serve the actions of a policy like an exported brain
+
+    Parameters
+    ----------
+    policy : Callable
+        policy from policies.py, maps a state to an action
+    latency : float, optional
+        seconds before each response, by default 0
+    jitter : float, optional
+        mean of an exponentially distributed delay added to the latency, by default 0
+    seed : int, optional
+        seed of the jitter and of the stochastic policies, by default None
+    """
+
+    def __init__(self, policy: Callable, latency: float = 0.0, jitter: float = 0.0, seed: int = None):
+        # the jitter and the policy draw from separate streams, so that the latency does not change the actions
+        self.rng, policy_rng = (np.random.default_rng(stream) for stream in np.random.SeedSequence(seed).spawn(2))
+        self.policy = with_rng(policy, policy_rng)
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self.predictions = 0
+        self.errors = 0
+        self.server = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        self.server = await asyncio.start_server(self._handle, host, port)
+        return self
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line, _, body = await read_message(reader)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    break
+                method, path = request_line.split()[:2]
+                try:
+                    status, response = await self._route(method, path, json.loads(body) if body else None)
+                except (KeyError, IndexError, TypeError, ValueError) as error:
+                    # states without the fields the policy reads
+                    self.errors += 1
+                    status, response = 400, {"error": f"{type(error).__name__}: {error}"}
+                data = dump_json(response)
+                writer.write((f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+                              f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n"
+                              ).encode("latin-1") + data)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, body):
+        self.requests += 1
+        path = path.split("?")[0].rstrip("/")
+        if path not in (PREDICTION_PATH, BATCH_PATH):
+            return 404, {"error": f"unknown path {path}"}
+        if method not in ("GET", "POST") or (path == BATCH_PATH and method != "POST"):
+            return 405, {"error": f"{method} is not supported on {path}"}
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + (self.rng.exponential(self.jitter) if self.jitter else 0.0))
+        if path == BATCH_PATH:
+            return 200, [self._predict(state) for state in body]
+        return 200, self._predict(body)
+
+    def _predict(self, state: Dict) -> Dict:
+        self.predictions += 1
+        return {name: float(value) for name, value in self.policy(state).items()}
+
+
+def _serve(connection, policy_name: str, host: str, port: int, server_options: Dict):
+    """Process running a BrainServer, its url is sent on the connection"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    async def serve():
+        server = await BrainServer(POLICIES[policy_name], **server_options).start(host, port)
+        connection.send(server.url)
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def start_brain_server(policy_name: str = "heuristic", host: str = "127.0.0.1", port: int = 0, **server_options):
+    """Start a BrainServer in its own process, returns the process and the url of the server
+
+    Parameters
+    ----------
+    policy_name : str, optional
+        name of the policy in POLICIES of assessment_runner.py, by default heuristic
+    server_options
+        latency, jitter and seed of the BrainServer
+    """
+    if policy_name not in POLICIES:
+        raise ValueError(f"unknown policy: {policy_name}, available policies: {', '.join(POLICIES)}")
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_serve, args=(sender, policy_name, host, port, server_options),
+                              name="brain-server", daemon=True)
+    process.start()
+    return process, receiver.recv()
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve a policy from policies.py like an exported brain")
+    parser.add_argument("--policy", type=str, default="heuristic", choices=sorted(POLICIES),
+                        help="policy answering the predictions")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=5000, help="port to listen on, 5000 like the exported brains")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each response")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="mean of an exponential delay in seconds added to the latency")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the jitter and of the random policy")
+
+    args = parser.parse_args()
+
+    async def main():
+        server = await BrainServer(POLICIES[args.policy], latency=args.latency, jitter=args.jitter,
+                                   seed=args.seed).start(args.host, args.port)
+        print(f"Serving the {args.policy} policy at {server.url}{PREDICTION_PATH}")
+        try:
+            await server.server.serve_forever()
+        finally:
+            print(f"{server.requests} requests, {server.predictions} predictions, {server.errors} errors")
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,248 @@
+"""
+Content-addressed on-disk cache of episode results
+
+An episode is identified by the hash of what determines its outcome: the normalized
+episode config (SimConfig with its defaults and derived parameters filled in), the
+identity of the policy, the seed, the number of iterations, the runner and the version
+of the simulator. The simulator version is a hash of the sources of the sim package, of the
+modules that run the episodes (RUNNER_SOURCES) and of the line topology, so any change to the
+simulator or to the episode loops invalidates the cache. The policy identity
+is the name of the policy function and a hash of the source file it is defined in. Policies
+served from a url, e.g. exported brains, can change behind the same url and are only cached
+with an explicit version.
+
+Entries hold the per-episode kpis and optionally the trajectory, i.e. the state and action of
+every iteration. They are gzipped json files named after their key. Reading an entry marks it
+as recently used and the least recently used entries are evicted once the cache grows beyond
+its size limit. Entries are written atomically, so several worker processes can share a cache.
+
+Usage:
+    cache = EpisodeCache("logs/episode_cache", max_bytes=2**30)
+    key = cache.key(config, policy_identity(policies.heuristic_policy), seed, num_iterations)
+    entry = cache.get(key)
+    if entry is None:
+        ...  # run the episode
+        cache.put(key, kpis, trajectory)
+"""
+
+import dataclasses
+import functools
+import glob
+import gzip
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+SIM_PATH = os.path.join(ROOT_PATH, "sim")
+# episode loops and policy seeding: assessment_runner.run_episode, bonsai_integration.test_policy, policies.with_rng
+RUNNER_SOURCES = [os.path.join(ROOT_PATH, name) for name in ("assessment_runner.py", "bonsai_integration.py",
+                                                             "policies.py")]
+
+
+def _json_default(value):
+    # numpy scalars and arrays in states and kpis
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not json serializable")
+
+
+def _hash(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=_json_default).encode()).hexdigest()
+
+
+def _file_hash(path: str) -> str:
+    with open(path, "rb") as fname:
+        return hashlib.sha256(fname.read()).hexdigest()
+
+
+def simulator_version(topology=None) -> str:
+    """Hash of the sources of the sim package, of the episode runners and of the line topology, by default the one of
+    the line config"""
+    from sim import manufacturing_env as MLS
+    topology = topology or MLS.General.topology
+    paths = sorted(glob.glob(os.path.join(SIM_PATH, "*.py"))) + RUNNER_SOURCES
+    sources = {os.path.relpath(path, ROOT_PATH): _file_hash(path) for path in paths}
+    line = [topology.machines, topology.conveyors, topology.upstream_machine, topology.downstream_machine,
+            topology.sink_feeders, topology.balances, topology.joins]
+    return _hash({"sources": sources, "line": line})
+
+
+def normalize_config(config: Dict, num_machines: int = None) -> Dict:
+    """Episode config with the defaults and derived parameters filled in, so that equivalent configs hash the same,
+    e.g. machine0_initial_speed to machine11_initial_speed and machine_initial_speed as an array"""
+    from sim import manufacturing_env as MLS
+    num_machines = num_machines or len(MLS.General.topology.machines)
+    return dataclasses.asdict(MLS.SimConfig.from_dict(config, num_machines))
+
+
+def policy_identity(policy: Callable, version: str = None) -> Optional[str]:
+    """Identity of a policy for the cache key, None if the policy cannot be cached
+
+    Parameters
+    ----------
+    policy : Callable
+        policy function, possibly a functools.partial with its arguments
+    version : str, optional
+        version of the policy, required for policies that query a url, e.g. the version of an exported brain
+
+    Returns
+    -------
+    Optional[str]
+        name, arguments and source hash of the policy, or None for url policies without a version and for
+        policies without a source file
+    """
+    arguments = []
+    while isinstance(policy, functools.partial):
+        arguments.append([list(policy.args), policy.keywords])
+        policy = policy.func
+    remote = any(isinstance(value, str) and value.startswith(("http://", "https://"))
+                 for args, keywords in arguments for value in list(args) + list(keywords.values()))
+    if remote and version is None:
+        return None
+    try:
+        source = _file_hash(inspect.getsourcefile(policy))
+    except (TypeError, OSError):  # builtins and functions defined interactively
+        return None
+    name = f"{policy.__module__}.{policy.__qualname__}"
+    if "<lambda>" in name or "<locals>" in name:
+        return None
+    return _hash({"name": name, "arguments": arguments, "source": source, "version": version})
+
+
+class EpisodeCache:
+    """Size-bounded on-disk cache of episode results
+
+    Parameters
+    ----------
+    directory : str
+        directory of the cache, created if it does not exist
+    max_bytes : int, optional
+        size of the cache beyond which the least recently used entries are evicted, by default 1 GiB
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 2**30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # size of the entries, scanned on the first write and then kept up to date with the writes of this process
+        self._size = None
+        self._version = None
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, config: Dict, policy: str, seed: int, num_iterations: int, **extra) -> str:
+        """Key of an episode
+
+        Parameters
+        ----------
+        config : Dict
+            episode config, normalized with normalize_config
+        policy : str
+            identity of the policy from policy_identity
+        seed : int
+            seed of the episode
+        num_iterations : int
+            number of iterations of the episode
+        extra
+            anything else the results depend on, e.g. the runner that ran the episode
+        """
+        if self._version is None:
+            self._version = simulator_version()
+        return _hash({"config": normalize_config(config), "policy": policy, "seed": seed,
+                      "iterations": num_iterations, "simulator": self._version, "extra": extra})
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".json.gz")
+
+    def get(self, key: str, trajectory: bool = False) -> Optional[Dict]:
+        """Entry of a key, None if it is not cached or if the trajectory is requested but was not stored
+
+        Returns
+        -------
+        Optional[Dict]
+            kpis and trajectory of the episode
+        """
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rt") as fname:
+                entry = json.load(fname)
+            os.utime(path)  # most recently used
+        except (OSError, ValueError, EOFError):  # missing, evicted by another process or cut off
+            entry = None
+        if entry is None or (trajectory and entry["trajectory"] is None):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, kpis: Dict, trajectory: List[Dict] = None):
+        """Store the kpis and optionally the trajectory of an episode, evicting old entries beyond the size limit"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written next to the entry and renamed, so that readers never see a partial entry
+        handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:  # a new entry
+            replaced = 0
+        try:
+            with os.fdopen(handle, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as fname:
+                fname.write(json.dumps({"kpis": kpis, "trajectory": trajectory}, default=_json_default).encode())
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += os.path.getsize(path) - replaced
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, "*", "*.json.gz")):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def size(self) -> int:
+        """Size of the entries in bytes"""
+        return sum(size for _, size, _ in self._entries())
+
+    def __len__(self):
+        return len(self._entries())
+
+    def evict(self, max_bytes: int = None):
+        """Remove the least recently used entries until the cache fits in max_bytes, by default the size limit"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self._entries())
+        size = sum(size for _, size, _ in entries)
+        for _, entry_size, path in entries:
+            if size <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:  # already evicted by another process
+                pass
+            size -= entry_size
+        self._size = size
+
+    def clear(self):
+        """Remove every entry"""
+        self.evict(0)
+
+    def __repr__(self):
+        return f"EpisodeCache({self.directory!r}, max_bytes={self.max_bytes}, hits={self.hits}, misses={self.misses})"
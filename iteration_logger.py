@@ -0,0 +1,227 @@
+"""
+Buffered, columnar logger for the iterations of simulator episodes
+
+Rows are kept in memory and handed over in chunks to a background thread that
+turns them into columns and appends them to the log. List valued states (machine
+speeds, conveyor buffers, proxes, ...) are stored as array columns: fixed size
+list columns in Parquet/Arrow and one column per element (e.g. state_machines_speed_0,
+state_conveyor_buffers_3_7) in CSV. Episode configs are written once per episode to a separate table next to
+the iteration log (<name>_config.<ext>) and can be joined back on the episode columns.
+
+Usage:
+    with IterationLogger("logs/run_log.csv") as logger:
+        logger.log_episode(episode, config)
+        logger.log(state, action, episode, iteration)
+"""
+
+import atexit
+import os
+import queue
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+FORMATS = {".csv": "csv", ".parquet": "parquet", ".arrow": "arrow"}
+
+
+def _columns(rows: List[Dict]) -> Dict:
+    '''
+    transpose buffered rows into columns, list values become (rows, width, ...) arrays
+    '''
+    names = {}
+    for row in rows:
+        names.update(dict.fromkeys(row))
+    columns = {}
+    for name in names:
+        values = [row.get(name) for row in rows]
+        if isinstance(values[0], (list, tuple, np.ndarray)):
+            try:
+                values = np.asarray(values)
+            except ValueError:  # lists of different lengths stay lists
+                pass
+        columns[name] = values
+    return columns
+
+
+class _CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", newline="")
+        self.header = True
+
+    def write(self, columns):
+        import pandas as pd
+        flat = {}
+        for name, values in columns.items():
+            if isinstance(values, np.ndarray) and values.ndim > 1:
+                for index in np.ndindex(*values.shape[1:]):
+                    flat[name + "".join(f"_{i}" for i in index)] = values[(slice(None),) + index]
+            else:
+                flat[name] = values
+        pd.DataFrame(flat).to_csv(self.file, header=self.header, index=False)
+        self.header = False
+
+    def close(self):
+        self.file.close()
+
+
+def _import_pyarrow(format):
+    try:
+        import pyarrow
+    except ImportError as err:
+        raise ImportError(f"{format} logs require pyarrow, install it with: pip install pyarrow") from err
+    return pyarrow
+
+
+class _ArrowWriter:
+    def __init__(self, path, format):
+        self.pa = _import_pyarrow(format)
+        self.path = path
+        self.format = format
+        self.writer = None
+
+    def table(self, columns):
+        pa = self.pa
+        arrays = {}
+        for name, values in columns.items():
+            if isinstance(values, np.ndarray) and values.ndim > 1:
+                array = pa.array(values.ravel())
+                for width in reversed(values.shape[1:]):
+                    array = pa.FixedSizeListArray.from_arrays(array, width)
+                arrays[name] = array
+            else:
+                arrays[name] = pa.array(values)
+        return pa.table(arrays)
+
+    def write(self, columns):
+        table = self.table(columns)
+        if self.writer is None:
+            # the first chunk fixes the schema, later chunks are cast to it
+            self.schema = table.schema
+            if self.format == "parquet":
+                import pyarrow.parquet as pq
+                self.writer = pq.ParquetWriter(self.path, self.schema)
+            else:
+                self.writer = self.pa.ipc.new_file(self.path, self.schema)
+        self.writer.write_table(table.cast(self.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class IterationLogger:
+    '''
+    log iterations and episode configs in chunks from a background thread
+    '''
+
+    def __init__(self, path: str, format: str = None, chunk_size: int = 1000):
+        """
+        Parameters
+        ----------
+        path : str
+            file of the iteration log, the configs go to <name>_config.<ext>
+        format : str, optional
+            csv, parquet or arrow, by default from the extension of path and csv otherwise
+        chunk_size : int, optional
+            number of buffered rows handed over to the writer thread at once, by default 1000
+        """
+        stem, extension = os.path.splitext(path)
+        self.format = format or FORMATS.get(extension, "csv")
+        if self.format not in FORMATS.values():
+            raise ValueError(f"unknown log format: {self.format}, available formats: {', '.join(FORMATS.values())}")
+        if FORMATS.get(extension) != self.format:
+            stem, extension = (stem if extension in FORMATS else path), "." + self.format
+        self.paths = {"iterations": stem + extension, "config": stem + "_config" + extension}
+        if self.format != "csv":
+            _import_pyarrow(self.format)  # fail here rather than in the writer thread
+        os.makedirs(os.path.dirname(self.paths["iterations"]) or ".", exist_ok=True)
+        self.chunk_size = chunk_size
+        self.buffers = {"iterations": [], "config": []}
+        self.writers = {}
+        self.error = None
+        self.closed = False
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._write_chunks, name="IterationLogger", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def log_episode(self, episode: int, config: Dict, **keys):
+        '''
+        record the config of an episode, keys are extra columns identifying the episode
+        '''
+        row = dict(keys)
+        row["episode"] = episode
+        row.update((f"config_{k}", v) for k, v in config.items())
+        self._append("config", row)
+
+    def log(self, state: Dict, action: Dict, episode: int = 0, iteration: int = 1, **keys):
+        '''
+        record the state and action of an iteration, keys are extra columns identifying the episode
+        '''
+        row = dict(keys)
+        row["episode"] = episode
+        row["iteration"] = iteration
+        # lists are copied since the simulator may keep updating the ones it handed out
+        row.update((f"state_{k}", list(v) if type(v) == list else v) for k, v in state.items())
+        row.update((f"action_{k}", v) for k, v in action.items())
+        self._append("iterations", row)
+
+    def _append(self, table, row):
+        if self.error is not None:
+            raise self.error
+        buffer = self.buffers[table]
+        buffer.append(row)
+        if len(buffer) >= self.chunk_size:
+            self._hand_over(table)
+
+    def _hand_over(self, table):
+        if self.buffers[table]:
+            self.queue.put((table, self.buffers[table]))
+            self.buffers[table] = []
+
+    def _write_chunks(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                table, rows = item
+                if self.error is None:
+                    if table not in self.writers:
+                        path = self.paths[table]
+                        self.writers[table] = _CsvWriter(path) if self.format == "csv" else _ArrowWriter(path, self.format)
+                    self.writers[table].write(_columns(rows))
+            except Exception as err:
+                self.error = err
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        '''
+        write all buffered rows and wait for the writer thread
+        '''
+        for table in self.buffers:
+            self._hand_over(table)
+        self.queue.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.flush()
+        finally:
+            self.queue.put(None)
+            self.thread.join()
+            for writer in self.writers.values():
+                writer.close()
+            atexit.unregister(self.close)
@@ -3,23 +3,51 @@ Fixed policies to test our sim integration with. These are intended to take
 Brain states and return Brain actions.
 """
 
-import random
-from typing import Dict
+import inspect
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Dict, List, Optional, Sequence
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+# speed limits of the machines of the default line, repeated for longer lines like the defaults of the simulator
 machine_min_speed = [100, 30, 60, 40, 80, 80, 100, 30, 60, 40, 80, 80]
 machine_max_speed = [170, 190, 180, 180, 180, 300, 170, 190, 180, 180, 180, 300]
 no_machines = len(machine_min_speed)
+# generator of the stochastic policies when they are not given one, e.g. the policy_rng of the simulator, seeded so
+# that the runs calling them without a generator can be repeated too
+DEFAULT_SEED = 0
+default_rng = np.random.default_rng(DEFAULT_SEED)
+# inkling file of the brain, its graph input declares the state fields the exported brain takes
+INK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "multi_speed_12.ink")
+DEFAULT_BRAIN_URL = "http://localhost:5005"
+
+
+def number_of_machines(state):
+    '''
+    number of machines of the line the state comes from, the ones of the default line if the state does not tell
+    '''
+    if not state or 'machines_state' not in state:
+        return no_machines
+    return len(state['machines_state'])
+
+
+def speed_limit(limits, machine_index):
+    return limits[machine_index % len(limits)]
 
 
 def machine_speed_heuristic(dschrg_p1, dschrg_p2, infeed_m1, infeed_m2, machine_state, machine_index):
 
     if machine_state != -1 and dschrg_p1 == 0 and infeed_m1 == 0: # machine is running - neither of primary proxes are active
         if dschrg_p2  == 1 or infeed_m2 == 1: # either of secondary proxes are active
-            machine_new_speed = machine_max_speed[machine_index] * 0.8 # run the machine at 80% of max speed
+            machine_new_speed = speed_limit(machine_max_speed, machine_index) * 0.8 # run the machine at 80% of max speed
             return  machine_new_speed        
         elif dschrg_p2 == 0 and infeed_m2 == 0: # neither of secondary proxes are active
-            machine_new_speed = machine_max_speed[machine_index] # run the machine at max speed
+            machine_new_speed = speed_limit(machine_max_speed, machine_index) # run the machine at max speed
             return machine_new_speed
     elif machine_state == -1 : # machine is down
         return 0
@@ -29,6 +57,7 @@ def machine_speed_heuristic(dschrg_p1, dschrg_p2, infeed_m1, infeed_m2, machine_
 
 def heuristic_policy(state):
     action = {}
+    no_machines = number_of_machines(state)
     for machine_idx in range(no_machines):
         if machine_idx == 0: # first machine
             machine_speed = machine_speed_heuristic(state['conveyor_discharge_p1_prox_full'][machine_idx], state['conveyor_discharge_p2_prox_full'][machine_idx], 0, 0, state['machines_state'][machine_idx], machine_idx)
@@ -40,14 +69,30 @@ def heuristic_policy(state):
         action["m" + str(machine_idx)] = machine_speed
     return action
 
-def random_policy(state):
+def random_policy(state, rng=None):
     """
     Ignore the state, move randomly.
+    rng: numpy Generator the speeds are drawn from, by default default_rng
     """
-    action = {}
-    for i in range(no_machines):
-        action["m" + str(i)] = random.randint(machine_min_speed[i], machine_max_speed[i])
-    return action
+    rng = default_rng if rng is None else rng
+    machines = range(number_of_machines(state))
+    speeds = rng.integers([speed_limit(machine_min_speed, i) for i in machines],
+                          [speed_limit(machine_max_speed, i) for i in machines], endpoint=True)
+    return {"m" + str(i): int(speed) for i, speed in zip(machines, speeds)}
+
+
+def with_rng(policy, rng):
+    """
+    Policy drawing from rng, e.g. the policy_rng of the simulator, if it takes an rng argument, otherwise the policy
+    itself.
+    """
+    try:
+        parameters = inspect.signature(policy).parameters
+    except (TypeError, ValueError):  # builtins without a signature
+        return policy
+    if "rng" not in parameters:
+        return policy
+    return partial(policy, rng=rng)
 
 
 def max_policy(state):
@@ -55,8 +100,8 @@ def max_policy(state):
     Run each machine at its max speed.
     """
     action = {}
-    for i in range(no_machines):
-        action["m" + str(i)] = machine_max_speed[i]
+    for i in range(number_of_machines(state)):
+        action["m" + str(i)] = speed_limit(machine_max_speed, i)
     return action
 
 def max_bottleneck_policy(state):
@@ -64,19 +109,139 @@ def max_bottleneck_policy(state):
     Run all machines at max speed of bottleneck machine.
     """
     action = {}
-    bottleneck_speed = min(machine_max_speed)
+    no_machines = number_of_machines(state)
+    bottleneck_speed = min(speed_limit(machine_max_speed, i) for i in range(no_machines))
     action = {}
     for i in range(no_machines):
         action["m" + str(i)] = bottleneck_speed
     return action
 
 
+@lru_cache(maxsize=None)
+def brain_state_fields(ink_file: str = INK_FILE) -> tuple:
+    """
+    Names of the state fields the brain of an inkling file takes, the fields of the input type of its graph.
+    """
+    with open(ink_file) as file:
+        ink = file.read()
+    graph = re.search(r"^graph\s*\(\s*input\s*:\s*(\w+)\s*\)", ink, re.MULTILINE)
+    if graph is None:
+        raise ValueError(f"no graph in {ink_file}")
+    state_type = re.search(r"^type\s+%s\s*\{(.*?)^\}" % graph.group(1), ink, re.MULTILINE | re.DOTALL)
+    if state_type is None:
+        raise ValueError(f"no type {graph.group(1)} in {ink_file}")
+    return tuple(re.findall(r"^\s*(\w+)\s*:", state_type.group(1), re.MULTILINE))
+
+
+class BrainClient:
+    """
+    Client of the prediction endpoint of an exported brain. The connections to the brain are kept open and reused
+    from one prediction to the next, and only the state fields the brain takes are sent.
+    exported_brain_url: url of the exported brain
+    fields: names of the state fields sent to the brain, all the fields if None, by default the ones of
+        brain_state_fields
+    timeout: seconds to wait for the connection and for the prediction, one number or a (connect, read) tuple
+    retries: number of times a request is retried after a connection error or a 502, 503 or 504 response
+    backoff: backoff factor of the retries, the nth retry waits backoff * 2 ** (n - 1) seconds
+    batch_path: path of an endpoint predicting a list of states at once, if the brain serves one. Otherwise
+        predict_many sends the states in concurrent requests
+    pool_size: number of connections kept open, and of the concurrent requests of predict_many
+    """
+
+    def __init__(self, exported_brain_url: str = DEFAULT_BRAIN_URL, fields: Optional[Sequence[str]] = (),
+                 timeout=(3.05, 30), retries: int = 2, backoff: float = 0.1, batch_path: str = None,
+                 pool_size: int = 8):
+        self.url = exported_brain_url.rstrip("/")
+        self.prediction_url = f"{self.url}/v1/prediction"
+        self.batch_url = f"{self.url}/{batch_path.lstrip('/')}" if batch_path else None
+        self.fields = brain_state_fields() if fields == () else fields
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff,
+                      status_forcelist=(502, 503, 504), allowed_methods=None, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = None
+
+    def brain_state(self, state: Dict) -> Dict:
+        """
+        Fields of the state the brain takes, as json values.
+        """
+        names = state if self.fields is None else self.fields
+        return {name: state[name].tolist() if isinstance(state[name], (np.ndarray, np.generic)) else state[name]
+                for name in names}
+
+    def predict(self, state: Dict) -> Dict:
+        """
+        Action of the brain for the state.
+        """
+        response = self.session.get(self.prediction_url, json=self.brain_state(state), timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    __call__ = predict
+
+    def predict_many(self, states: Sequence[Dict]) -> List[Dict]:
+        """
+        Actions of the brain for many states, e.g. the states of the episodes of a VectorDES, in one request to the
+        batch endpoint if there is one, otherwise in concurrent requests over the open connections.
+        """
+        if self.batch_url is not None:
+            response = self.session.post(self.batch_url, json=[self.brain_state(state) for state in states],
+                                         timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        if len(states) <= 1 or self.pool_size <= 1:
+            return [self.predict(state) for state in states]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.pool_size, thread_name_prefix="brain")
+        return list(self._executor.map(self.predict, states))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# clients of brain_policy by process and url, connections are not shared with forked processes
+_brain_clients = {}
+
+
+def brain_client(exported_brain_url: str = DEFAULT_BRAIN_URL) -> BrainClient:
+    """
+    Client of the exported brain shared by the brain policies of the process.
+    """
+    key = (os.getpid(), exported_brain_url)
+    if key not in _brain_clients:
+        _brain_clients[key] = BrainClient(exported_brain_url)
+    return _brain_clients[key]
+
+
 def brain_policy(
     state: Dict[str, float],
-    exported_brain_url: str = "http://localhost:5005"
+    exported_brain_url: str = DEFAULT_BRAIN_URL
 ):
+    """
+    Action of the exported brain at exported_brain_url, see BrainClient.
+    """
+    return brain_client(exported_brain_url).predict(state)
 
-    prediction_endpoint = f"{exported_brain_url}/v1/prediction"
-    response = requests.get(prediction_endpoint, json=state)
 
-    return response.json()
+def predict_batch(policy, states: Sequence[Dict]) -> List[Dict]:
+    """
+    Actions of the policy for many states, predicted together by the exported brain of a brain_policy.
+    """
+    if isinstance(policy, partial) and policy.func is brain_policy and not policy.args:
+        return brain_client(**policy.keywords).predict_many(states)
+    if isinstance(policy, BrainClient):
+        return policy.predict_many(states)
+    return [policy(state) for state in states]
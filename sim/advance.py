@@ -0,0 +1,97 @@
+'''
+Conditions that DES.advance runs the events of an episode until, and the result of an advance.
+
+A condition is a function of the simulator, called once when the advance starts, that returns a predicate without
+arguments; the predicate is checked after each event and the advance stops as soon as it holds. Taking the simulator
+first lets a condition remember where the episode stood when the advance started, e.g. the number of downtime events:
+
+    des.advance(machine_down('m3'), horizon=600)
+    des.advance(lambda des: lambda: des.sinks_throughput_abs > 1000)
+
+Conditions can be combined with any_of.
+
+The analytic engine of DES jumps over quiet simulation time steps, see DES.quiet_ticks. The conditions below are marked
+with event_driven: they can only start to hold at a downtime event or a prox crossing, which the jumps never go past, so
+they stop the analytic engine where they stop the other engines. While any other condition is checked, DES.advance turns
+the jumps off.
+'''
+from dataclasses import dataclass
+
+from .line_kernel import DOWN
+
+# reasons an advance stops for: the default control event of the control type, the condition of the caller, the time
+# horizon, the limit on the number of events, no event left
+CONTROL, CONDITION, HORIZON, MAX_EVENTS, EXHAUSTED = 'control', 'condition', 'horizon', 'max_events', 'exhausted'
+
+
+@dataclass
+class AdvanceResult:
+    '''
+    reason: why the advance stopped, see the reasons above
+    time: simulation time the advance stopped at
+    elapsed: simulation time advanced
+    events: number of events processed
+    wall_time: wall clock seconds spent in the advance
+    '''
+    reason: str
+    time: float
+    elapsed: float
+    events: int
+    wall_time: float
+
+
+def event_driven(condition):
+    '''
+    mark a condition that can only start to hold at a downtime event or a prox crossing
+    '''
+    condition.event_driven = True
+    return condition
+
+
+@event_driven
+def any_downtime(simulator):
+    '''
+    a machine goes down
+    '''
+    count = simulator.downtime_count
+    return lambda: simulator.downtime_count > count
+
+
+def machine_down(machine):
+    '''
+    the given machine, by name or index, goes down
+    '''
+    def condition(simulator):
+        index = simulator.machine_index[machine] if isinstance(machine, str) else machine
+        count = simulator.downtime_count
+        return lambda: simulator.downtime_count > count and simulator.down_machine_no == index
+    return event_driven(condition)
+
+
+def machines_down(number):
+    '''
+    at least the given number of machines are down at once
+    '''
+    def condition(simulator):
+        return lambda: int((simulator.machine_states == DOWN).sum()) >= number
+    return event_driven(condition)
+
+
+@event_driven
+def prox_change(simulator):
+    '''
+    any infeed or discharge prox of any conveyor changes status, see DES.prox_states
+    '''
+    initial = simulator.prox_states()
+    return lambda: (simulator.prox_states() != initial).any()
+
+
+def any_of(*conditions):
+    '''
+    any of the conditions holds
+    '''
+    def condition(simulator):
+        predicates = [condition(simulator) for condition in conditions]
+        return lambda: any(predicate() for predicate in predicates)
+    condition.event_driven = all(getattr(member, 'event_driven', False) for member in conditions)
+    return condition
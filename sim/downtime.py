@@ -0,0 +1,203 @@
+'''
+Downtime schedule of an episode, sampled ahead of the simulation.
+
+Machines only go down and come back through the downtime events, whatever the speeds and states of the line, so the
+timeline of the downtime events only depends on the downtime parameters of the config and on the random generator of
+the episode. DowntimeSchedule samples it into arrays of start time, machine and duration, which the simulator consumes
+as a sorted list of events.
+
+Each of the number_parallel_downtime_events slots waits interval_first_down_event, takes a machine down for a duration
+drawn uniformly around its downtime_event_duration_mean, waits an interval drawn uniformly around
+interval_downtime_event_mean once the machine is back, takes a machine down again, and so on. The machine is drawn among
+the machines that are not down with a probability proportional to downtime_prob, from an alias table over all the
+machines and rejecting the ones that are down, or it is the down_machine_index-th machine that is not down. A slot stops
+once no machine can go down anymore. Simultaneous events happen in the order they were scheduled in, like simpy events.
+Each slot is run by its own process of the simulator, which follows the events of its slot with slot_event and ends at
+the stop time of its slot, so that the downtime events interleave with the other events of the simulator like the
+timeouts of one simpy process per slot.
+
+Random draws are made in blocks and the timeline is sampled in chunks of simulation time as the simulation goes, the
+events do not depend on the block or chunk sizes.
+'''
+import heapq
+
+import numpy as np
+
+# kinds of events: a machine goes down, a machine comes back
+START, END = 0, 1
+# random draws made at once
+BLOCK = 256
+
+
+class AliasTable:
+    '''
+    Walker's alias table: draws from a discrete distribution in constant time, whatever the number of outcomes
+    weights: non-negative weights of the outcomes, with a positive sum
+    '''
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=float)
+        if weights.ndim != 1 or not len(weights) or (weights < 0).any() or weights.sum() <= 0:
+            raise ValueError(f'weights should be non-negative with a positive sum, got {weights.tolist()}')
+        num_outcomes = len(weights)
+        scaled = weights * num_outcomes / weights.sum()
+        self.probability = np.ones(num_outcomes)
+        self.alias = np.arange(num_outcomes)
+        small = [ind for ind in range(num_outcomes) if scaled[ind] < 1]
+        large = [ind for ind in range(num_outcomes) if scaled[ind] >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            # column less keeps its own outcome with probability scaled[less] and gives the rest to outcome more
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1 - scaled[less]
+            (small if scaled[more] < 1 else large).append(more)
+        # the columns left over are full, up to rounding errors
+
+    def sample(self, rng, size):
+        '''
+        size draws from the distribution
+        '''
+        columns = rng.integers(0, len(self.probability), size=size)
+        return np.where(rng.random(size) < self.probability[columns], columns, self.alias[columns])
+
+
+class _Draws:
+    '''
+    stream of draws made in blocks, consumed one at a time in order
+    '''
+    def __init__(self, draw):
+        self.draw = draw
+        self.values = ()
+        self.position = 0
+
+    def next(self):
+        if self.position == len(self.values):
+            self.values = self.draw(BLOCK).tolist()
+            self.position = 0
+        self.position += 1
+        return self.values[self.position - 1]
+
+
+class DowntimeSchedule:
+    '''
+    downtime events of an episode, see the module docstring
+    config: SimConfig of the episode sized to the machines of the line
+    rng: numpy Generator of the downtime events of the episode
+    chunk: simulation time sampled at once
+    times, kinds, machines, durations, slots: the events sampled so far in the order they happen, durations are 0 for
+        END events
+    slot_events: indices of the events of each slot
+    stop_times: time each slot stopped at, None while it runs
+    '''
+    def __init__(self, config, rng, chunk=1000):
+        self.rng = rng
+        self.chunk = chunk
+        self.down_machine_index = config.down_machine_index
+        num_machines = len(config.downtime_prob)
+        self.down = np.zeros(num_machines, dtype=bool)
+        self.weights = np.asarray(config.downtime_prob, dtype=float)
+        self.alias = AliasTable(self.weights) if config.down_machine_index == -1 and self.weights.sum() > 0 else None
+        self.interval_low = config.interval_downtime_event_mean - config.interval_downtime_event_dev
+        self.interval_span = 2 * config.interval_downtime_event_dev + 1
+        self.duration_low = [mean - dev for mean, dev in zip(config.downtime_event_duration_mean,
+                                                               config.downtime_event_duration_dev)]
+        self.duration_span = [2 * dev + 1 for dev in config.downtime_event_duration_dev]
+        # bound methods rather than lambdas, so that a schedule can be pickled with a snapshot
+        self._machine_draws = _Draws(self._sample_machines)
+        self._uniform_draws = _Draws(self._sample_uniform)
+
+        self.times, self.kinds, self.machines, self.durations, self.slots = [], [], [], [], []
+        # pending event of each slot as (time, scheduling order, slot, kind, machine), the heap orders them like simpy
+        self._scheduled = 0
+        self._pending = []
+        self.slot_events = [[] for _ in range(config.number_parallel_downtime_events)]
+        self.stop_times = [None] * config.number_parallel_downtime_events
+        for slot in range(config.number_parallel_downtime_events):
+            self._push(config.interval_first_down_event, slot, START, -1)
+        self.horizon = 0
+
+    def _sample_machines(self, size):
+        return self.alias.sample(self.rng, size)
+
+    def _sample_uniform(self, size):
+        return self.rng.random(size)
+
+    def _push(self, time, slot, kind, machine):
+        heapq.heappush(self._pending, (time, self._scheduled, slot, kind, machine))
+        self._scheduled += 1
+
+    def _draw_machine(self):
+        '''
+        machine to take down, None if no machine can go down
+        '''
+        up = ~self.down
+        if self.down_machine_index != -1:
+            return int(np.flatnonzero(up)[self.down_machine_index]) if up.any() else None
+        if self.alias is None or self.weights[up].sum() <= 0:
+            return None
+        while True:
+            machine = self._machine_draws.next()
+            if up[machine]:
+                return machine
+
+    def _uniform_integer(self, low, span):
+        return low + int(self._uniform_draws.next() * span)
+
+    def extend(self, until):
+        '''
+        sample the events up to simulation time until, counted from the start of the episode
+        '''
+        while self._pending and self._pending[0][0] <= until:
+            time, _, slot, kind, machine = heapq.heappop(self._pending)
+            if kind == START:
+                machine = self._draw_machine()
+                if machine is None:
+                    # the slot stops, like a downtime process that finds all the machines down
+                    self.stop_times[slot] = time
+                    continue
+                duration = self._uniform_integer(self.duration_low[machine], self.duration_span[machine])
+                self.down[machine] = True
+                self._push(time + duration, slot, END, machine)
+            else:
+                duration = 0
+                self.down[machine] = False
+                self._push(time + self._uniform_integer(self.interval_low, self.interval_span), slot, START, -1)
+            self.times.append(time)
+            self.kinds.append(kind)
+            self.machines.append(machine)
+            self.durations.append(duration)
+            self.slots.append(slot)
+            self.slot_events[slot].append(len(self.times) - 1)
+        self.horizon = max(self.horizon, until)
+
+    def event(self, index):
+        '''
+        (time, kind, machine, duration) of the index-th event, sampling the timeline further as needed, None if the
+        timeline has fewer events, i.e. every slot stopped
+        '''
+        while index >= len(self.times) and self._pending:
+            self.extend(self.horizon + self.chunk)
+        if index >= len(self.times):
+            return None
+        return self.times[index], self.kinds[index], self.machines[index], self.durations[index]
+
+    def slot_event(self, slot, count):
+        '''
+        index of the count-th event of a slot, sampling the timeline further as needed, None if the slot stopped before,
+        see stop_times
+        '''
+        events = self.slot_events[slot]
+        while count >= len(events) and self.stop_times[slot] is None:
+            self.extend(self.horizon + self.chunk)
+        return events[count] if count < len(events) else None
+
+    def starts(self):
+        '''
+        arrays of the start time, machine, duration and slot of the downtime events sampled so far
+        '''
+        kinds = np.asarray(self.kinds, dtype=int)
+        return {name: np.asarray(values)[kinds == START] for name, values in
+                (('time', self.times), ('machine', self.machines), ('duration', self.durations), ('slot', self.slots))}
+
+    def __len__(self):
+        return len(self.times)
@@ -10,19 +10,33 @@ source -> m0 ---c0--- m1 ---c1--- m2 ---c2--- m3 ---c3--- m4 ---c4--- m5 ---sink
 # there are K machines and K-1 conveyors
 # all machines should be listed as adj dictionary keys 
 # all conveyors should be listed as adj_conv dictionary keys
+# parallel lines, with several sources and sinks and junctions between their conveyors, are described in
+# tests/line_config.py
+
+def serial_line(K):
+    '''
+    adjacency of a serial line of K machines, i.e. source -> m0 -- c0 -- m1 ... m(K-1) -> sink
+    '''
+    adj = {}
+    adj_conv = {}
+    for i in range(K):
+        if i == 0:
+            adj['m' + str(i)] = ('source', 'c' + str(i))
+            adj_conv['c' + str(i)] = ('m' + str(i), 'm' + str(i+1))
+        elif i == K-1:
+            adj['m' + str(i)] = ('c' + str(i-1), 'sink')
+        else:
+            adj['m' + str(i)] = ('c' + str(i-1), 'c' + str(i))
+            adj_conv['c' + str(i)] = ('m' + str(i), 'm' + str(i+1))
+    return adj, adj_conv
+
 
-adj = {}
-adj_conv = {}
 K = 12
-for i in range(K):
-    if i == 0:
-        adj['m' + str(i)] = ('source', 'c' + str(i))
-        adj_conv['c' + str(i)] = ('m' + str(i), 'm' + str(i+1))
-    elif i == K-1:
-        adj['m' + str(i)] = ('c' + str(i-1), 'sink')
-    else:
-        adj['m' + str(i)] = ('c' + str(i-1), 'c' + str(i))
-        adj_conv['c' + str(i)] = ('m' + str(i), 'm' + str(i+1))
+adj, adj_conv = serial_line(K)
+
+# junctions between the conveyors of parallel lines, see sim/topology.py
+con_balance = [] # (conveyor, conveyor, bin): balancing load between two conveyors, bin indicates where products are added
+con_join = [] # (conveyor, conveyor, bin): adding the load from the last bin of the first conveyor on to the second conveyor at bin
 
 
 def plot():
@@ -0,0 +1,345 @@
+'''
+Vectorized update of the manufacturing line.
+
+The LineKernel performs the same tick as DES.update_line, i.e. conveyor levels, startup phase, actual machine speeds,
+accumulation of the conveyor bins, PLC rules, sink accumulation and downtime estimation, but as whole-array operations
+on the machine speed, state code, idle counter and bin level arrays instead of Python loops over the machines and
+conveyors. It is used when DES is reset with the "vectorized" engine, where it gives the same trajectories as the default
+"loop" engine, and by VectorDES to update many episodes at once. A tick of the 12 machines of the default line is much
+cheaper than with the loop engine, but end to end the events and the states around it weigh as much. The target of 10x
+the simulated seconds per wall second of the loop engine is only met on long lines: at 12 machines the vectorized engine
+is 1.5x faster with control type 0 and no faster with control type 1, at 500 machines 5.5x and 19.5x, see
+benchmark.py --line-lengths 12 500 --engines loop vectorized, which reports the speedup of every case.
+
+Between the state changes of the machines, the conveyor levels change linearly. quiet_ticks finds in closed form how many
+simulation time steps pass before the next state change, e.g. a prox crossing or the end of a startup phase, and advance
+applies these time steps at once. This is what the "analytic" engine of DES uses to skip the quiet time steps. It is not
+an event-driven engine: it still ticks the line at every time step where something changes, and any prox of any conveyor
+crossing its threshold is such a change. On the default line the proxes flip every few time steps, so an episode is not
+a handful of jumps: with the episodes of assessments/three_random_machine_down.json and control type 1, the jumps are
+about 6 time steps long, 3 to 27% of the line updates are saved and the engine runs about as fast as the vectorized one.
+Looking for quiet time steps costs about one and a half vectorized time steps, so it is worth it when the quiet stretches
+are several time steps long, see DES.quiet_ticks.
+
+All the line arrays have a leading episode axis, e.g. the machine speeds are (episodes, machines) and the bin levels are
+(episodes, conveyors, bins). DES passes views with a single episode.
+
+The kernel is driven by the index arrays of a LineTopology, so lines with several sources and sinks and junctions
+between parallel lines are updated the same way as a serial line. Products crossing a junction do not change linearly,
+so quiet_ticks does not jump over any time step of a line with junctions.
+'''
+import numpy as np
+
+# machine state codes, see MACHINE_STATE_CODES in manufacturing_env
+DOWN, IDLE, ACTIVE, STARTUP = -1, 0, 1, 2
+
+
+def _last_tick(start, slope, threshold, strict, first):
+    '''
+    last time step n such that start + j * slope <= threshold (< threshold if strict) for all the time steps j from first
+    to n, first - 1 if the condition does not hold at the first time step and inf if it holds for all the time steps
+    '''
+    value = start + first * slope
+    holds = value < threshold if strict else value <= threshold
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bound = (threshold - start) / slope
+        last = np.ceil(bound) - 1 if strict else np.floor(bound)
+    return np.where(holds, np.where(slope > 0, last, np.inf), first - 1)
+
+
+def _prox_level(offset, limit, capacity, empty):
+    '''
+    conveyor level at or below which a prox gets empty if empty, else at or above which it gets full, for a prox over
+    the bin with the given offset whose level is compared to limit, see DES.prox_states
+    '''
+    if empty:
+        return np.where(limit >= capacity, np.inf, np.where(limit < 0, -np.inf, offset + limit))
+    return np.where(limit <= 0, -np.inf, np.where(limit > capacity, np.inf, offset + limit))
+
+
+def _keeps_status(levels, delta, threshold, empty):
+    '''
+    last time step n such that a prox keeps its status for all the time steps from 1 to n, see _prox_level
+    '''
+    if empty:
+        return np.where(levels <= threshold, _last_tick(levels, delta, threshold, False, 1),
+                        _last_tick(-levels, -delta, -threshold, True, 1))
+    return np.where(levels >= threshold, _last_tick(-levels, -delta, -threshold, False, 1),
+                    _last_tick(levels, delta, threshold, True, 1))
+
+
+class LineKernel:
+    '''
+    whole-line update compiled once from the line topology and the parameters of each episode
+    topology: LineTopology of the line
+    parameters: one object per episode with the simulation parameters as attributes, e.g. a DES instance
+    '''
+    def __init__(self, topology, parameters):
+        self.topology = topology
+        num_machines = len(topology.machines)
+        # infeed/discharge conveyor of each machine, -1 refers to a source/sink
+        self.infeed_conveyor = topology.infeed_conveyor
+        self.discharge_conveyor = topology.discharge_conveyor
+        # machines before/after each conveyor, -1 refers to a junction, i.e. no machine
+        self.upstream_machine = topology.upstream_machine
+        self.downstream_machine = topology.downstream_machine
+        # machines that discharge into a sink and the sink they discharge into
+        self.sink_feeders = topology.sink_feeders
+        self.sink_machines = topology.sink_machines
+
+        num_bins = {p.num_conveyor_bins for p in parameters}
+        if len(num_bins) != 1:
+            raise ValueError(f'all the episodes should have the same number of conveyor bins, got {sorted(num_bins)}')
+        num_bins = num_bins.pop()
+        topology.check_bins(num_bins)
+        self.num_bins = num_bins
+
+        def column(name, shape=(-1, 1)):
+            return np.array([getattr(p, name) for p in parameters]).reshape(shape)
+
+        def per_machine(name):
+            return np.array([list(getattr(p, name))[:num_machines] for p in parameters], dtype=float)
+
+        # per episode parameters, shaped to broadcast against the (episodes, machines/conveyors) arrays
+        self.simulation_time_step = column('simulation_time_step')
+        self.conveyor_capacity = column('conveyor_capacity')
+        self.infeed_prox_lower_limit = column('infeed_prox_lower_limit')
+        self.discharge_prox_lower_limit = column('discharge_prox_lower_limit')
+        self.infeed_prox_upper_limit = column('infeed_prox_upper_limit')
+        self.discharge_prox_upper_limit = column('discharge_prox_upper_limit')
+        self.idletime_duration = per_machine('idletime_duration')
+        self.mean_downtime_duration = per_machine('downtime_event_duration_mean')
+        self.max_downtime_duration = self.mean_downtime_duration + per_machine('downtime_event_duration_dev')
+
+        self.bins_capacity = (self.conveyor_capacity / num_bins).reshape(-1, 1, 1)
+        # products that fit in the bins to the right of each bin, the conveyor is filled from right to left
+        self.bins_offset = self.bins_capacity * np.arange(num_bins-1, -1, -1)
+        # bins where the primary infeed and discharge proxes are located
+        self.infeed_bin = num_bins - column('infeedProx_index1', (-1, 1, 1))
+        self.discharge_bin = column('dischargeProx_index1', (-1, 1, 1))
+        # products that can cross a junction in one simulation time step, per episode
+        self.junction_rate = (column('conveyor_general_speed') * self.simulation_time_step)[:, 0]
+
+        # constants of quiet_ticks: the infeed and discharge conveyor of each machine with the sources and sinks pointing
+        # to the first conveyor, and the conveyor levels at which the primary and secondary infeed proxes get empty and
+        # the primary and secondary discharge proxes get full
+        self.has_infeed = self.infeed_conveyor >= 0
+        self.has_discharge = self.discharge_conveyor >= 0
+        self.infeed_or_first = np.where(self.has_infeed, self.infeed_conveyor, 0)
+        self.discharge_or_first = np.where(self.has_discharge, self.discharge_conveyor, 0)
+        bins_capacity = self.bins_capacity[..., 0]
+
+        def bin_offset(bins):
+            return np.take_along_axis(self.bins_offset, bins, axis=-1)[..., 0]
+
+        self.infeed_empty_level = _prox_level(bin_offset(self.infeed_bin), self.infeed_prox_lower_limit,
+                                              bins_capacity, True)
+        self.discharge_full_level = _prox_level(bin_offset(self.discharge_bin), self.discharge_prox_lower_limit,
+                                                bins_capacity, False)
+        self.infeed2_empty_level = _prox_level(bin_offset(num_bins - column('infeedProx_index2', (-1, 1, 1))),
+                                               self.infeed_prox_upper_limit, bins_capacity, True)
+        self.discharge2_full_level = _prox_level(bin_offset(column('dischargeProx_index2', (-1, 1, 1))),
+                                                 self.discharge_prox_upper_limit, bins_capacity, False)
+
+    def select(self, episodes):
+        '''
+        kernel restricted to a subset of the episodes
+        '''
+        kernel = object.__new__(LineKernel)
+        kernel.__dict__.update(self.__dict__)
+        for name in ('simulation_time_step', 'conveyor_capacity', 'infeed_prox_lower_limit', 'discharge_prox_lower_limit',
+                     'infeed_prox_upper_limit', 'discharge_prox_upper_limit', 'idletime_duration',
+                     'mean_downtime_duration', 'max_downtime_duration', 'bins_capacity', 'bins_offset', 'infeed_bin',
+                     'discharge_bin', 'junction_rate', 'infeed_empty_level', 'discharge_full_level',
+                     'infeed2_empty_level', 'discharge2_full_level'):
+            setattr(kernel, name, getattr(self, name)[episodes])
+        return kernel
+
+    def update_line(self, line, initial=False):
+        '''
+        update the status of the machines and conveyors of the line for one simulation time step
+        line: object holding the line arrays, i.e. bin_levels, machine_speeds, machine_states, machine_target_speeds,
+            machine_idle_counters, machine_counter, down_cnt, mean_downtime_offset and max_downtime_offset
+        initial: the update done at reset, i.e. without the startup phase and the sink accumulation
+        returns the conveyor levels at the beginning of the step, the actual machine speeds and the products added to
+        each sink feeder
+        '''
+        dt = self.simulation_time_step
+        states = line.machine_states
+        speeds = line.machine_speeds
+        target_speeds = line.machine_target_speeds
+
+        # determine the number of products that exist on the conveyor
+        levels = line.bin_levels.sum(axis=-1)
+
+        if not initial:
+            # determine whether the machine has finished its startup phase or not
+            counters = line.machine_idle_counters
+            startup = states == STARTUP
+            finished = startup & (counters >= self.idletime_duration)
+            in_startup = startup & ~finished
+            counters += np.where(in_startup, dt, 0)
+            line.machine_counter[...] = np.where(finished, dt, counters)
+            states[...] = np.where(finished, ACTIVE, states)
+            speeds[...] = np.where(finished & (target_speeds > 0), target_speeds, np.where(in_startup, 0, speeds))
+
+        # determine the actual speed of the machines based on product availability and conveyor remaining empty capacity
+        # the source has infinite products and the sink has infinite capacity
+        unlimited = np.full(levels.shape[:-1] + (1,), np.inf)
+        available = np.concatenate((levels, unlimited), axis=-1)[..., self.infeed_conveyor]
+        room = np.concatenate((self.conveyor_capacity - levels, unlimited), axis=-1)[..., self.discharge_conveyor]
+        active = states == ACTIVE
+        actual_speeds = np.where(active, np.minimum(target_speeds, np.minimum(available, room)), 0)
+        # a running machine keeps its previous speed if it is asked to run at zero speed
+        speeds[...] = np.where(active & (actual_speeds > 0), actual_speeds, np.where(active, speeds, 0))
+
+        # accumulate the conveyors from right to left
+        if self.topology.junctions:
+            # conveyors next to a junction may have no machine before or after them, i.e. the index -1 of a zero speed
+            flows = np.concatenate((speeds, np.zeros(speeds.shape[:-1] + (1,))), axis=-1)
+        else:
+            flows = speeds
+        delta = flows[..., self.upstream_machine] * dt - flows[..., self.downstream_machine] * dt
+        new_levels = np.maximum(levels + delta, 0)
+        if self.topology.junctions:
+            self.topology.transfer(new_levels, self.bins_capacity[..., 0, 0], self.num_bins, self.junction_rate)
+        np.clip(new_levels[..., None] - self.bins_offset, 0, self.bins_capacity, out=line.bin_levels)
+
+        # PLC rules: machine goes idle if the primary infeed prox is empty or the primary discharge prox is full
+        infeed_level = np.take_along_axis(line.bin_levels, self.infeed_bin, axis=-1)[..., 0]
+        discharge_level = np.take_along_axis(line.bin_levels, self.discharge_bin, axis=-1)[..., 0]
+        infeed_level = np.concatenate((infeed_level, unlimited), axis=-1)[..., self.infeed_conveyor]
+        discharge_level = np.concatenate((discharge_level, -unlimited), axis=-1)[..., self.discharge_conveyor]
+        blocked = (infeed_level <= self.infeed_prox_lower_limit) | (discharge_level >= self.discharge_prox_lower_limit)
+        stopped = (states == DOWN) | (states == STARTUP)
+        to_idle = (states == ACTIVE) & blocked
+        to_startup = (states == IDLE) & ~blocked
+        states[...] = np.where(to_idle, IDLE, np.where(to_startup, STARTUP, states))
+        speeds[...] = np.where(stopped | to_idle | to_startup, 0, speeds)
+        actual_speeds = np.where(stopped, 0, actual_speeds)
+
+        # products accumulated in the sinks according to the speed of the machines connected to them
+        sink_delta = speeds[..., self.sink_machines] * dt
+
+        # estimate the down time duration for the machines that are down
+        down = states == DOWN
+        line.mean_downtime_offset[...] = np.where(down, self.mean_downtime_duration - line.down_cnt, 0)
+        line.max_downtime_offset[...] = np.where(down, self.max_downtime_duration - line.down_cnt, 0)
+        line.down_cnt[...] = np.where(down, line.down_cnt + 1, 0)
+
+        return levels, actual_speeds, sink_delta
+
+    def _linear_speeds(self, line, levels):
+        '''
+        speed of the machines while the line evolves linearly from the given conveyor levels, i.e. the speed of the
+        next time step, and the actual speed of the running machines
+        '''
+        active = line.machine_states == ACTIVE
+        unlimited = np.full(levels.shape[:-1] + (1,), np.inf)
+        available = np.concatenate((levels, unlimited), axis=-1)[..., self.infeed_conveyor]
+        room = np.concatenate((self.conveyor_capacity - levels, unlimited), axis=-1)[..., self.discharge_conveyor]
+        actual_speeds = np.minimum(line.machine_target_speeds, np.minimum(available, room))
+        speeds = np.where(active & (actual_speeds > 0), actual_speeds, np.where(active, line.machine_speeds, 0))
+        return speeds, actual_speeds, available, room
+
+    def quiet_ticks(self, line, max_ticks):
+        '''
+        number of the next simulation time steps of each episode where no machine changes state or speed, i.e. no
+        startup phase ends, no prox is crossed, no conveyor gets empty or overflows and the conveyors that limit the
+        speed of the machines keep their level
+        the conveyor levels then change linearly and the time steps can be applied at once with advance
+        max_ticks: maximum number of time steps of each episode, e.g. up to the next scheduled event
+        '''
+        if self.topology.junctions:
+            return np.zeros(np.size(max_ticks), dtype=int)
+        dt = self.simulation_time_step
+        states = line.machine_states
+        target_speeds = line.machine_target_speeds
+        active = states == ACTIVE
+        levels = line.bin_levels.sum(axis=-1)
+        speeds, actual_speeds, available, room = self._linear_speeds(line, levels)
+        delta = speeds[..., self.upstream_machine] * dt - speeds[..., self.downstream_machine] * dt
+        ticks = np.array(max_ticks, dtype=float).reshape(-1)
+
+        def bound(mask, last):
+            return np.where(mask, last, np.inf).min(axis=-1)
+
+        # startup phases end once the idle counter reaches the idle time duration. this is the cheapest bound and the one
+        # that most often leaves no quiet time step, while the machines keep going idle and starting up
+        startup = states == STARTUP
+        ticks = np.minimum(ticks, bound(startup, np.ceil((self.idletime_duration - line.machine_idle_counters) / dt)))
+        if (ticks <= 0).all():
+            return np.zeros(ticks.shape, dtype=int)
+
+        # conveyors neither get empty nor overflow
+        ticks = np.minimum(ticks, bound(True, _last_tick(-levels, -delta, 0, False, 1)))
+        ticks = np.minimum(ticks, bound(True, _last_tick(levels, delta, self.conveyor_capacity, False, 1)))
+
+        # levels of the infeed and discharge conveyors of each machine, the source and the sink are never limiting
+        has_infeed, has_discharge = self.has_infeed, self.has_discharge
+        infeed, discharge = self.infeed_or_first, self.discharge_or_first
+        infeed_level, infeed_delta = levels[..., infeed], delta[..., infeed]
+        discharge_level, discharge_delta = levels[..., discharge], delta[..., discharge]
+
+        # running machines keep their speed: the products available and the room left at the start of each step do not
+        # fall below it, and a conveyor that limits it keeps its level
+        running = active & (target_speeds > 0)
+        ticks = np.minimum(ticks, bound(running & has_infeed,
+                                        _last_tick(-infeed_level, -infeed_delta, -actual_speeds, False, 0) + 1))
+        ticks = np.minimum(ticks, bound(running & has_discharge,
+                                        _last_tick(discharge_level, discharge_delta, self.conveyor_capacity - actual_speeds, False, 0) + 1))
+        limited = running & (actual_speeds < target_speeds)
+        ticks = np.minimum(ticks, bound(limited & has_infeed & (available == actual_speeds) & (infeed_delta != 0), 1))
+        ticks = np.minimum(ticks, bound(limited & has_discharge & (room == actual_speeds) & (discharge_delta != 0), 1))
+
+        # no prox of any conveyor changes status: the PLC rules, which read the primary proxes, keep the active machines
+        # unblocked and the idle machines blocked, and the secondary proxes of the states stay as they are
+        for threshold in (self.infeed_empty_level, self.infeed2_empty_level):
+            ticks = np.minimum(ticks, bound(True, _keeps_status(levels, delta, threshold, True)))
+        for threshold in (self.discharge_full_level, self.discharge2_full_level):
+            ticks = np.minimum(ticks, bound(True, _keeps_status(levels, delta, threshold, False)))
+
+        return np.maximum(ticks, 0).astype(int)
+
+    def advance(self, line, ticks):
+        '''
+        apply the given number of quiet simulation time steps of each episode at once, see quiet_ticks
+        returns the conveyor levels at the beginning of the last step, the actual machine speeds and the products added
+        to each sink feeder, like update_line
+        '''
+        dt = self.simulation_time_step
+        ticks = np.asarray(ticks).reshape(-1, 1)
+        moved = ticks > 0
+        states = line.machine_states
+        active = states == ACTIVE
+        levels = line.bin_levels.sum(axis=-1)
+
+        # startup phases go on
+        startup = states == STARTUP
+        line.machine_idle_counters[...] += np.where(startup, ticks * dt, 0)
+        line.machine_counter[...] = np.where(moved, line.machine_idle_counters, line.machine_counter)
+
+        # the conveyor levels change linearly at the speed of the machines
+        speeds, _, _, _ = self._linear_speeds(line, levels)
+        line.machine_speeds[...] = np.where(moved, speeds, line.machine_speeds)
+        delta = speeds[..., self.upstream_machine] * dt - speeds[..., self.downstream_machine] * dt
+        levels_before = levels + (ticks - 1) * delta
+        new_levels = levels + ticks * delta
+        bin_levels = np.clip(new_levels[..., None] - self.bins_offset, 0, self.bins_capacity)
+        line.bin_levels[...] = np.where(moved[..., None], bin_levels, line.bin_levels)
+        _, actual_speeds, _, _ = self._linear_speeds(line, levels_before)
+        actual_speeds = np.where(active, actual_speeds, 0)
+
+        # products accumulated in the sinks
+        sink_delta = ticks * (speeds[..., self.sink_machines] * dt)
+
+        # downtime estimation of the machines that are down
+        down = states == DOWN
+        last_count = line.down_cnt + ticks - 1
+        line.mean_downtime_offset[...] = np.where(moved, np.where(down, self.mean_downtime_duration - last_count, 0),
+                                                  line.mean_downtime_offset)
+        line.max_downtime_offset[...] = np.where(moved, np.where(down, self.max_downtime_duration - last_count, 0),
+                                                 line.max_downtime_offset)
+        line.down_cnt[...] = np.where(moved, np.where(down, line.down_cnt + ticks, 0), line.down_cnt)
+
+        return levels_before, actual_speeds, sink_delta
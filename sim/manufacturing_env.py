@@ -9,34 +9,52 @@ __maintainer__ = "Amir Jafari"
 __email__ = "amjafari@microsoft.com"
 __status__ = "Development"
 
-from textwrap import indent
-from .line_config import adj, adj_conv
-import json
+from .line_config import adj, adj_conv, con_balance, con_join
+from . import advance as _advance
+from .downtime import DowntimeSchedule, START as DOWNTIME_START
+from .line_kernel import LineKernel
+from .scheduler import EventScheduler, CONTROL, DOWNTIME, FINISHED, JUMP, TICK
+from .topology import LineTopology
+import copy
+import heapq
+import itertools
 import os
 import time
 import re
-import random
 from collections import OrderedDict, deque
-from typing import Dict, Any, Optional, ValuesView
+from dataclasses import dataclass, field, fields, replace
+from types import SimpleNamespace
+from typing import Dict, Any, Optional, Tuple, ValuesView
 import simpy
 import numpy as np
-import matplotlib  
-matplotlib.use('TkAgg')   
-import matplotlib.pyplot as plt  
-from matplotlib.animation import FuncAnimation
-import networkx as nx
-from networkx.generators import line
-import pandas as pd
-import threading
-from threading import Lock
-import pdb
-lock = Lock()
+# matplotlib and networkx are only needed for rendering and are imported by render, see _import_pyplot
 
 '''
 Simulation environment for multi machine manufacturing line.
 '''
 
-random.seed(10)
+def _import_pyplot():
+    '''
+    import matplotlib for rendering, with the interactive TkAgg backend when Tk is available and no backend was chosen
+    through MPLBACKEND, otherwise matplotlib picks its own default, e.g. Agg on headless machines
+    '''
+    import matplotlib
+    if 'MPLBACKEND' not in os.environ:
+        try:
+            import tkinter  # noqa: F401
+            matplotlib.use('TkAgg')
+        except ImportError:
+            pass
+    import matplotlib.pyplot as plt
+    return plt
+
+
+# per-bin attribute names of a conveyor, e.g. bin3 or previous_bin_level3
+_BIN_ATTRIBUTE = re.compile(r"(bin|previous_bin_level)(\d+)$")
+
+# integer codes of the machine states, i.e. the values reported to the Bonsai platform
+MACHINE_STATE_CODES = {"down": -1, "idle": 0, "active": 1, "startup": 2}
+MACHINE_STATE_NAMES = {code: state for state, code in MACHINE_STATE_CODES.items()}
 
 def get_machines_conveyors_sources_sets(adj, adj_conv):
     adj = OrderedDict(sorted(adj.items()))
@@ -57,6 +75,8 @@ def get_machines_conveyors_sources_sets(adj, adj_conv):
     return sorted(list(set(adj.keys()))), sorted(list(conveyors)), sorted(list(sources)), sorted(list(sinks))
 
 class General:
+    # line configuration of sim/line_config.py compiled into index arrays, see LineTopology
+    topology = LineTopology(adj, adj_conv, con_balance, con_join)
     machines, conveyors, sources, sinks = get_machines_conveyors_sources_sets(adj, adj_conv)
     number_of_machines = len(machines) # number of machines
     number_of_conveyors = len(conveyors) # number of conveyors
@@ -125,16 +145,189 @@ class General:
     num_products_at_discharge_index1 = (num_conveyor_bins - dischargeProx_index1 - 1) * bin_maximum_capacity + discharge_prox_lower_limit
     num_products_at_discharge_index2 = (num_conveyor_bins - dischargeProx_index2 - 1) * bin_maximum_capacity + discharge_prox_upper_limit
 
+# parameters with one value per machine, see SimConfig.sized
+PER_MACHINE_PARAMETERS = ('machine_initial_speed', 'machine_min_speed', 'machine_max_speed', 'idletime_duration',
+                          'downtime_event_duration_mean', 'downtime_event_duration_dev', 'downtime_prob')
+
+
+def per_machine(values, num_machines):
+    '''
+    per-machine parameter for a line of num_machines machines, repeating the values given for the machines of the
+    default line, e.g. the 12 machine speed limits of General, as many times as needed
+    '''
+    return tuple(values[ind % len(values)] for ind in range(num_machines))
+
+
+@dataclass(frozen=True)
+class SimConfig:
+    '''
+    immutable simulation parameters of one simulator instance, see General for the meaning and default of each parameter
+    the derived quantities, i.e. conveyor capacity, bins capacity and number of products at the proxes, are computed
+    once if they are not given
+    '''
+    simulation_time_step: float = General.simulation_time_step
+    control_type: int = General.control_type
+    control_frequency: float = General.control_frequency
+    interval_first_down_event: int = General.interval_first_down_event
+    interval_downtime_event_mean: int = General.interval_downtime_event_mean
+    interval_downtime_event_dev: int = General.interval_downtime_event_dev
+    number_parallel_downtime_events: int = General.number_parallel_downtime_events
+    layout_configuration: int = General.layout_configuration
+    down_machine_index: int = General.down_machine_index
+    initial_bin_level: float = General.initial_bin_level
+    bin_maximum_capacity: float = General.bin_maximum_capacity
+    num_conveyor_bins: int = General.num_conveyor_bins
+    conveyor_capacity: Optional[float] = None
+    machine_initial_speed: Tuple[float, ...] = tuple(General.machine_initial_speed)
+    infeed_prox_upper_limit: float = General.infeed_prox_upper_limit
+    infeed_prox_lower_limit: float = General.infeed_prox_lower_limit
+    discharge_prox_upper_limit: float = General.discharge_prox_upper_limit
+    discharge_prox_lower_limit: float = General.discharge_prox_lower_limit
+    infeedProx_index1: int = General.infeedProx_index1
+    infeedProx_index2: int = General.infeedProx_index2
+    dischargeProx_index1: int = General.dischargeProx_index1
+    dischargeProx_index2: int = General.dischargeProx_index2
+    num_products_at_infeed_index1: Optional[float] = None
+    num_products_at_infeed_index2: Optional[float] = None
+    num_products_at_discharge_index1: Optional[float] = None
+    num_products_at_discharge_index2: Optional[float] = None
+    engine: str = 'loop'
+    # backend that runs the events of an episode: simpy processes, or the heap of typed events of sim/scheduler.py
+    scheduler: str = 'simpy'
+    # seed of the random generators of the episode, by default they are spawned from the seed of the simulator
+    seed: Optional[int] = None
+    # parameters of the machines and conveyors of the line
+    machine_min_speed: Tuple[float, ...] = tuple(General.machine_min_speed)
+    machine_max_speed: Tuple[float, ...] = tuple(General.machine_max_speed)
+    idletime_duration: Tuple[float, ...] = tuple(General.idletime_duration)
+    downtime_event_duration_mean: Tuple[int, ...] = tuple(General.downtime_event_duration_mean)
+    downtime_event_duration_dev: Tuple[int, ...] = tuple(General.downtime_event_duration_dev)
+    downtime_prob: Tuple[float, ...] = tuple(General.downtime_prob)
+    conveyor_min_speed: float = General.conveyor_min_speed
+    conveyor_max_speed: float = General.conveyor_max_speed
+    conveyor_general_speed: float = General.conveyor_general_speed
+    bins_capacity: float = field(init=False) # maximum capacity of each conveyor bin
+
+    def __post_init__(self):
+        # the config is frozen, the derived quantities are set once here
+        def derive(name, value):
+            if getattr(self, name) is None:
+                object.__setattr__(self, name, value)
+
+        # infeed proxes count bins from the end of the conveyor starting at 1, discharge proxes from its start at 0
+        for name in ('infeedProx_index1', 'infeedProx_index2'):
+            if not 1 <= getattr(self, name) <= self.num_conveyor_bins:
+                raise ValueError(f'{name} should be between 1 and num_conveyor_bins ({self.num_conveyor_bins}), '
+                                 f'got {getattr(self, name)}')
+        for name in ('dischargeProx_index1', 'dischargeProx_index2'):
+            if not 0 <= getattr(self, name) < self.num_conveyor_bins:
+                raise ValueError(f'{name} should be between 0 and num_conveyor_bins - 1 ({self.num_conveyor_bins - 1}), '
+                                 f'got {getattr(self, name)}')
+
+        derive('conveyor_capacity', self.bin_maximum_capacity * self.num_conveyor_bins)
+        derive('num_products_at_infeed_index1',
+               (self.infeedProx_index1 - 1) * self.bin_maximum_capacity + self.infeed_prox_lower_limit)
+        derive('num_products_at_infeed_index2',
+               (self.infeedProx_index2 - 1) * self.bin_maximum_capacity + self.infeed_prox_upper_limit)
+        derive('num_products_at_discharge_index1',
+               (self.num_conveyor_bins - self.dischargeProx_index1 - 1) * self.bin_maximum_capacity + self.discharge_prox_lower_limit)
+        derive('num_products_at_discharge_index2',
+               (self.num_conveyor_bins - self.dischargeProx_index2 - 1) * self.bin_maximum_capacity + self.discharge_prox_upper_limit)
+        object.__setattr__(self, 'bins_capacity', self.conveyor_capacity / self.num_conveyor_bins)
+        for f in fields(self):
+            if isinstance(getattr(self, f.name), list):
+                object.__setattr__(self, f.name, tuple(getattr(self, f.name)))
+
+    @classmethod
+    def from_dict(cls, config, num_machines=None):
+        '''
+        config from a flat episode config, e.g. the one sent by the Bonsai platform with machine0_initial_speed to
+        machineK_initial_speed; parameters that are not in the config keep their default value and unknown keys are ignored
+        per-machine parameters can also be given as arrays, e.g. machine_max_speed: [170, 190, ...]
+        num_machines: number of machines of the line the config is sized to, see sized
+        '''
+        names = {f.name for f in fields(cls) if f.init}
+        values = {key: value for key, value in config.items() if key in names}
+        machine_initial_speed = values.get('machine_initial_speed', cls.machine_initial_speed)
+        if num_machines is not None and 'machine_initial_speed' not in values:
+            machine_initial_speed = per_machine(machine_initial_speed, num_machines)
+        machine_initial_speed = list(machine_initial_speed)
+        for ind in range(len(machine_initial_speed)):
+            machine_initial_speed[ind] = config.get("machine" + str(ind) + "_initial_speed", machine_initial_speed[ind])
+        values['machine_initial_speed'] = machine_initial_speed
+        config = cls(**values)
+        return config.sized(num_machines) if num_machines is not None else config
+
+    def sized(self, num_machines):
+        '''
+        config for a line of num_machines machines: the per-machine parameters left at their default are repeated or
+        cut to one value per machine, the ones that were given should already have one value per machine
+        '''
+        values = {}
+        for f in fields(self):
+            if f.name not in PER_MACHINE_PARAMETERS or len(getattr(self, f.name)) == num_machines:
+                continue
+            if getattr(self, f.name) != f.default:
+                raise ValueError(f'{f.name} should have one value per machine, i.e. {num_machines} values, '
+                                 f'got {len(getattr(self, f.name))}')
+            values[f.name] = per_machine(f.default, num_machines)
+        return replace(self, **values) if values else self
+
+
 class Machine(General):
     '''
     This class represents a General machine, i.e. its states and function
     '''
-    def __init__(self, id, speed):
+    def __init__(self, id, speed, speeds=None, states=None, idle_counters=None, config=None):
         super().__init__()      
         self.id = id
+        self.config = config if config is not None else SimConfig()
+        # speed, state and idle counter are views over the line-wide machine arrays owned by DES
+        if speeds is None:
+            speeds = np.zeros(len(self.config.machine_max_speed))
+        if states is None:
+            states = np.zeros(len(self.config.machine_max_speed), dtype=np.int8)
+        if idle_counters is None:
+            idle_counters = np.zeros(len(self.config.machine_max_speed))
+        self._speeds = speeds
+        self._states = states
+        self._idle_counters = idle_counters
         self._speed = speed
         self._state = 'idle' if speed == 0 else 'active'
-        self.idle_counter = General.simulation_time_step
+        self.idle_counter = self.config.simulation_time_step
+
+    def reset(self, speed, config):
+        '''
+        put the machine back in its initial state for a new episode, keeping its views over the line-wide arrays
+        '''
+        self.config = config
+        self._speed = speed
+        self._state = 'idle' if speed == 0 else 'active'
+        self.idle_counter = self.config.simulation_time_step
+
+    @property
+    def _speed(self):
+        return self._speeds[self.id]
+
+    @_speed.setter
+    def _speed(self, value):
+        self._speeds[self.id] = value
+
+    @property
+    def _state(self):
+        return MACHINE_STATE_NAMES[self._states[self.id]]
+
+    @_state.setter
+    def _state(self, state):
+        self._states[self.id] = MACHINE_STATE_CODES[state]
+
+    @property
+    def idle_counter(self):
+        return self._idle_counters[self.id]
+
+    @idle_counter.setter
+    def idle_counter(self, value):
+        self._idle_counters[self.id] = value
 
     @property
     def speed(self):
@@ -152,8 +345,8 @@ class Machine(General):
 
     @speed.setter
     def speed(self, value):
-        if not (value <= self.machine_max_speed[self.id] or value == 0):
-            raise ValueError(f'speed must be 0 or smaller than {self.machine_max_speed[self.id]}')
+        if not (value <= self.config.machine_max_speed[self.id] or value == 0):
+            raise ValueError(f'speed must be 0 or smaller than {self.config.machine_max_speed[self.id]}')
         if self.state == "down":
             self._speed = 0
             # print('machine is down, machine speed will be kept zero')
@@ -183,19 +376,55 @@ class Machine(General):
 
 class Conveyor(General):
 
-    def __init__(self, id, speed, env):
+    def __init__(self, id, speed, env, bin_levels=None, previous_bin_levels=None, config=None):
         super().__init__()
-        self.min_speed = General.conveyor_min_speed
-        self.max_speed = General.conveyor_max_speed
-        self.general_speed = General.conveyor_general_speed
+        self.config = config if config is not None else SimConfig()
+        self.min_speed = self.config.conveyor_min_speed
+        self.max_speed = self.config.conveyor_max_speed
+        self.general_speed = self.config.conveyor_general_speed
         self._speed = speed
         self.id = id
         self._state = 'idle' if self._speed == 0 else 'active'
-        self.bins_capacity = self.conveyor_capacity / self.num_conveyor_bins
+        self.bins_capacity = self.config.bins_capacity
         # each bin is considered a container and has a maximum capacity and initial level
-        for i in range(0, self.num_conveyor_bins):
-            setattr(self, "bin" + str(i), self.initial_bin_level) # current bin level
-            setattr(self, "previous_bin_level" + str(i), 0) # previous bin level
+        # the bins are a view over one row of the line-wide bin level arrays owned by DES
+        if bin_levels is None:
+            bin_levels = np.full(self.config.num_conveyor_bins, self.config.initial_bin_level, dtype=float)
+        if previous_bin_levels is None:
+            previous_bin_levels = np.zeros(self.config.num_conveyor_bins)
+        self.bins = bin_levels # current bin levels
+        self.previous_bins = previous_bin_levels # previous bin levels
+
+    def reset(self, speed, config):
+        '''
+        put the conveyor back in its initial state for a new episode, the bin levels are reset by DES
+        '''
+        self.config = config
+        self.min_speed = self.config.conveyor_min_speed
+        self.max_speed = self.config.conveyor_max_speed
+        self.general_speed = self.config.conveyor_general_speed
+        self._speed = speed
+        self._state = 'idle' if self._speed == 0 else 'active'
+        self.bins_capacity = self.config.bins_capacity
+
+    def __getattr__(self, name):
+        '''
+        compatibility accessor for the former per-bin attributes, i.e. bin0..binN and previous_bin_level0..N
+        '''
+        match = _BIN_ATTRIBUTE.match(name)
+        if match is None or 'bins' not in self.__dict__:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        bins = self.__dict__['bins' if match.group(1) == 'bin' else 'previous_bins']
+        return bins[int(match.group(2))]
+
+    def __setattr__(self, name, value):
+        match = _BIN_ATTRIBUTE.match(name)
+        if match is None:
+            super().__setattr__(name, value)
+        elif match.group(1) == 'bin':
+            self.bins[int(match.group(2))] = value
+        else:
+            self.previous_bins[int(match.group(2))] = value
 
     @property
     def speed(self):
@@ -242,67 +471,239 @@ class Sink():
         # a deque to track product accumulation between events
         self.count_history = deque([0, 0, 0], maxlen=10)
 
+    def reset(self):
+        self.product_count = 0
+        self.count_history.clear()
+        self.count_history.extend([0, 0, 0])
+
+# largest number of time steps the analytic engine goes without looking for quiet time steps, and the shortest jump
+# that pays for looking, see DES.quiet_ticks
+QUIET_PROBE_MAX_SKIP = 32
+QUIET_PROBE_MIN_JUMP = 4
+
+# line-wide arrays and per-episode attributes of DES that make up a snapshot
+_SNAPSHOT_ARRAYS = ('bin_levels', 'previous_bin_levels', 'machine_speeds', 'machine_states', 'machine_idle_counters',
+                    'machine_target_speeds', 'machine_counter', 'down_cnt', 'mean_downtime_offset', 'max_downtime_offset')
+_SNAPSHOT_ATTRIBUTES = ('first_count', 'iteration', 'brain_speed', 'components_speed', 'actual_speeds',
+                        'all_conveyor_levels', 'all_conveyor_levels_estimate', 'is_control_frequency_event',
+                        'is_control_downtime_event', 'downtime_event_times_history', 'downtime_machine_history',
+                        'control_frequency_history', 'downtime_tracker_machines', 'downtime_tracker_conveyors',
+                        'sinks_throughput_abs', 'episode_end', 'down_machine_no', 'downtime_count', 'quiet_probe_skip',
+                        'quiet_probe_backoff')
+
+
+def _finished_process():
+    '''
+    process that ends right away, stands for the pending end of a finished process in a restored snapshot
+    '''
+    return
+    yield
+
+
 class DES(General):
-    def __init__(self, env):
+    def __init__(self, env, config=None, headless=False, tracer=None, topology=None, seed=None):
         super().__init__()
         self.env = env
+        # each episode draws from its own generators, seeded from the config or else spawned from this seed sequence,
+        # so that the episodes do not depend on the other simulators of the process, see _seed_episode
+        self.seed_sequence = np.random.SeedSequence(seed)
+        # line topology, by default the one of sim/line_config.py; the lists of components of General are shadowed by
+        # the ones of this topology
+        self.topology = topology if topology is not None else General.topology
+        self.machine_list = self.topology.machines
+        self.conveyor_list = self.topology.conveyors
+        self.sources = self.topology.sources
+        self.sinks = self.topology.sinks
+        self.number_of_machines = len(self.machine_list)
+        self.number_of_conveyors = len(self.conveyor_list)
+        # headless: do not print anything, e.g. for batch runs of many episodes
+        self.headless = headless
+        # optional EventTrace that records downtime, machine state and control events
+        self.tracer = tracer
+        # simulation parameters of this simulator, either a SimConfig or a flat config dictionary, see reset
+        if config is None:
+            config = SimConfig()
+        self.config = self._sim_config(config)
+        self._seed_episode()
+        # the downtime events of the episode do not depend on the line, they are sampled ahead, see sim/downtime.py
+        self.downtime_schedule = DowntimeSchedule(self.config, self.rng)
+        self.initial_time = env.now # time the episodes start at, the environment is rewound to it at reset
         self.components_speed = {}
-        self.actual_speeds = dict.fromkeys(General.machine_list, 0)
-        self.brain_speed = [0] * General.number_of_machines
-        self.iteration = 1
-        self.all_conveyor_levels = [General.initial_bin_level * General.num_conveyor_bins] * General.number_of_conveyors
-        self.all_conveyor_levels_estimate = [General.initial_bin_level * General.num_conveyor_bins] * General.number_of_conveyors
-        self.down_cnt = [0] * General.number_of_machines
-        self.machine_counter = [General.simulation_time_step] * General.number_of_machines
-        self.mean_downtime_offset = [0] * General.number_of_machines
-        self.max_downtime_offset = [0] * General.number_of_machines
+        self.actual_speeds = dict.fromkeys(self.machine_list, 0)
+        self.down_cnt = np.zeros(self.number_of_machines, dtype=int)
+        self.machine_counter = np.zeros(self.number_of_machines, dtype=float)
+        self.mean_downtime_offset = np.zeros(self.number_of_machines, dtype=int)
+        self.max_downtime_offset = np.zeros(self.number_of_machines, dtype=int)
+        self.downtime_event_times_history = deque(maxlen=10)
+        self.downtime_machine_history = deque(maxlen=10)
+        self.control_frequency_history = deque(maxlen=10)
+        self.engine = self.config.engine # engine used to update the line at each simulation time step, see reset
+        # time the jumps of the analytic engine do not go past, only set during an advance, see advance
+        self.jump_horizon = float('inf')
+        self.line_kernel = None
+        self.processes = [] # (phase, simpy process) of the running processes, see processes_generator
+        self.scheduler = None # EventScheduler of the episode when the heap scheduler runs the events
         self._initialize_conveyor_buffers()
         self._initialize_machines()
         self._initialize_sink()
+        self._compile_topology()
+        self._initialize_episode()
+        self._check_simulation_step()
+
+    @property
+    def now(self):
+        '''
+        simulation time, from the heap scheduler of the episode if it runs the events or else from the simpy environment
+        '''
+        return self.scheduler.now if self.scheduler is not None else self.env.now
+
+    def _sim_config(self, config):
+        '''
+        SimConfig sized to the machines of the line from either a SimConfig or a flat config dictionary
+        '''
+        if isinstance(config, SimConfig):
+            return config.sized(self.number_of_machines)
+        return SimConfig.from_dict(config, self.number_of_machines)
+
+    def _seed_episode(self):
+        '''
+        random generators of the episode: rng for the downtime events and policy_rng for stochastic policies, e.g.
+        policies.random_policy, on separate streams so that the draws of a policy do not change the downtime events
+        '''
+        if self.config.seed is not None:
+            episode_seed = np.random.SeedSequence(self.config.seed)
+        else:
+            episode_seed = self.seed_sequence.spawn(1)[0]
+        self.rng, self.policy_rng = (np.random.default_rng(seed) for seed in episode_seed.spawn(2))
+
+    def _initialize_episode(self):
+        '''
+        set the per-episode counters, flags and histories, reusing the arrays and deques of the previous episode
+        '''
+        self.first_count = 0 # flag for occurance of first down event
+        self.brain_speed = [0] * self.number_of_machines
+        self.iteration = 1
+        self.all_conveyor_levels = [self.config.initial_bin_level * self.config.num_conveyor_bins] * self.number_of_conveyors
+        self.all_conveyor_levels_estimate = [self.config.initial_bin_level * self.config.num_conveyor_bins] * self.number_of_conveyors
+        self.down_cnt.fill(0)
+        self.machine_counter.fill(self.config.simulation_time_step)
+        self.mean_downtime_offset.fill(0)
+        self.max_downtime_offset.fill(0)
         self.episode_end = False
         # a flag to identify events that require control
         self.is_control_downtime_event = 0 # flag that a downtime event has occured
         self.is_control_frequency_event = 0 # flag that a fixed control frequency event has occured
-        self.downtime_event_times_history = deque([0, 0, 0], maxlen=10)
-        self.downtime_machine_history = deque([0, 0, 0], maxlen=10)
-        self.control_frequency_history = deque([0, 0, 0], maxlen=10)
+        self.downtime_count = 0 # number of downtime events of the episode so far, see sim/advance.py
+        # time steps left without probing for quiet time steps, and the last number skipped, see quiet_ticks
+        self.quiet_probe_skip = 0
+        self.quiet_probe_backoff = 0
+        for history in (self.downtime_event_times_history, self.downtime_machine_history, self.control_frequency_history):
+            history.clear()
+            history.extend([0, 0, 0])
         self._initialize_downtime_tracker()
-        self._check_simulation_step()
         self.sinks_throughput_abs = 0
 
+    def _clear_environment(self):
+        '''
+        drop the pending events, and with them the processes, of the previous episode and rewind the clock,
+        so that the simpy environment can be reused for the next episode
+        '''
+        self.env._queue.clear()
+        self.env._now = self.initial_time
+        self.env._eid = itertools.count()
+        self.env._active_proc = None
+
     def _initialize_conveyor_buffers(self):
         '''
         start the conveyors with an initial running speed
         '''
         # there is no input buffer for machine 1, and assumption is that it is infinite
         # note that the number of conveyors are one less than total number of machines
+        # bin levels of the whole line are kept in one (conveyors, bins) array and each conveyor is a view over its row
+        shape = (self.number_of_conveyors, self.config.num_conveyor_bins)
+        if getattr(self, 'bin_levels', None) is not None and self.bin_levels.shape == shape:
+            # same number of bins as the previous episode: refill the arrays the conveyors are views over
+            self.bin_levels.fill(self.config.initial_bin_level)
+            self.previous_bin_levels.fill(0)
+            for conveyor, conveyor_object in zip(self.conveyor_list, self.conveyor_table):
+                conveyor_object.reset(self.config.conveyor_general_speed, self.config)
+                self.components_speed[conveyor] = self.config.conveyor_general_speed
+            return False
+        self.bin_levels = np.full(shape, self.config.initial_bin_level, dtype=float)
+        self.previous_bin_levels = np.zeros_like(self.bin_levels)
         id = 0
-        for conveyor in General.conveyor_list:
+        for conveyor in self.conveyor_list:
             # set the conveyor speed at the general conveyor speed which is the max speed
-            setattr(self, conveyor,  Conveyor(id = id, speed = General.conveyor_general_speed, env = self.env))
-            self.components_speed[conveyor] = General.conveyor_general_speed
+            setattr(self, conveyor,  Conveyor(id = id, speed = self.config.conveyor_general_speed, env = self.env,
+                bin_levels = self.bin_levels[id], previous_bin_levels = self.previous_bin_levels[id], config = self.config))
+            self.components_speed[conveyor] = self.config.conveyor_general_speed
             id += 1
+        return True
 
     def _initialize_machines(self):
         '''
         start the machines with an initial running speed
         '''
         # create instance of each machine
+        # speeds, states and idle counters of the whole line are kept in arrays and each machine is a view over them
+        if getattr(self, 'machine_table', None) is not None:
+            self.machine_speeds.fill(0)
+            self.machine_states.fill(0)
+            self.machine_idle_counters.fill(0)
+            for id, (machine, machine_object) in enumerate(zip(self.machine_list, self.machine_table)):
+                machine_object.reset(self.config.machine_initial_speed[id], self.config)
+                self.components_speed[machine] = self.config.machine_initial_speed[id]
+                self.machine_target_speeds[id] = self.config.machine_initial_speed[id]
+            return False
+        self.machine_speeds = np.zeros(self.number_of_machines)
+        self.machine_states = np.zeros(self.number_of_machines, dtype=np.int8)
+        self.machine_idle_counters = np.zeros(self.number_of_machines)
+        # brain choice of speed for each machine, i.e. the machine entries of components_speed
+        self.machine_target_speeds = np.zeros(self.number_of_machines)
         id = 0
-        for machine in General.machine_list:
+        for machine in self.machine_list:
             setattr(self, machine,  Machine(
-                id=id, speed=self.machine_initial_speed[id])) 
-            self.components_speed[machine] = self.machine_initial_speed[id]
+                id=id, speed=self.config.machine_initial_speed[id], speeds=self.machine_speeds,
+                states=self.machine_states, idle_counters=self.machine_idle_counters, config=self.config))
+            self.components_speed[machine] = self.config.machine_initial_speed[id]
+            self.machine_target_speeds[id] = self.config.machine_initial_speed[id]
             id += 1
+        return True
 
     def _initialize_sink(self):
         '''
         initialize the sink where the manufactured products are accumulated
         '''
+        if getattr(self, 'sink_table', None) is not None:
+            for sink_object in self.sink_table:
+                sink_object.reset()
+            return False
         id = 0
-        for sink in General.sinks:
+        for sink in self.sinks:
             setattr(self, sink, Sink(id=id))
             id += 1
+        return True
+
+    def _compile_topology(self):
+        '''
+        compile the line topology into integer indexed component tables, so that components are not looked up by name
+        '''
+        self.machine_index = self.topology.machine_index
+        self.conveyor_index = self.topology.conveyor_index
+        self.sink_index = self.topology.sink_index
+        self.machine_table = [getattr(self, machine) for machine in self.machine_list]
+        self.conveyor_table = [getattr(self, conveyor) for conveyor in self.conveyor_list]
+        self.sink_table = [getattr(self, sink) for sink in self.sinks]
+        # infeed/discharge conveyor index of each machine, None refers to a source/sink
+        def indices(array):
+            return [None if ind < 0 else ind for ind in array.tolist()]
+        self.machine_infeed = indices(self.topology.infeed_conveyor)
+        self.machine_discharge = indices(self.topology.discharge_conveyor)
+        # machine index before/after each conveyor, None refers to a junction, see LineTopology
+        self.conveyor_upstream = indices(self.topology.upstream_machine)
+        self.conveyor_downstream = indices(self.topology.downstream_machine)
+        # machine and sink index of the machines discharging into a sink, in the order of the line configuration
+        self.sink_feeders = self.topology.sink_feeders
 
     def _initialize_downtime_tracker(self):
         '''
@@ -310,22 +711,22 @@ class DES(General):
         '''
         self.downtime_tracker_machines = {}
         self.downtime_tracker_conveyors = {}
-        for machine in General.machine_list:
+        for machine in self.machine_list:
             self.downtime_tracker_machines[machine] = 0
-        for conveyor in General.conveyor_list:
+        for conveyor in self.conveyor_list:
             self.downtime_tracker_conveyors[conveyor] = 0
 
     def _check_simulation_step(self):
         '''
         check the simulation step to ensure it is equal or smaller than control frequency
         '''
-        if self.control_frequency < self.simulation_time_step:
-            print(
-                'Simulation time step should be equal or smaller than control frequency!')
-            print(
-                f'Adjusting simulation time step from {self.simulation_time_step} s to {self.control_frequency}')
-            time.sleep(1)
-            self.simulation_time_step = self.control_frequency
+        if self.config.control_frequency < self.config.simulation_time_step:
+            if not self.headless:
+                print(
+                    'Simulation time step should be equal or smaller than control frequency!')
+                print(
+                    f'Adjusting simulation time step from {self.config.simulation_time_step} s to {self.config.control_frequency}')
+            self.config = replace(self.config, simulation_time_step=self.config.control_frequency)
         else:
             pass
 
@@ -333,131 +734,360 @@ class DES(General):
         '''
         generate processes for different control types
         '''
-        print('Started product processing...')
-        self.env.process(self.update_line_simulation_time_step())
-
-        if self.control_type == -1:
-            self.env.process(self.control_frequency_update())
-        elif self.control_type == 0:
-            self.env.process(self.control_frequency_update())
-            for num_process in range(0, self.number_parallel_downtime_events):
-                self.env.process(self.downtime_generator())
-        elif self.control_type == 1:
-            for num_process in range(0, self.number_parallel_downtime_events):
-                self.env.process(self.downtime_generator())
-        elif self.control_type == 2:
-            self.env.process(self.control_frequency_update())
-            for num_process in range(0, self.number_parallel_downtime_events):
-                self.env.process(self.downtime_generator())
-        else:
+        if not self.headless:
+            print('Started product processing...')
+        if self.config.control_type not in (-1, 0, 1, 2):
             raise ValueError(f"Only the following modes are currently available: \
                 -1: fixed control frequency with no downtime event, \
                 0: fixed control frequency with downtime event, \
                 1: event driven with downtime event (1), \
                 2: both fixed control frequency and event driven with downtime event")
+        # phase of each process next to the simpy process, so that a running episode can be snapshotted, see snapshot
+        self.processes = []
+        if self.scheduler is not None:
+            self.scheduler.start()
+            return
+        self._start_process('tick')
+
+        if self.config.control_type == -1:
+            self._start_process('control')
+        elif self.config.control_type == 0:
+            self._start_process('control')
+            self._start_downtime_process()
+        elif self.config.control_type == 1:
+            self._start_downtime_process()
+        elif self.config.control_type == 2:
+            self._start_process('control')
+            self._start_downtime_process()
+
+    def _start_downtime_process(self):
+        '''
+        one process per parallel downtime event takes the machines down and brings them back, following the events of
+        its slot in the downtime schedule of the episode
+        '''
+        for slot in range(self.config.number_parallel_downtime_events):
+            self._start_process('downtime', slot=slot)
 
-    def control_frequency_update(self):
+    def _start_process(self, kind, state=None, delay=None, slot=None):
+        '''
+        start a tick, control or downtime process, or resume one from its state and the time left until its next event
+        slot: slot of the downtime schedule followed by a downtime process
+        '''
+        if state is None:
+            state = SimpleNamespace(kind=kind, phase=None, machine=None, ticks=0, slot=slot)
+        generator = {'tick': self.update_line_simulation_time_step,
+                     'control': self.control_frequency_update,
+                     'downtime': self.downtime_generator}[kind]
+        process = self.env.process(generator(state, delay))
+        self.processes.append((state, process))
+        return process
+
+    def control_frequency_update(self, state=None, delay=None):
         '''
         update the control frequency
+        state, delay: phase of a restored process and time left until its next event, see restore
         '''
+        if state is None:
+            state = SimpleNamespace(kind='control', phase=None, machine=None, ticks=0, slot=None)
         while True:
-            # define event type as control frequency event ahead of the event
-            self.is_control_frequency_event = 1
-            self.is_control_downtime_event = 0
+            if delay is None:
+                self._flag_control_event()
+                delay = self.config.control_frequency
+            state.phase = 'wait'
+            yield self.env.timeout(delay) # informs the simulation to wait for the next control frequency event to occur
+            delay = None
+            self._record_control_event()
+
+    def _flag_control_event(self):
+        '''
+        define event type as control frequency event ahead of the event
+        '''
+        self.is_control_frequency_event = 1
+        self.is_control_downtime_event = 0
+        if not self.headless:
             print(
-                f'----control at {self.env.now} and event requires control: {self.is_control_frequency_event}')
-            yield self.env.timeout(self.control_frequency) # informs the simulation to wait for the next control frequency event to occur
-            self.is_control_frequency_event = 0
-            # change the flag to zero, in case other events occur
+                f'----control at {self.now} and event requires control: {self.is_control_frequency_event}')
+
+    def _record_control_event(self):
+        '''
+        control frequency event
+        '''
+        self.is_control_frequency_event = 0
+        # change the flag to zero, in case other events occur
+        if self.tracer is not None:
+            self.tracer.record(self.now, 'control_frequency')
+        if not self.headless:
             print('-------------------------------------------')
-            print(f'control freq event at {self.env.now} s ...')
+            print(f'control freq event at {self.now} s ...')
 
-    def update_line_simulation_time_step(self):
+    def update_line_simulation_time_step(self, state=None, delay=None):
         '''
-        update product accumulation at fixed time interval, i.e General.simulation_time_step
+        update product accumulation at fixed time interval, i.e self.config.simulation_time_step
+        state, delay: phase of a restored process and time left until its next event, see restore
         '''
+        if state is None:
+            state = SimpleNamespace(kind='tick', phase=None, machine=None, ticks=0, slot=None)
         while True:
-            self.is_control_frequency_event = 0
-            self.is_control_downtime_event = 0
-            # informs the simulation to wait for the next simulation time step
-            yield self.env.timeout(self.simulation_time_step)
-            print(f'----simulation update at {self.env.now}')
-            self.update_line()
+            if delay is None:
+                self.is_control_frequency_event = 0
+                self.is_control_downtime_event = 0
+                state.phase = 'tick'
+                # informs the simulation to wait for the next simulation time step
+                delay = self.config.simulation_time_step
+            try:
+                yield self.env.timeout(delay)
+            except simpy.Interrupt as interrupt:
+                # the pending jump was cut short by advance, see _cut_jump
+                ticks, delay = interrupt.cause
+                state.phase, state.ticks = ('jump', ticks) if ticks else ('tick', state.ticks)
+                continue
+            delay = None
+            if state.phase == 'tick':
+                if not self.headless:
+                    print(f'----simulation update at {self.now}')
+                self.update_line()
+                if self.engine == 'analytic':
+                    # jump over the time steps where the conveyor levels change linearly, up to the next state change
+                    ticks = self.quiet_ticks()
+                    if ticks:
+                        self.is_control_frequency_event = 0
+                        self.is_control_downtime_event = 0
+                        state.phase, state.ticks = 'jump', ticks
+                        delay = ticks * self.config.simulation_time_step
+                        continue
+            if state.phase == 'jump':
+                if not self.headless:
+                    print(f'----simulation jumped {state.ticks} time steps to {self.now}')
+                self.advance_line(state.ticks)
+
+    def quiet_ticks(self):
+        '''
+        number of the next simulation time steps where no machine changes state and that occur before any other
+        scheduled event, i.e. a control instant or the start/end of a downtime event
+        the probe costs about one and a half vectorized time steps, so it is skipped when the next event leaves no room
+        for a jump of two time steps or more, and for a number of time steps that doubles, up to QUIET_PROBE_MAX_SKIP,
+        after each probe in a row that finds fewer than QUIET_PROBE_MIN_JUMP quiet time steps, e.g. while the machines
+        keep going idle and starting up. skipping a probe only means ticking the line, it does not change the trajectory
+        the jumps do not go past jump_horizon either, see advance
+        '''
+        if self.quiet_probe_skip:
+            self.quiet_probe_skip -= 1
+            return 0
+        next_event = self.scheduler.peek() if self.scheduler is not None else self.env.peek()
+        next_event = min(next_event, self.jump_horizon)
+        if next_event == float('inf'):
+            return 0
+        time_step = self.config.simulation_time_step
+        max_ticks = max(int(np.ceil((next_event - self.now) / time_step)) - 1, 0)
+        if max_ticks < 2:
+            return 0
+        ticks = int(self.line_kernel.quiet_ticks(self.line_view, max_ticks)[0])
+        if ticks >= QUIET_PROBE_MIN_JUMP:
+            self.quiet_probe_backoff = 0
+        else:
+            self.quiet_probe_backoff = min(2 * self.quiet_probe_backoff or 1, QUIET_PROBE_MAX_SKIP)
+            self.quiet_probe_skip = self.quiet_probe_backoff
+        return ticks
 
-    def downtime_generator(self):
+    def _cut_jump(self, until):
         '''
-        generate downtime events based on parameters defined in General
+        shorten the pending jump of the analytic engine, if any, so that it ends before until like the jumps that
+        quiet_ticks finds, or turn it back into a simulation time step if no time step is left to jump over
         '''
+        time_step = self.config.simulation_time_step
+
+        def ticks_left(start, ticks):
+            return min(ticks, max(int(np.ceil((until - start) / time_step)) - 1, 0))
+
+        if self.scheduler is not None:
+            queue = self.scheduler.queue
+            step = self.scheduler.simulation_time_step
+            for index, (event_time, priority, order, kind, ticks) in enumerate(queue):
+                if kind != JUMP:
+                    continue
+                start = event_time - ticks * step
+                left = ticks_left(self.scheduler.initial_time + start * self.scheduler.seconds, ticks)
+                if left < ticks:
+                    queue[index] = ((start + left * step, priority, order, JUMP, left) if left else
+                                    (start + step, priority, order, TICK, 0))
+                    heapq.heapify(queue)
+                return
+            return
+        times = {id(event): event_time for event_time, _, _, event in self.env._queue}
+        for state, process in self.processes:
+            if state.kind == 'tick' and state.phase == 'jump' and process.is_alive and id(process.target) in times:
+                start = times[id(process.target)] - state.ticks * time_step
+                left = ticks_left(start, state.ticks)
+                if left < state.ticks:
+                    process.interrupt((left, start + max(left, 1) * time_step - self.now))
+                return
+
+    def downtime_generator(self, state=None, delay=None):
+        '''
+        take the machines down and bring them back at the events of one slot of the downtime schedule of the episode,
+        see sim/downtime.py
+        state, delay: phase of a restored process and time left until its next event, see restore
+        state.slot: slot of the schedule, state.ticks: number of events of the slot processed so far
+        '''
+        if state is None:
+            state = SimpleNamespace(kind='downtime', phase='schedule', machine=None, ticks=0, slot=0)
         while True:
-            if self.control_type != -1 and self.first_count == 0:
-                yield self.env.timeout(self.interval_first_down_event) # informs the simulation to wait for this amount of time before first down event
-                # change the flag to one once the first down event happens
-                self.first_count = 1
-            down_prob = General.downtime_prob.copy()
-            machines_list = General.machine_list.copy()
-            for ind, machine in enumerate(machines_list):
-                machine_status = getattr(eval('self.' + machine), 'state')
-                if machine_status == 'down':
-                    machines_list.remove(machine)
-                    down_prob.pop(ind)
-            if machines_list == []:
+            if delay is None:
+                delay = self._next_downtime_delay(state.slot, state.ticks)
+            yield self.env.timeout(delay)
+            delay = None
+            index = self.downtime_schedule.slot_event(state.slot, state.ticks)
+            if index is None:
+                # no machine could go down anymore when the slot was due to take one down
+                return
+            self._apply_downtime_event(index)
+            state.ticks += 1
+
+    def _next_downtime_delay(self, slot, count):
+        '''
+        time until the count-th event of a slot of the downtime schedule, or until the slot stopped
+        '''
+        schedule = self.downtime_schedule
+        index = schedule.slot_event(slot, count)
+        time = schedule.times[index] if index is not None else schedule.stop_times[slot]
+        return time - (self.now - self.initial_time)
+
+    def _apply_downtime_event(self, index):
+        '''
+        take down or bring back the machine of the index-th event of the downtime schedule, returns the kind of event
+        '''
+        _, kind, machine, duration = self.downtime_schedule.event(index)
+        # change the flag to one once the first down event happens
+        self.first_count = 1
+        if kind == DOWNTIME_START:
+            self._start_downtime(self.machine_list[machine], duration)
+        else:
+            self._end_downtime(self.machine_list[machine])
+        return kind
+
+    def _start_downtime(self, down_machine, random_downtime_duration):
+        '''
+        take a machine down for the given duration
+        '''
+        if not self.headless:
+            print('down machine is', down_machine)
+        self.down_machine_no = self.machine_index[down_machine]
+        self.downtime_count += 1
+        machine_object = self.machine_table[self.down_machine_no]
+        self.is_control_downtime_event = 1
+        self.is_control_frequency_event = 0
+        if not self.headless:
+            print(
+                f'----machine {down_machine} goes down at {self.now} and event requires control: {self.is_control_downtime_event}')
+        machine_object.state = "down"
+        machine_object.speed = 0
+        self.actual_speeds[down_machine] = 0
+        # track current downtime event for the specific machine
+        if not self.headless:
+            print('down time duration is', random_downtime_duration)
+        if self.tracer is not None:
+            self.tracer.record(self.now, 'downtime_start', machine=down_machine, duration=random_downtime_duration)
+
+        # only add control events to a deque
+        self.track_event(down_machine, random_downtime_duration)
+
+    def _end_downtime(self, down_machine):
+        '''
+        bring the down machine back
+        '''
+        machine_object = self.machine_table[self.machine_index[down_machine]]
+        machine_object.state = "active" # change the machine status to active mode to receive the new speed from Bonsai brain            
+        machine_object.speed = self.components_speed[down_machine]
+        self.actual_speeds[down_machine] = self.components_speed[down_machine]
+        if self.tracer is not None:
+            self.tracer.record(self.now, 'downtime_end', machine=down_machine)
+
+        if not self.headless:
+            print('-----------------------------------------------------------------------')
+            print(f'let machines run for a given period of time without any downtime event')
+        self.is_control_downtime_event = 0
+        self.is_control_frequency_event = 0
+
+    def _tick_event(self, initialize, value):
+        '''
+        simulation time step event of the heap scheduler, see update_line_simulation_time_step
+        '''
+        if not initialize:
+            if not self.headless:
+                print(f'----simulation update at {self.now}')
+            self.update_line()
+            if self.engine == 'analytic':
+                # jump over the time steps where the conveyor levels change linearly, up to the next state change
+                ticks = self.quiet_ticks()
+                if ticks:
+                    self.is_control_frequency_event = 0
+                    self.is_control_downtime_event = 0
+                    self.scheduler.schedule(JUMP, ticks * self.scheduler.simulation_time_step, value=ticks)
+                    return False
+        self.is_control_frequency_event = 0
+        self.is_control_downtime_event = 0
+        self.scheduler.schedule(TICK, self.scheduler.simulation_time_step)
+        return False
+
+    def _jump_event(self, initialize, ticks):
+        '''
+        end of a jump over quiet time steps of the analytic engine, see update_line_simulation_time_step
+        '''
+        if not self.headless:
+            print(f'----simulation jumped {ticks} time steps to {self.now}')
+        self.advance_line(ticks)
+        return self._tick_event(True, 0)
+
+    def _control_event(self, initialize, value):
+        '''
+        fixed frequency control event of the heap scheduler, see control_frequency_update
+        '''
+        if not initialize:
+            self._record_control_event()
+        self._flag_control_event()
+        self.scheduler.schedule(CONTROL, self.scheduler.control_frequency)
+        return True
+
+    def _downtime_event(self, initialize, value):
+        '''
+        event of one slot of the downtime schedule of the heap scheduler, see downtime_generator
+        value: slot of the schedule and number of events of the slot processed so far
+        '''
+        slot, count = value
+        control = None
+        if not initialize:
+            index = self.downtime_schedule.slot_event(slot, count)
+            if index is None:
+                # no machine could go down anymore when the slot was due to take one down
+                self.scheduler.schedule(FINISHED, 0)
                 return None
-            else:
-                if self.down_machine_index == -1: # select a random machine to go down
-                    down_machine_list = random.choices(machines_list, weights=down_prob, k=len(machines_list))
-                    down_machine = max(set(down_machine_list), key = down_machine_list.count)
-                else: # select a specific machine to go down
-                    down_machine = machines_list[self.down_machine_index]
-                print('down machine is', down_machine)
-                self.down_machine_no = int(re.findall(r"[^\W\d_]+|\d+", down_machine)[-1])
-                self.is_control_downtime_event = 1
-                self.is_control_frequency_event = 0
-                print(
-                    f'----machine {down_machine} goes down at {self.env.now} and event requires control: {self.is_control_downtime_event}')
-                setattr(eval('self.' + down_machine), "state", "down")
-                setattr(eval('self.' + down_machine), "speed", 0)
-                self.actual_speeds[down_machine] = 0
-                # track current downtime event for the specific machine
-                random_downtime_duration = random.randint(self.downtime_event_duration_mean[self.down_machine_no]-self.downtime_event_duration_dev[self.down_machine_no],
-                                                            self.downtime_event_duration_mean[self.down_machine_no] + self.downtime_event_duration_dev[self.down_machine_no])  
-                # random_downtime_duration = np.random.lognormal(self.downtime_event_duration_mean[self.down_machine_no], self.downtime_event_duration_dev[self.down_machine_no])                                                           
-                print('down time duration is', random_downtime_duration)
-
-                # only add control events to a deque
-                self.track_event(down_machine, random_downtime_duration)
-                yield self.env.timeout(random_downtime_duration) # informs the simulation that machine should go down for this amount of time
-                
-                setattr(eval('self.' + down_machine), "state", "active") # change the machine status to active mode to receive the new speed from Bonsai brain            
-                setattr(eval('self.' + down_machine), "speed", self.components_speed[down_machine])
-                self.actual_speeds[down_machine] = self.components_speed[down_machine]
-  
-                print('-----------------------------------------------------------------------')
-                print(f'let machines run for a given period of time without any downtime event')
-                self.is_control_downtime_event = 0
-                self.is_control_frequency_event = 0
-                interval_downtime_event_duration = random.randint(self.interval_downtime_event_mean - self.interval_downtime_event_dev,
-                                                                self.interval_downtime_event_mean + self.interval_downtime_event_dev)
-                yield self.env.timeout(interval_downtime_event_duration) # wait for this amount of time before next down event
-       
+            kind = self._apply_downtime_event(index)
+            control = kind == DOWNTIME_START and self.config.control_type in (1, 2)
+            count += 1
+        delay = self._next_downtime_delay(slot, count)
+        self.scheduler.schedule(DOWNTIME, self.scheduler.to_units(delay), value=(slot, count))
+        return control
+
     def startup_generator(self):
         '''
         generate startup time durations based on parameters defined in General
         '''
-        for ind, machine in enumerate(General.machine_list):
-            machine_state = getattr(eval('self.' + machine), "state")
-            self.machine_counter[ind] = getattr(eval('self.' + machine), "idle_counter")
-            machine_idletime_duration = self.idletime_duration[ind]
+        for ind, machine in enumerate(self.machine_list):
+            machine_object = self.machine_table[ind]
+            machine_state = machine_object.state
+            self.machine_counter[ind] = machine_object.idle_counter
+            machine_idletime_duration = self.config.idletime_duration[ind]
 
             if machine_state == "startup":
                 if self.machine_counter[ind] >= machine_idletime_duration:
-                    setattr(eval('self.' + machine), "state", "active")
-                    setattr(eval('self.' + machine), "speed", self.components_speed[machine])     
-                    self.machine_counter[ind] = General.simulation_time_step
+                    machine_object.state = "active"
+                    machine_object.speed = self.components_speed[machine]
+                    self.machine_counter[ind] = self.config.simulation_time_step
                 elif self.machine_counter[ind] < machine_idletime_duration:
-                    self.machine_counter[ind] += General.simulation_time_step
-                    setattr(eval('self.' + machine), "state", "startup")
-                    setattr(eval('self.' + machine), "speed", 0)
-                    setattr(eval('self.' + machine), "idle_counter", self.machine_counter[ind])  
+                    self.machine_counter[ind] += self.config.simulation_time_step
+                    machine_object.state = "startup"
+                    machine_object.speed = 0
+                    machine_object.idle_counter = self.machine_counter[ind]
                     self.actual_speeds[machine] = 0
             if machine_state != "startup":
                 continue
@@ -466,10 +1096,10 @@ class DES(General):
         '''
         estimate the down time duration for the machines that are down
         '''
-        for ind, machine in enumerate(General.machine_list):
-            max_downDuration = General.downtime_event_duration_mean[ind] + General.downtime_event_duration_dev[ind]
-            mean_downDuration = General.downtime_event_duration_mean[ind]
-            machine_state = getattr(eval('self.' + machine), 'state')
+        for ind, machine in enumerate(self.machine_list):
+            max_downDuration = self.config.downtime_event_duration_mean[ind] + self.config.downtime_event_duration_dev[ind]
+            mean_downDuration = self.config.downtime_event_duration_mean[ind]
+            machine_state = self.machine_table[ind].state
             if machine_state == 'down':
                 offset_mean = mean_downDuration - self.down_cnt[ind]
                 offset_max = max_downDuration - self.down_cnt[ind]
@@ -486,6 +1116,20 @@ class DES(General):
         '''
         update the status of the machines and conveyors of the line
         '''
+        if self.tracer is not None:
+            states = [machine.state for machine in self.machine_table]
+            self._update_line()
+            for name, machine, state in zip(self.machine_list, self.machine_table, states):
+                if machine.state != state:
+                    self.tracer.record(self.now, 'machine_state', machine=name, previous=state, state=machine.state)
+        else:
+            self._update_line()
+
+    def _update_line(self):
+        if self.engine in ('vectorized', 'analytic'):
+            # same update as below using whole-array operations
+            self.update_line_vectorized()
+            return
         self.get_conveyor_level() # determine the number of products that exist on the conveyor
         self.startup_generator() # determine whether the machine has finished its startup phase or not
         self.actual_machine_speeds() # determine the actual speed of the machines based on covneyor levels
@@ -496,48 +1140,61 @@ class DES(General):
         # self.get_conveyor_level_estimate()
         self.downtime_estimator()
 
+    def update_line_vectorized(self, initial=False):
+        '''
+        update the status of the machines and conveyors of the line using the line kernel
+        initial: the update done at reset, i.e. without the startup phase and the sink accumulation
+        '''
+        levels, actual_speeds, sink_delta = self.line_kernel.update_line(self.line_view, initial)
+        self.all_conveyor_levels = levels[0].tolist()
+        self.actual_speeds.update(zip(self.machine_list, actual_speeds[0].tolist()))
+        if not initial:
+            for (_, sink), delta in zip(self.sink_feeders, sink_delta[0].tolist()):
+                sink_object = self.sink_table[sink]
+                sink_object.product_count = sink_object.product_count + delta
+
+    def advance_line(self, ticks):
+        '''
+        apply several quiet simulation time steps at once using the line kernel, see quiet_ticks
+        '''
+        levels, actual_speeds, sink_delta = self.line_kernel.advance(self.line_view, ticks)
+        self.all_conveyor_levels = levels[0].tolist()
+        self.actual_speeds.update(zip(self.machine_list, actual_speeds[0].tolist()))
+        for (_, sink), delta in zip(self.sink_feeders, sink_delta[0].tolist()):
+            sink_object = self.sink_table[sink]
+            sink_object.product_count = sink_object.product_count + delta
+
     def update_sinks_product_accumulation(self):
         '''
         accumulate product in the sink according to machine speed if the machine is connected to sink
         '''
-        # update machine infeed and discharge buffers according to machine speed
-        for machine in adj.keys():
-            # adj is a dictionary where the machine is the key and before/after conveyors are the values
-            # first value is used to refer to infeed and second value is used to refer to discharge
-            adj_conveyors = adj[machine]
-            infeed = adj_conveyors[0] # the conveyor before machine
-            discharge = adj_conveyors[1] # the conveyor after the machine
-            # amount of products going from one side to the other side
-            delta = getattr(eval('self.' + machine), 'speed') * \
-                self.simulation_time_step
-
-            if 'sink' in discharge: # if last machine of the line
-                level = getattr(getattr(self, discharge), "product_count")
-                setattr(eval('self.' + discharge),
-                        "product_count", level + delta)
+        # machines connected to a sink, i.e. the last machines of the line
+        for machine_ind, sink_ind in self.sink_feeders:
+            # amount of products going from the machine to the sink
+            delta = self.machine_table[machine_ind].speed * self.config.simulation_time_step
+            sink = self.sink_table[sink_ind]
+            sink.product_count = sink.product_count + delta
 
     def track_event(self, down_machine, random_downtime_duration):
         '''
         add the current simulation time once called and then track the occurrence time of downtime events
         '''
-        self.downtime_event_times_history.append(self.env.now)
+        self.downtime_event_times_history.append(self.now)
         self.downtime_machine_history.append(
-            (self.env.now, down_machine, random_downtime_duration))
+            (self.now, down_machine, random_downtime_duration))
 
     def track_control_frequency(self):
         '''
         track the control frequency
         '''
-        self.control_frequency_history.append(self.env.now)
+        self.control_frequency_history.append(self.now)
 
     def track_sinks_throughput(self):
         '''
         track the throuhgput at the sink
         '''
-        for sink in General.sinks:
-            level = getattr(getattr(self, sink), "product_count")
-            s = eval('self.' + sink)
-            s.count_history.append(level)
+        for sink in self.sink_table:
+            sink.count_history.append(sink.product_count)
 
     def calculate_inter_event_delta_time(self):
         '''
@@ -556,22 +1213,24 @@ class DES(General):
         '''
         update the speed of the machine using brain actions that have been written in components_speed[machine] dictionary
         '''
-        for machine in General.machine_list:
-            updated_speed = self.components_speed[machine]
-            setattr(eval('self.' + machine), 'speed', updated_speed)
+        # same rules as the Machine.speed setter, applied to the line-wide arrays, i.e. the machine_target_speeds
+        # entries of components_speed
+        target_speeds = self.machine_target_speeds
+        max_speeds = np.asarray(self.config.machine_max_speed)
+        too_fast = ~((target_speeds <= max_speeds) | (target_speeds == 0))
+        if too_fast.any():
+            raise ValueError(f'speed must be 0 or smaller than {max_speeds[too_fast.argmax()]}')
+        # machines that are down, idle or in startup keep a zero speed, running machines asked to stop keep their speed
+        active = self.machine_states == MACHINE_STATE_CODES['active']
+        self.machine_speeds[...] = np.where(active & (target_speeds > 0), target_speeds,
+                                            np.where(active, self.machine_speeds, 0))
 
     def get_conveyor_level(self):
         '''
         get the total number of products that exist in the conveyor at each iteration
         '''      
-        self.all_conveyor_levels = []
-        for conveyor in General.conveyor_list:
-            conveyor_level = 0
-            for bin_num in range(General.num_conveyor_bins-1, -1, -1):
-                bin_level = getattr(getattr(self, conveyor), 
-                                "bin" + str(bin_num))
-                conveyor_level += bin_level # total number of products in the conveyor
-            self.all_conveyor_levels.append(conveyor_level) # array that contains the total level of all conveyors
+        # total number of products in each conveyor
+        self.all_conveyor_levels = self.bin_levels.sum(axis=1).tolist() # array that contains the total level of all conveyors
 
     def get_conveyor_level_estimate_initally(self):
         '''
@@ -579,20 +1238,20 @@ class DES(General):
         '''    
         self.all_conveyor_levels_estimate = []
         for conveyor_level in self.all_conveyor_levels:
-            if conveyor_level <= General.num_products_at_infeed_index1:
-                conveyor_estimate_initial= round(General.num_products_at_infeed_index1/2)
+            if conveyor_level <= self.config.num_products_at_infeed_index1:
+                conveyor_estimate_initial= round(self.config.num_products_at_infeed_index1/2)
                 
-            elif(conveyor_level > General.num_products_at_infeed_index1) and (conveyor_level < General.num_products_at_infeed_index2):
-                conveyor_estimate_initial= round((General.num_products_at_infeed_index1 + General.num_products_at_infeed_index2)/2)
+            elif(conveyor_level > self.config.num_products_at_infeed_index1) and (conveyor_level < self.config.num_products_at_infeed_index2):
+                conveyor_estimate_initial= round((self.config.num_products_at_infeed_index1 + self.config.num_products_at_infeed_index2)/2)
 
-            elif(conveyor_level >= General.num_products_at_infeed_index2) and (conveyor_level < General.num_products_at_discharge_index2):
-                conveyor_estimate_initial= round((General.num_products_at_infeed_index2 + General.num_products_at_discharge_index2)/2)
+            elif(conveyor_level >= self.config.num_products_at_infeed_index2) and (conveyor_level < self.config.num_products_at_discharge_index2):
+                conveyor_estimate_initial= round((self.config.num_products_at_infeed_index2 + self.config.num_products_at_discharge_index2)/2)
 
-            elif(conveyor_level >= General.num_products_at_discharge_index2) and (conveyor_level < General.num_products_at_discharge_index1):
-                conveyor_estimate_initial= round((General.num_products_at_discharge_index2 + General.num_products_at_discharge_index1)/2)
+            elif(conveyor_level >= self.config.num_products_at_discharge_index2) and (conveyor_level < self.config.num_products_at_discharge_index1):
+                conveyor_estimate_initial= round((self.config.num_products_at_discharge_index2 + self.config.num_products_at_discharge_index1)/2)
 
             else:
-                conveyor_estimate_initial= round(General.num_products_at_discharge_index1/2)
+                conveyor_estimate_initial= round(self.config.num_products_at_discharge_index1/2)
 
             self.all_conveyor_levels_estimate.append(conveyor_estimate_initial)
      
@@ -600,9 +1259,7 @@ class DES(General):
         '''
         estimate the total number of products that exist on the conveyor at each iteration
         ''' 
-        machines_speed = []
-        for machine in General.machine_list:
-            machines_speed.append(getattr(eval('self.' + machine), 'speed'))
+        machines_speed = [machine_object.speed for machine_object in self.machine_table]
         
         conveyor_infeed_m1_prox_empty = []
         conveyor_infeed_m2_prox_empty = []
@@ -614,48 +1271,44 @@ class DES(General):
         conveyor_previous_discharge_p1_prox_full = []
         conveyor_previous_discharge_p2_prox_full = []
 
-        for conveyor in General.conveyor_list:
+        infeed_bin1 = self.config.num_conveyor_bins - self.config.infeedProx_index1
+        infeed_bin2 = self.config.num_conveyor_bins - self.config.infeedProx_index2
+        for bins, previous_bins in zip(self.bin_levels, self.previous_bin_levels):
             # The primary infeed prox - current
-            conveyor_infeed_m1_prox_empty.append(int(getattr(
-                getattr(self, conveyor), "bin" + str(self.num_conveyor_bins-self.infeedProx_index1))) <= self.infeed_prox_lower_limit)
+            conveyor_infeed_m1_prox_empty.append(int(bins[infeed_bin1]) <= self.config.infeed_prox_lower_limit)
             # The secondanry infeed prox - current
-            conveyor_infeed_m2_prox_empty.append(int(getattr(
-                getattr(self, conveyor), "bin" + str(self.num_conveyor_bins-self.infeedProx_index2))) < self.infeed_prox_upper_limit)
+            conveyor_infeed_m2_prox_empty.append(int(bins[infeed_bin2]) < self.config.infeed_prox_upper_limit)
             # The primary infeed prox -previous iteration
-            conveyor_previous_infeed_m1_prox_empty.append(int(getattr(
-                getattr(self, conveyor), "previous_bin_level" + str(self.num_conveyor_bins-self.infeedProx_index1))) <= self.infeed_prox_lower_limit)
+            conveyor_previous_infeed_m1_prox_empty.append(int(previous_bins[infeed_bin1]) <= self.config.infeed_prox_lower_limit)
             # The secondanry infeed prox - previous iteration
-            conveyor_previous_infeed_m2_prox_empty.append(int(getattr(
-                getattr(self, conveyor), "previous_bin_level" + str(self.num_conveyor_bins-self.infeedProx_index2))) < self.infeed_prox_upper_limit)                
+            conveyor_previous_infeed_m2_prox_empty.append(int(previous_bins[infeed_bin2]) < self.config.infeed_prox_upper_limit)
 
             # The primary discharge prox - current
-            conveyor_discharge_p1_prox_full.append(
-                int(getattr(getattr(self, conveyor), "bin" + str(self.dischargeProx_index1))) >= self.discharge_prox_lower_limit)
+            conveyor_discharge_p1_prox_full.append(int(bins[self.config.dischargeProx_index1]) >= self.config.discharge_prox_lower_limit)
             # The secondary discharge prox - current
-            conveyor_discharge_p2_prox_full.append(
-                int(getattr(getattr(self, conveyor), "bin" + str(self.dischargeProx_index2))) >= self.discharge_prox_upper_limit)    
+            conveyor_discharge_p2_prox_full.append(int(bins[self.config.dischargeProx_index2]) >= self.config.discharge_prox_upper_limit)
             # The primary discharge prox - previous iteration
-            conveyor_previous_discharge_p1_prox_full.append(
-                int(getattr(getattr(self, conveyor), "previous_bin_level" + str(self.dischargeProx_index1))) >= self.discharge_prox_lower_limit)
+            conveyor_previous_discharge_p1_prox_full.append(int(previous_bins[self.config.dischargeProx_index1]) >= self.config.discharge_prox_lower_limit)
             # The secondary discharge prox - previous iteration
-            conveyor_previous_discharge_p2_prox_full.append(
-                int(getattr(getattr(self, conveyor), "previous_bin_level" + str(self.dischargeProx_index2))) >= self.discharge_prox_upper_limit)            
+            conveyor_previous_discharge_p2_prox_full.append(int(previous_bins[self.config.dischargeProx_index2]) >= self.config.discharge_prox_upper_limit)
 
         all_conveyor_levels_estimate_temp = []
         
         for i in range(len(self.all_conveyor_levels_estimate)):
-            # predict phase of the estimator
-            _estimate = self.all_conveyor_levels_estimate[i] + machines_speed[i] - machines_speed[i+1]
+            # predict phase of the estimator, junctions are ignored
+            upstream, downstream = self.conveyor_upstream[i], self.conveyor_downstream[i]
+            _estimate = self.all_conveyor_levels_estimate[i] + (machines_speed[upstream] if upstream is not None else 0) \
+                - (machines_speed[downstream] if downstream is not None else 0)
 
             # update phase of the estimator - assumption is measurements are true whenever available
             if conveyor_infeed_m1_prox_empty[i] != conveyor_previous_infeed_m1_prox_empty[i]:
-                _estimate = General.num_products_at_infeed_index1
+                _estimate = self.config.num_products_at_infeed_index1
             elif conveyor_infeed_m2_prox_empty[i] != conveyor_previous_infeed_m2_prox_empty[i]:
-                _estimate = General.num_products_at_infeed_index2
+                _estimate = self.config.num_products_at_infeed_index2
             elif conveyor_discharge_p1_prox_full[i] != conveyor_previous_discharge_p1_prox_full[i]:
-                _estimate = General.num_products_at_discharge_index1
+                _estimate = self.config.num_products_at_discharge_index1
             elif conveyor_discharge_p2_prox_full[i] != conveyor_previous_discharge_p2_prox_full[i]:
-                _estimate = General.num_products_at_discharge_index2
+                _estimate = self.config.num_products_at_discharge_index2
 
             all_conveyor_levels_estimate_temp.append(_estimate)
 
@@ -665,48 +1318,42 @@ class DES(General):
         '''
         store the bin levels of the conveyors
         '''
-        for conveyor in adj_conv.keys():        
-            for bin_num in range(General.num_conveyor_bins-1, -1, -1):
-                previous_bin_level = getattr(getattr(self, conveyor), 
-                                "bin" + str(bin_num)) # get the level of the conveyor bin
-                setattr(eval('self.' + conveyor), "previous_bin_level" +
-                        str(bin_num), previous_bin_level) # set the previous level of the bin             
+        self.previous_bin_levels[:] = self.bin_levels # set the previous level of the bins
     
     def accumulate_conveyor_bins(self):
         '''
         accumulate the products in the conveyors from right to left
         '''
-        index = 0
-        for conveyor in General.conveyor_list:
-            capacity = getattr(getattr(self, conveyor), "bins_capacity") # maximum capacity of each conveyor bin
+        conveyor_levels = []
+        for index in range(self.number_of_conveyors):
             current_conveyor_level = self.all_conveyor_levels[index] # current conveyor level
-            adj_machines = adj_conv[conveyor] # the machines corresponding to each conveyor
-            previous_machine = adj_machines[0] # the machine before the conveyor
-            next_machine = adj_machines[1] # the machine after the conveyor
+            previous_machine = self.conveyor_upstream[index] # the machine before the conveyor, None for a junction
+            next_machine = self.conveyor_downstream[index] # the machine after the conveyor, None for a join
 
             # amount of products processed by the machine before the conveyor - input to the conveyor
-            delta_previous = getattr(eval('self.' + previous_machine), 'speed') * \
-                self.simulation_time_step
+            delta_previous = 0
+            if previous_machine is not None:
+                delta_previous = self.machine_table[previous_machine].speed * self.config.simulation_time_step
             # amount of products processed by the machine after the conveyor - output from the conveyor
-            delta_next = getattr(eval('self.' + next_machine), 'speed') * \
-                self.simulation_time_step
+            delta_next = 0
+            if next_machine is not None:
+                delta_next = self.machine_table[next_machine].speed * self.config.simulation_time_step
             current_conveyor_level += (delta_previous - delta_next)
-            current_conveyor_level = max(0, current_conveyor_level)
-
-            for bin_num in range(General.num_conveyor_bins-1, -1, -1): # accumulate products in the conveyor from last bin (right) to first bin (left) 
-                setattr(eval('self.' + conveyor), "bin" +
-                        str(bin_num), 0) # reset the bin level - set the level of the bin to 0
-                bin_level = min(current_conveyor_level, capacity)
-                setattr(eval('self.' + conveyor), "bin" +
-                        str(bin_num), bin_level) # set the bin level to right level
-                new_bin_level = getattr(getattr(self, conveyor), 
-                                "bin" + str(bin_num)) # get the level of the conveyor bin
-
-                current_conveyor_level -= new_bin_level 
-                if current_conveyor_level <= 0:
-                    current_conveyor_level = 0
-            index += 1
-            current_conveyor_level = 0
+            conveyor_levels.append(max(0, current_conveyor_level))
+
+        if self.topology.junctions:
+            # products crossing the balancing and joining junctions between the conveyors
+            conveyor_levels = self.topology.transfer(
+                np.array(conveyor_levels, dtype=float), self.config.bins_capacity, self.config.num_conveyor_bins,
+                self.config.conveyor_general_speed * self.config.simulation_time_step).tolist()
+
+        for conveyor_object, current_conveyor_level in zip(self.conveyor_table, conveyor_levels):
+            conveyor_bins = conveyor_object.bins # view over the conveyor row of the bin levels
+            capacity = conveyor_object.bins_capacity # maximum capacity of each conveyor bin
+            # accumulate products in the conveyor from last bin (right) to first bin (left), i.e. bin k holds
+            # whatever is left of the conveyor level once the bins to its right are filled up to their capacity
+            bins_offset = capacity * np.arange(self.config.num_conveyor_bins-1, -1, -1)
+            np.clip(current_conveyor_level - bins_offset, 0, capacity, out=conveyor_bins)
 
     def plc_control_machine_speed(self):
         '''
@@ -714,230 +1361,76 @@ class DES(General):
         rule1: machine should stop, i.e. speed = 0, if primary discharge prox exceeds a threshold
         rule2: machine should stop, i.e. speed = 0, if primary infeed prox falls below a threshold
         '''
-        for machine in adj.keys():
-            adj_conveyors = adj[machine]
-            infeed = adj_conveyors[0] # conveyor before the machine
-            discharge = adj_conveyors[1] # conveyor after the machine
-            machine_state = getattr(eval('self.' + machine), 'state')
+        for ind, machine in enumerate(self.machine_list):
+            machine_object = self.machine_table[ind]
+            machine_state = machine_object.state
             if machine_state == "down" or machine_state == "startup":
-                setattr(eval('self.' + machine), "speed", 0)   
-                self.actual_speeds[machine] = 0  
+                machine_object.speed = 0
+                self.actual_speeds[machine] = 0
                 continue
-            if 'source' not in infeed and 'sink' not in discharge: # if not the first machine and not the last machine in the line            
+            infeed = self.machine_infeed[ind] # conveyor before the machine, None for the first machine in the line
+            discharge = self.machine_discharge[ind] # conveyor after the machine, None for the last machine in the line
+            # the source has infinite products and the sink has infinite capacity
+            infeed_empty = False
+            discharge_full = False
+            if infeed is not None:
                 # get the level of last bin for infeed - conveyor before the machine
-                level_infeed = getattr(getattr(self, infeed), "bin" +
-                    str(self.num_conveyor_bins-self.infeedProx_index1))  
-                # get the level of first bin for discharge - conveyor after the machine
-                level_discharge = getattr(getattr(self, discharge), "bin" + str(self.dischargeProx_index1)) 
-                
-                if machine_state == "active" and level_infeed > self.infeed_prox_lower_limit and level_discharge < self.discharge_prox_lower_limit:
-                    setattr(eval('self.' + machine), "state", "active")
-                    continue
-                if machine_state == "active" and (level_infeed <= self.infeed_prox_lower_limit or level_discharge >= self.discharge_prox_lower_limit):
-                    setattr(eval('self.' + machine), "state", "idle")
-                    setattr(eval('self.' + machine), "speed", 0)     
-                    continue
-                if machine_state == "idle" and (level_infeed <= self.infeed_prox_lower_limit or level_discharge >= self.discharge_prox_lower_limit):
-                    setattr(eval('self.' + machine), "state", "idle")
-                    setattr(eval('self.' + machine), "speed", 0)   
-                    continue
-                if machine_state == "idle" and level_infeed > self.infeed_prox_lower_limit and level_discharge < self.discharge_prox_lower_limit:
-                    # set the machine state to startup and its speed to 0
-                    setattr(eval('self.' + machine), "state", "startup")
-                    setattr(eval('self.' + machine), "speed", 0) 
-                    continue
-            if 'source' in infeed: # if the first machine in the line
+                level_infeed = self.conveyor_table[infeed].bins[self.config.num_conveyor_bins-self.config.infeedProx_index1]
+                infeed_empty = level_infeed <= self.config.infeed_prox_lower_limit
+            if discharge is not None:
                 # get the level of first bin for discharge - conveyor after the machine
-                level_discharge = getattr(getattr(self, discharge), "bin" + str(self.dischargeProx_index1))              
-                if machine_state == "active" and level_discharge < self.discharge_prox_lower_limit:
-                    setattr(eval('self.' + machine), "state", "active")
-                    continue
-                if machine_state == "active" and level_discharge >= self.discharge_prox_lower_limit:
-                    setattr(eval('self.' + machine), "state", "idle")
-                    setattr(eval('self.' + machine), "speed", 0)  
-                    continue  
-                if machine_state == "idle" and level_discharge >= self.discharge_prox_lower_limit:
-                    setattr(eval('self.' + machine), "state", "idle")
-                    setattr(eval('self.' + machine), "speed", 0)   
-                    continue
-                if machine_state == "idle" and level_discharge < self.discharge_prox_lower_limit:
-                    # set the machine state to startup and its speed to 0
-                    setattr(eval('self.' + machine), "state", "startup")
-                    setattr(eval('self.' + machine), "speed", 0) 
-                    continue
-            if 'sink' in discharge: # if the last machine in the line             
-                # get the level of last bin for infeed - conveyor before the machine
-                level_infeed = getattr(getattr(self, infeed), "bin" +
-                    str(self.num_conveyor_bins-self.infeedProx_index1))             
-                if machine_state == "active" and level_infeed > self.infeed_prox_lower_limit:
-                    setattr(eval('self.' + machine), "state", "active")
-                    continue
-                if machine_state == "active" and level_infeed <= self.infeed_prox_lower_limit:
-                    setattr(eval('self.' + machine), "state", "idle")
-                    setattr(eval('self.' + machine), "speed", 0) 
-                    continue
-                if machine_state == "idle" and level_infeed <= self.infeed_prox_lower_limit:
-                    setattr(eval('self.' + machine), "state", "idle")
-                    setattr(eval('self.' + machine), "speed", 0)  
-                    continue
-                if machine_state == "idle" and level_infeed > self.infeed_prox_lower_limit:
-                    # set the machine state to startup and its speed to 0
-                    setattr(eval('self.' + machine), "state", "startup")
-                    setattr(eval('self.' + machine), "speed", 0) 
-                    continue
-    
+                level_discharge = self.conveyor_table[discharge].bins[self.config.dischargeProx_index1]
+                discharge_full = level_discharge >= self.config.discharge_prox_lower_limit
+
+            if machine_state == "active" and (infeed_empty or discharge_full):
+                machine_object.state = "idle"
+                machine_object.speed = 0
+            elif machine_state == "idle" and (infeed_empty or discharge_full):
+                machine_object.state = "idle"
+                machine_object.speed = 0
+            elif machine_state == "idle":
+                # set the machine state to startup and its speed to 0
+                machine_object.state = "startup"
+                machine_object.speed = 0
+
     def actual_machine_speeds(self):
         '''
         determine the actual speed of the machines based on product availability and conveyor remaining empty capacity
         '''
-        index = 0
-        for machine in General.machine_list: 
-            machine_state = getattr(eval('self.' + machine), "state") # state of the machine
+        for ind, machine in enumerate(self.machine_list):
+            machine_object = self.machine_table[ind]
+            machine_state = machine_object.state # state of the machine
             speed = self.components_speed[machine] # brain choice of speed for machine
-            if 'source' not in adj[machine][0] and 'sink' not in adj[machine][1]: # if not the first machine and not the last machine in the line
-                past_conveyor_level = self.all_conveyor_levels[index] # level of previous conveyor
-                next_conveyor_left_capacity = General.conveyor_capacity - self.all_conveyor_levels[index+1] # remaining empty space of next coveyor
-                tmp = min(past_conveyor_level, next_conveyor_left_capacity)
-                if machine_state == "down" or machine_state == "idle" or machine_state == "startup": # machine is down, idle, or in startup mode
-                    self.actual_speeds[machine] = 0
-                    setattr(eval('self.' + machine), 'speed', self.actual_speeds[machine])
-                    index += 1
-                    continue
-                if (machine_state != "down" or machine_state != "idle" or machine_state != "startup") and speed <= tmp:
-                    self.actual_speeds[machine] = speed
-                    setattr(eval('self.' + machine), 'speed', self.actual_speeds[machine])
-                    index += 1
-                    continue                    
-                if (machine_state != "down" or machine_state != "idle" or machine_state != "startup") and speed > tmp:
-                    self.actual_speeds[machine] = tmp
-                    setattr(eval('self.' + machine), 'speed', self.actual_speeds[machine])
-                    index += 1
-                    continue
-            elif 'source' in adj[machine][0]: # if the first machine in the line
-                if machine_state == "down" or machine_state == "idle" or machine_state == "startup": # machine is down, idle, or in startup mode
-                    self.actual_speeds[machine] = 0 
-                    setattr(eval('self.' + machine), 'speed', self.actual_speeds[machine])
-                    continue              
-                if machine_state != "down" or machine_state != "idle" or machine_state != "startup":
-                    tmp1 = min(speed, General.conveyor_capacity - self.all_conveyor_levels[0])
-                    self.actual_speeds[machine] = tmp1
-                    setattr(eval('self.' + machine), 'speed', self.actual_speeds[machine])
-                    continue
-            elif 'sink' in adj[machine][1]: # if the last machine in the line
-                if machine_state == "down" or machine_state == "idle" or machine_state == "startup": # machine is down, idle, or in startup mode
-                    self.actual_speeds[machine] = 0 
-                    setattr(eval('self.' + machine), 'speed', self.actual_speeds[machine])
-                    continue                   
-                if machine_state != "down" or machine_state != "idle" or machine_state != "startup":
-                    tmp2 = min(speed, self.all_conveyor_levels[-1])
-                    self.actual_speeds[machine] = tmp2
-                    setattr(eval('self.' + machine), 'speed', self.actual_speeds[machine])
-                    continue
+            if machine_state == "down" or machine_state == "idle" or machine_state == "startup": # machine is down, idle, or in startup mode
+                speed = 0
+            else:
+                # the source has infinite products and the sink has infinite capacity
+                infeed = self.machine_infeed[ind]
+                discharge = self.machine_discharge[ind]
+                if infeed is not None:
+                    speed = min(speed, self.all_conveyor_levels[infeed]) # level of previous conveyor
+                if discharge is not None:
+                    speed = min(speed, self.config.conveyor_capacity - self.all_conveyor_levels[discharge]) # remaining empty space of next coveyor
+            self.actual_speeds[machine] = speed
+            machine_object.speed = speed
         return self.actual_speeds
 
     def check_illegal_actions(self):
         '''
         compare the brain action (component action) with actual machine speed and consider it illegal if they are not identical
         '''
-        illegal_machine_actions = []
-
-        for machine in General.machine_list:
-            speed = getattr(eval('self.' + machine), 'speed')
-            illegal_machine_actions.append(
-                int(speed != self.components_speed[machine]))
-
-        return illegal_machine_actions
+        return (self.machine_speeds != self.machine_target_speeds).astype(int).tolist()
 
     def reset(self, config):
         '''
-        reset the configuration parameters
-        '''
-        # self.episode_end = False
-        # overwrite some parameters with that of config
-        General.simulation_time_step = \
-            config["simulation_time_step"]        
-        General.control_type = \
-            config["control_type"]
-        General.control_frequency = \
-            config["control_frequency"]  
-        General.interval_first_down_event = \
-            config["interval_first_down_event"]        
-        General.interval_downtime_event_mean = \
-            config["interval_downtime_event_mean"]
-        General.interval_downtime_event_dev = \
-            config["interval_downtime_event_dev"]
-        General.number_parallel_downtime_events = \
-            config["number_parallel_downtime_events"]
-        General.layout_configuration = \
-            config["layout_configuration"]
-        General.down_machine_index = \
-            config["down_machine_index"]
-        General.initial_bin_level = \
-            config["initial_bin_level"]
-        General.bin_maximum_capacity = \
-            config["bin_maximum_capacity"]               
-        General.num_conveyor_bins = \
-            config["num_conveyor_bins"]           
-        General.conveyor_capacity = \
-            config["conveyor_capacity"]
-        General.machine0_initial_speed = \
-            config["machine0_initial_speed"] 
-        General.machine1_initial_speed = \
-            config["machine1_initial_speed"] 
-        General.machine2_initial_speed = \
-            config["machine2_initial_speed"] 
-        General.machine3_initial_speed = \
-            config["machine3_initial_speed"] 
-        General.machine4_initial_speed = \
-            config["machine4_initial_speed"] 
-        General.machine5_initial_speed = \
-            config["machine5_initial_speed"] 
-        General.machine6_initial_speed = \
-            config["machine6_initial_speed"] 
-        General.machine7_initial_speed = \
-            config["machine7_initial_speed"] 
-        General.machine8_initial_speed = \
-            config["machine8_initial_speed"] 
-        General.machine9_initial_speed = \
-            config["machine9_initial_speed"] 
-        General.machine10_initial_speed = \
-            config["machine10_initial_speed"] 
-        General.machine11_initial_speed = \
-            config["machine11_initial_speed"] 
-        General.machine_initial_speed = [General.machine0_initial_speed, General.machine1_initial_speed, General.machine2_initial_speed,
-        General.machine3_initial_speed, General.machine4_initial_speed, General.machine5_initial_speed, General.machine6_initial_speed,
-        General.machine7_initial_speed, General.machine8_initial_speed, General.machine9_initial_speed, General.machine10_initial_speed, General.machine11_initial_speed]
-        General.infeed_prox_upper_limit = \
-            config["infeed_prox_upper_limit"]
-        General.infeed_prox_lower_limit = \
-            config["infeed_prox_lower_limit"]        
-        General.discharge_prox_upper_limit = \
-            config["discharge_prox_upper_limit"]
-        General.discharge_prox_lower_limit = \
-            config["discharge_prox_lower_limit"]                        
-        General.infeedProx_index1 = \
-            config["infeedProx_index1"]
-        General.infeedProx_index2 = \
-            config["infeedProx_index2"]
-        General.dischargeProx_index1 = \
-            config["dischargeProx_index1"]
-        General.dischargeProx_index2 = \
-            config["dischargeProx_index2"]
-        General.num_products_at_discharge_index1 = \
-            config["num_products_at_discharge_index1"]
-        General.num_products_at_discharge_index2 = \
-            config["num_products_at_discharge_index2"]  
-        General.num_products_at_infeed_index1 = \
-            config["num_products_at_infeed_index1"]  
-        General.num_products_at_infeed_index2 = \
-            config["num_products_at_infeed_index2"]
-
-        self._initialize_machines()
-        self._initialize_sink()
-        self._initialize_conveyor_buffers()
-        self._initialize_downtime_tracker()
-
+        reset the configuration parameters and start a new episode in place: the pending events of the previous
+        episode are dropped, and the components and arrays are reused unless the number of conveyor bins changed
+        '''
+        self._prepare_episode(config)
         self.processes_generator()
+        if self.engine in ('vectorized', 'analytic'):
+            self.update_line_vectorized(initial=True)
+            return
         self.get_conveyor_level() # determine the level of conveyors - prior to applying machines' speeds
         # self.startup_generator() # determine whether the machine have finished being in startup mode or not
         # self.get_conveyor_level_estimate_initally()
@@ -947,44 +1440,239 @@ class DES(General):
         # self.store_bin_levels()
         self.downtime_estimator()
 
+    def _prepare_episode(self, config):
+        '''
+        set the config, clear the environment and put the components, arrays and line kernel in their initial state
+        '''
+        # the parameters of this simulator are read from its own config, the General class attributes are only defaults
+        self.config = self._sim_config(config)
+        self._seed_episode()
+        # the downtime events of the episode do not depend on the line, they are sampled ahead, see sim/downtime.py
+        self.downtime_schedule = DowntimeSchedule(self.config, self.rng)
+        self._clear_environment()
+        if self.config.scheduler == 'heap':
+            self.scheduler = EventScheduler(self, self.initial_time)
+        elif self.config.scheduler == 'simpy':
+            self.scheduler = None
+        else:
+            raise ValueError(f"unknown scheduler: {self.config.scheduler}. available schedulers: simpy, heap")
+
+        rebuilt_machines = self._initialize_machines()
+        rebuilt_sinks = self._initialize_sink()
+        rebuilt_conveyors = self._initialize_conveyor_buffers()
+        if rebuilt_machines or rebuilt_sinks or rebuilt_conveyors:
+            self._compile_topology()
+        self._initialize_episode()
+
+        self.topology.check_bins(self.config.num_conveyor_bins)
+
+        # engine used to update the line at each simulation time step
+        # loop: per machine and per conveyor update, vectorized: whole-line update using array operations
+        # analytic: vectorized update that jumps over the time steps where the conveyor levels change linearly. it only
+        # pays off on lines that stay quiet for several time steps between events: with the episodes of
+        # assessments/three_random_machine_down.json and control type 1, the machines keep going idle and starting up
+        # and the proxes flip every few time steps, 3 to 27% of the line updates are saved and it runs about as fast as
+        # vectorized, see sim/line_kernel.py
+        self.engine = self.config.engine
+        if self.engine in ('vectorized', 'analytic'):
+            # the kernel only depends on the config, and its view on the arrays, which are reused unless the bins changed
+            kernel_config = replace(self.config, seed=None, scheduler='simpy')
+            if self.line_kernel is None or self.line_kernel_config != kernel_config or rebuilt_conveyors:
+                self.line_kernel = LineKernel(self.topology, [self.config])
+                self.line_kernel_config = kernel_config
+                # the line kernel works on a leading episode axis, i.e. a single episode here
+                self.line_view = SimpleNamespace(**{name: getattr(self, name)[None] for name in (
+                    'bin_levels', 'machine_speeds', 'machine_states', 'machine_target_speeds', 'machine_idle_counters',
+                    'machine_counter', 'down_cnt', 'mean_downtime_offset', 'max_downtime_offset')})
+        elif self.engine != 'loop':
+            raise ValueError(f"unknown engine: {self.engine}. available engines: loop, vectorized, analytic")
+
+    def snapshot(self):
+        '''
+        copy of the state of the running episode, made of plain values and arrays so that it can be pickled.
+        it holds the config, the clock, the bin levels, the machine states and counters, the histories, the phase
+        of each process with the time of its next event (e.g. the end of a downtime event), the downtime schedule and
+        the state of the random generators of the episode, or the pending events of the heap scheduler. see restore and
+        fork
+        '''
+        queue = sorted(self.env._queue, key=lambda entry: entry[:3]) if self.scheduler is None else []
+        targets = {id(process.target): state for state, process in self.processes if process.is_alive}
+        finished = {id(process) for state, process in self.processes if not process.is_alive}
+        processes = []
+        # in the order of their next events, so that simultaneous events keep their order once restored
+        for event_time, _, _, event in queue:
+            if id(event) in targets:
+                state = targets[id(event)]
+                started = not isinstance(event, simpy.events.Initialize)
+                processes.append({'kind': state.kind, 'phase': state.phase, 'machine': state.machine,
+                                  'ticks': state.ticks, 'slot': state.slot, 'time': event_time if started else None})
+            elif id(event) in finished:
+                # end of a downtime process that ran out of machines to take down
+                processes.append({'kind': 'finished', 'time': event_time})
+            else:
+                raise ValueError(f'cannot snapshot the event {event} which was not scheduled by the simulator')
+        return {
+            'config': self.config,
+            'time': self.now,
+            'random_state': {'policy_rng': self.policy_rng.bit_generator.state},
+            'downtime_schedule': copy.deepcopy(self.downtime_schedule),
+            'arrays': {name: getattr(self, name).copy() for name in _SNAPSHOT_ARRAYS},
+            'conveyors': [(conveyor.speed, conveyor.state) for conveyor in self.conveyor_table],
+            'sinks': [(sink.product_count, list(sink.count_history)) for sink in self.sink_table],
+            'attributes': {name: copy.deepcopy(getattr(self, name)) for name in _SNAPSHOT_ATTRIBUTES
+                           if hasattr(self, name)},
+            'processes': processes,
+            'scheduler': self.scheduler.state() if self.scheduler is not None else None,
+        }
+
+    def restore(self, snapshot):
+        '''
+        continue from a snapshot, dropping the current episode. a snapshot can be restored any number of times
+        '''
+        self._prepare_episode(snapshot['config'])
+        # the schedule holds the downtime generator of the episode along with the events sampled so far
+        self.downtime_schedule = copy.deepcopy(snapshot['downtime_schedule'])
+        self.rng = self.downtime_schedule.rng
+        self.policy_rng.bit_generator.state = snapshot['random_state']['policy_rng']
+        for name, values in snapshot['arrays'].items():
+            getattr(self, name)[...] = values
+        for conveyor, (speed, state) in zip(self.conveyor_table, snapshot['conveyors']):
+            conveyor._speed, conveyor._state = speed, state
+        for sink, (product_count, count_history) in zip(self.sink_table, snapshot['sinks']):
+            sink.product_count = product_count
+            sink.count_history.clear()
+            sink.count_history.extend(count_history)
+        for name, value in snapshot['attributes'].items():
+            setattr(self, name, copy.deepcopy(value))
+
+        self.processes = []
+        if self.scheduler is not None:
+            self.scheduler.restore(snapshot['scheduler'])
+            return
+        self.env._now = snapshot['time']
+        started = [process for process in snapshot['processes'] if process['time'] is not None]
+        for process in started:
+            if process['kind'] == 'finished':
+                self.processes.append((SimpleNamespace(kind='finished'), self.env.process(_finished_process())))
+            else:
+                state = SimpleNamespace(**{key: process[key] for key in ('kind', 'phase', 'machine', 'ticks', 'slot')})
+                self._start_process(process['kind'], state, delay=process['time'] - self.now)
+        # run the processes up to their first yield, which schedules their next events in the snapshot order
+        for _ in started:
+            self.env.step()
+        for process in snapshot['processes']:
+            if process['time'] is None:
+                self._start_process(process['kind'], slot=process['slot'])
+
+    def fork(self):
+        '''
+        independent simulator, on its own simpy environment, that continues from the current state of this one
+        '''
+        simulator = DES(simpy.Environment(), self.config, headless=self.headless, topology=self.topology)
+        simulator.restore(self.snapshot())
+        return simulator
+
     def step(self, brain_actions):
         '''
         run through the simulator at each brain iteration step
         '''
+        self.advance(brain_actions=brain_actions)
+
+    def advance(self, condition=None, horizon=None, brain_actions=None, max_events=None):
+        '''
+        apply the brain actions if any, then run the events of the episode until the condition holds after an event,
+        without going further than horizon seconds or max_events events. by default the events are run until the next
+        control event of the control type, like step. the time of the stop is registered as a control event.
+        condition: function of the simulator that returns a predicate, see sim/advance.py
+        returns an AdvanceResult with the reason the advance stopped for and the time it took
+        '''
+        wall_start = time.perf_counter()
+        start = self.now
         self.iteration += 1
-        # update the speed dictionary for those comming from the brain
-        self.brain_speed = []
-        for key in General.machine_list:
-            self.components_speed[key] = brain_actions.get(key, 0)
-            self.brain_speed.append(brain_actions.get(key, 0))
-        # using brain actions
-        self.update_machines_speed()
-        print('Simulation time at step:', self.env.now)
-
-        # step through the controllable event
-        self.env.step()
-        if self.control_type == 0 or self.control_type == -1:
-            # control at fixed frequency. -1 for no-downtime event
-            while self.is_control_frequency_event != 1:
-                self.env.step()
-        elif self.control_type == 1:
-            # control when downtime events occur
-            # step through other events until a controllable event occurs.
-            while self.is_control_downtime_event != 1:
-                # step through events until a control event, such as downtime, occurs
-                # some events such as time laps are not control events and are excluded by the flag
-                self.env.step()
-        elif self.control_type == 2:
-            while (self.is_control_frequency_event == 0 and self.is_control_downtime_event == 0):
-                self.env.step()
-        else:
-            raise ValueError(f'unknown control type: {self.control_type}. \
-                available modes: -1: fixed time no downtime, 0:fixed time, 1: downtime event, 2: both at fixed time and downtime event')
+        if brain_actions is not None:
+            # update the speed dictionary for those comming from the brain
+            self.brain_speed = [brain_actions.get(key, 0) for key in self.machine_list]
+            self.components_speed.update(zip(self.machine_list, self.brain_speed))
+            self.machine_target_speeds[...] = self.brain_speed
+            # using brain actions
+            self.update_machines_speed()
+        if not self.headless:
+            print('Simulation time at step:', self.now)
+
+        predicate = condition(self) if condition is not None else None
+        until = start + horizon if horizon is not None else float('inf')
+        if self.engine == 'analytic' and (condition is not None or horizon is not None):
+            # the jumps over quiet time steps end before the horizon, and they are turned off while a condition that can
+            # start to hold between two events is checked, so that the advance stops where it stops with the other
+            # engines, see sim/advance.py
+            event_driven = condition is None or getattr(condition, 'event_driven', False)
+            self.jump_horizon = until if event_driven else self.now
+            self._cut_jump(self.jump_horizon)
+        try:
+            if self.scheduler is not None and predicate is None and horizon is None and max_events is None:
+                # step: nothing to check after each event but whether it requires control, which its handler tells
+                processed = self.scheduler.processed
+                self.scheduler.run_until_control_event()
+                reason, events = _advance.CONTROL, self.scheduler.processed - processed
+            elif self.scheduler is not None:
+                reason, events = self.scheduler.run_until(predicate, until, max_events)
+            else:
+                reason, events = self._run_simpy(predicate, until, max_events)
+        finally:
+            self.jump_horizon = float('inf')
 
         # register the time of the controllable event: for use in calculation of delta-t.
         self.track_control_frequency()
         # track product accumulation in sinks once a new control event is triggered.
         self.track_sinks_throughput()
+        return _advance.AdvanceResult(reason=reason, time=self.now, elapsed=self.now - start, events=events,
+                                      wall_time=time.perf_counter() - wall_start)
+
+    def _run_simpy(self, predicate, until, max_events):
+        '''
+        step through the simpy events, see advance and EventScheduler.run_until
+        '''
+        if predicate is None:
+            # step through other events until a controllable event occurs, e.g. time laps are excluded by the flags
+            if self.config.control_type == 0 or self.config.control_type == -1:
+                # control at fixed frequency. -1 for no-downtime event
+                predicate = lambda: self.is_control_frequency_event == 1
+            elif self.config.control_type == 1:
+                # control when downtime events occur
+                predicate = lambda: self.is_control_downtime_event == 1
+            elif self.config.control_type == 2:
+                predicate = lambda: self.is_control_frequency_event != 0 or self.is_control_downtime_event != 0
+            else:
+                raise ValueError(f'unknown control type: {self.config.control_type}. \
+                    available modes: -1: fixed time no downtime, 0:fixed time, 1: downtime event, 2: both at fixed time and downtime event')
+            reason = _advance.CONTROL
+        else:
+            reason = _advance.CONDITION
+        events = 0
+        while True:
+            next_event = self.env.peek()
+            if next_event == float('inf'):
+                return _advance.EXHAUSTED, events
+            if next_event > until:
+                return _advance.HORIZON, events
+            if max_events is not None and events >= max_events:
+                return _advance.MAX_EVENTS, events
+            self.env.step()
+            events += 1
+            if predicate():
+                return reason, events
+
+    def prox_states(self):
+        '''
+        (4, conveyors) array of the prox statuses of the conveyors: infeed m1 and m2 empty, discharge p1 and p2 full
+        '''
+        infeed_bin1 = self.config.num_conveyor_bins - self.config.infeedProx_index1
+        infeed_bin2 = self.config.num_conveyor_bins - self.config.infeedProx_index2
+        return np.stack([
+            self.bin_levels[:, infeed_bin1] <= self.config.infeed_prox_lower_limit,
+            self.bin_levels[:, infeed_bin2] <= self.config.infeed_prox_upper_limit,
+            self.bin_levels[:, self.config.dischargeProx_index1] >= self.config.discharge_prox_lower_limit,
+            self.bin_levels[:, self.config.dischargeProx_index2] >= self.config.discharge_prox_upper_limit])
 
     def get_states(self):
         '''
@@ -996,131 +1684,52 @@ class DES(General):
         (5) throughput, i.e. the production rate from sink, i.e the speed of the last machine (will be used as reward)
         '''
         # machine speed and state
-        machines_state = []
         machines_speed = []
-        for machine in General.machine_list:
+        for machine in self.machine_list:
             machines_speed.append(self.actual_speeds[machine])
-            state = getattr(eval('self.' + machine), 'state')
-            # Bonsai platform can only handle numerical values
-            # assigning integer values to the states
-            if state == "active":
-                machines_state.append(1)
-            elif state == "startup":
-                machines_state.append(2)
-            elif state == "idle":
-                machines_state.append(0)
-            elif state == "down":
-                machines_state.append(-1)
+        # Bonsai platform can only handle numerical values
+        # the states are kept as integer values, see MACHINE_STATE_CODES
+        machines_state = self.machine_states.tolist()
 
         # conveyor speed and state
         conveyors_speed = []
         conveyors_state = []
-        for conveyor in General.conveyors:
-            conveyors_speed.append(getattr(eval('self.' + conveyor), 'speed'))
-            conveyors_state.append(getattr(eval('self.' + conveyor), 'state'))
+        for conveyor_object in self.conveyor_table:
+            conveyors_speed.append(conveyor_object.speed)
+            conveyors_state.append(conveyor_object.state)
 
         # conveyor level status
-        conveyor_buffers = []
-        conveyor_buffers_full = []
-        conveyor_buffers_previous = []
-
-        # primary/secondary infeed prox status
-        conveyor_infeed_m1_prox_empty = []
-        conveyor_infeed_m2_prox_empty = []
-        conveyor_previous_infeed_m1_prox_empty = []
-        conveyor_previous_infeed_m2_prox_empty = []
-
-        # primary/secondary discharge prox status
-        conveyor_discharge_p1_prox_full = []
-        conveyor_discharge_p2_prox_full = []
-        conveyor_previous_discharge_p1_prox_full = []
-        conveyor_previous_discharge_p2_prox_full = []
-
-        for conveyor in General.conveyor_list:
-            buffer = []
-            buffer_previous = []
-            buffer_full = []
-            bin_capacity = getattr(getattr(self, conveyor), "bins_capacity")
-            # for each bin in the conveyor, check whether the bin is full or not - full refers to bin maximum capacity
-            for bin_num in range(0, self.num_conveyor_bins):
-                # current level of the bin
-                buffer.append(
-                    getattr(getattr(self, conveyor), "bin" + str(bin_num)))
-                # previous level of the bin
-                buffer_previous.append(
-                    getattr(getattr(self, conveyor), "previous_bin_level" + str(bin_num)))
-                buffer_full.append(
-                    int(getattr(getattr(self, conveyor), "bin" + str(bin_num)) == bin_capacity))
-
-            # the primary infeed prox status for current iteration
-            current_infeed_m1_level = getattr(
-                getattr(self, conveyor), "bin" + str(self.num_conveyor_bins-self.infeedProx_index1))
-            if current_infeed_m1_level <= self.infeed_prox_lower_limit:
-                conveyor_infeed_m1_prox_empty.append(1)
-            else:
-                conveyor_infeed_m1_prox_empty.append(0)
-
-            # the secondary infeed prox status for current iteration
-            current_infeed_m2_level = getattr(
-                getattr(self, conveyor), "bin" + str(self.num_conveyor_bins-self.infeedProx_index2))
-            if current_infeed_m2_level <= self.infeed_prox_upper_limit:
-                conveyor_infeed_m2_prox_empty.append(1)
-            else:
-                conveyor_infeed_m2_prox_empty.append(0)
-
-            # the primary discharge prox status for current iteration
-            current_discharge_p1_level = getattr(getattr(self, conveyor), "bin" + str(self.dischargeProx_index1))
-            if current_discharge_p1_level >= self.discharge_prox_lower_limit:
-                conveyor_discharge_p1_prox_full.append(1)
-            else:
-                conveyor_discharge_p1_prox_full.append(0)
-
-            # the secondary discharge prox status for current iteration
-            current_discharge_p2_level = getattr(getattr(self, conveyor), "bin" + str(self.dischargeProx_index2))
-            if current_discharge_p2_level >= self.discharge_prox_upper_limit:
-                conveyor_discharge_p2_prox_full.append(1)
-            else:
-                conveyor_discharge_p2_prox_full.append(0)
-
-            # primary/secondary infeed prox status for previous iteration
-            conveyor_previous_infeed_m1_prox_empty.append(int(getattr(
-                getattr(self, conveyor), "previous_bin_level" + str(self.num_conveyor_bins-self.infeedProx_index1))) <= self.infeed_prox_lower_limit)
-            conveyor_previous_infeed_m2_prox_empty.append(int(getattr(
-                getattr(self, conveyor), "previous_bin_level" + str(self.num_conveyor_bins-self.infeedProx_index2))) <= self.infeed_prox_upper_limit)                
-
-            # primary/secondary discharge proxstatus for previous iteration
-            conveyor_previous_discharge_p1_prox_full.append(
-                int(getattr(getattr(self, conveyor), "previous_bin_level" + str(self.dischargeProx_index1))) >= self.discharge_prox_lower_limit)
-            conveyor_previous_discharge_p2_prox_full.append(
-                int(getattr(getattr(self, conveyor), "previous_bin_level" + str(self.dischargeProx_index2))) >= self.discharge_prox_upper_limit)            
-
-            conveyor_buffers.append(buffer)
-            conveyor_buffers_full.append(buffer_full)
-            conveyor_buffers_previous.append(buffer_previous)
-
-            conveyor_buffers_array = np.array(conveyor_buffers)
-            conveyors_level = conveyor_buffers_array.sum(axis=1).tolist()
-
-            conveyor_previous_buffers_array = np.array(conveyor_buffers_previous)
-            conveyors_previous_level = conveyor_previous_buffers_array.sum(axis=1).tolist()           
+        # for each bin in the conveyor, check whether the bin is full or not - full refers to bin maximum capacity
+        bin_capacity = self.config.conveyor_capacity / self.config.num_conveyor_bins
+        conveyor_buffers = self.bin_levels.tolist()
+        conveyor_buffers_full = (self.bin_levels == bin_capacity).astype(int).tolist()
+        conveyors_level = self.bin_levels.sum(axis=1).tolist()
+        conveyors_previous_level = self.previous_bin_levels.sum(axis=1).tolist()
+
+        # primary/secondary infeed and discharge prox status for current iteration
+        (conveyor_infeed_m1_prox_empty, conveyor_infeed_m2_prox_empty, conveyor_discharge_p1_prox_full,
+         conveyor_discharge_p2_prox_full) = self.prox_states().astype(int).tolist()
+        infeed_bin1 = self.config.num_conveyor_bins - self.config.infeedProx_index1
+        infeed_bin2 = self.config.num_conveyor_bins - self.config.infeedProx_index2
+
+        # primary/secondary infeed prox status for previous iteration
+        previous_levels = self.previous_bin_levels.astype(int)
+        conveyor_previous_infeed_m1_prox_empty = previous_levels[:, infeed_bin1] <= self.config.infeed_prox_lower_limit
+        conveyor_previous_infeed_m2_prox_empty = previous_levels[:, infeed_bin2] <= self.config.infeed_prox_upper_limit
+
+        # primary/secondary discharge proxstatus for previous iteration
+        conveyor_previous_discharge_p1_prox_full = previous_levels[:, self.config.dischargeProx_index1] >= self.config.discharge_prox_lower_limit
+        conveyor_previous_discharge_p2_prox_full = previous_levels[:, self.config.dischargeProx_index2] >= self.config.discharge_prox_upper_limit
 
         # throughput rate which is most useful for fixed control frequency
-        sink_machines_rate = []
-        for machine in adj.keys():
-            adj_conveyors = adj[machine]
-            infeed = adj_conveyors[0]
-            discharge = adj_conveyors[1]
-            if 'sink' in discharge: # if it is the last machine in the line
-                sink_machines_rate.append(
-                    getattr(eval('self.' + machine), 'speed'))
+        sink_machines_rate = [self.machine_table[machine_ind].speed for machine_ind, _ in self.sink_feeders]
 
         # sink inter-event product accumulation - throughput change between control actions
         sinks_throughput_delta = []
         # absolute value of throughput
         sinks_throughput_abs = []
 
-        for sink in General.sinks:
-            s = eval('self.' + sink)
+        for s in self.sink_table:
             delta = s.count_history[-1] - s.count_history[-2]
             sinks_throughput_delta.append(delta)
             sinks_throughput_abs.append(s.count_history[-1])
@@ -1152,10 +1761,10 @@ class DES(General):
                   'sink_throughput_delta_sum': sum(sinks_throughput_delta),
                   'sink_throughput_absolute_sum': sum(sinks_throughput_abs),
                   'control_delta_t': control_delta_t,
-                  'env_time': self.env.now,
+                  'env_time': self.now,
                   'all_conveyor_levels': self.all_conveyor_levels,
-                  'mean_downtime_offset': self.mean_downtime_offset,
-                  'max_downtime_offset': self.max_downtime_offset
+                  'mean_downtime_offset': self.mean_downtime_offset.tolist(),
+                  'max_downtime_offset': self.max_downtime_offset.tolist()
                 #   'all_conveyor_levels_estimate': self.all_conveyor_levels_estimate,
                 #   'conveyors_previous_level': conveyors_previous_level,
                 #   'conveyor_previous_infeed_m1_prox_empty': [int(val) for val in conveyor_previous_infeed_m1_prox_empty],
@@ -1171,6 +1780,11 @@ class DES(General):
         Multi-threading for concurrent run of rendering
         supported for the default config
         """
+        import threading
+        import networkx as nx
+        from matplotlib.animation import FuncAnimation
+        plt = _import_pyplot()
+        lock = threading.Lock()
         print('Rendering ....')
         print('Please note that rendering is only functional for the default line config.')
 
@@ -1204,7 +1818,7 @@ class DES(General):
                     plt.text(val[0]-0.6, val[1] + 0.002,
                              'Throughput =' + str(self.sinks_throughput_abs), fontsize=8)
                 else:
-                    machine_speed = getattr(eval('self.' + key), 'speed')
+                    machine_speed = self.machine_table[self.machine_index[key]].speed
                     plt.text(val[0]-0.6, val[1] + 0.002,
                              'Speed =' + str(machine_speed), fontsize=8)
             lock.release()
@@ -1229,6 +1843,7 @@ class DES(General):
         plt.show()
 
     def render(self):
+        import threading
         p = threading.Thread(target=self.animation_concurrent_run)
         p.daemon = True
         p.start()
@@ -0,0 +1,177 @@
+'''
+Heap based event scheduler of DES, an alternative to the simpy processes selected with the scheduler parameter of
+SimConfig.
+
+The events of an episode are kept in a binary heap of (time, priority, order, kind, value) tuples, with time stamps
+counted in integer time units of the episode, see time_unit. Each kind of event has its own handler in DES, i.e. the
+simulation time step, the jump of the analytic engine over quiet time steps, the fixed frequency control event and the
+next event of a slot of the downtime schedule, and the handler of an event schedules the next event of its kind. The events are
+processed in the same order as the simpy processes of DES: by time, then process initialization before timeouts, then
+scheduling order.
+
+run_until_control_event processes the events until one of them requires control under the control type of the
+episode, as told by its handler, rather than polling the control flags of DES after each event: this is how DES.step
+runs the episode. run_until processes them until a predicate holds instead, up to a time horizon, see DES.advance. An event that does not
+change whether control is required, i.e. the initialization or the end of a downtime process, leaves it as the
+previous event left it, like the control flags of DES do with the simpy processes.
+'''
+import heapq
+import math
+from fractions import Fraction
+
+from .advance import CONDITION, CONTROL as CONTROL_REQUIRED, EXHAUSTED, HORIZON, MAX_EVENTS
+
+# simpy priorities of the process initialization and of the timeouts
+URGENT, NORMAL = 0, 1
+# kinds of events: simulation time step, jump over quiet time steps, control frequency, downtime schedule, end of a
+# downtime process once no machine can go down anymore
+TICK, JUMP, CONTROL, DOWNTIME, FINISHED = 0, 1, 2, 3, 4
+KINDS = ('tick', 'jump', 'control', 'downtime', 'finished')
+
+
+def time_unit(*durations):
+    '''
+    largest time unit, in seconds, that all the durations are whole multiples of, e.g. 1 for whole seconds and 1/10
+    for durations given to a tenth of a second
+    '''
+    unit = Fraction(0)
+    for duration in durations:
+        duration = Fraction(duration).limit_denominator(10**6)
+        # greatest common divisor of two fractions
+        unit = Fraction(math.gcd(unit.numerator * duration.denominator, duration.numerator * unit.denominator),
+                        unit.denominator * duration.denominator)
+    return unit if unit > 0 else Fraction(1)
+
+
+class EventScheduler:
+    '''
+    events of the running episode of a simulator, see the module docstring
+    simulator: DES whose handlers process the events
+    initial_time: simulation time of the start of the episode, in seconds
+    '''
+    def __init__(self, simulator, initial_time=0):
+        config = simulator.config
+        self.simulator = simulator
+        self.initial_time = initial_time
+        # the downtime events happen at whole seconds, see sim/downtime.py
+        self.unit = time_unit(config.simulation_time_step, config.control_frequency, 1)
+        # time unit as an int for whole seconds, so that the clock reads like the one of simpy
+        self.seconds = int(self.unit) if self.unit.denominator == 1 else float(self.unit)
+        self.simulation_time_step = self.to_units(config.simulation_time_step)
+        self.control_frequency = self.to_units(config.control_frequency)
+        self.control_type = config.control_type
+        self.time = 0
+        self.queue = []
+        self.scheduled = 0
+        # number of events processed so far
+        self.processed = 0
+        # whether the last event processed requires control
+        self.control = False
+        self.handlers = {TICK: simulator._tick_event, JUMP: simulator._jump_event, CONTROL: simulator._control_event,
+                         DOWNTIME: simulator._downtime_event, FINISHED: _finished_event}
+
+    def to_units(self, seconds):
+        '''
+        whole number of time units of a duration in seconds
+        '''
+        return int(Fraction(seconds).limit_denominator(10**6) / self.unit)
+
+    @property
+    def now(self):
+        '''
+        simulation time in seconds, like simpy.Environment.now
+        '''
+        return self.initial_time + self.time * self.seconds
+
+    def start(self):
+        '''
+        initialize the processes of the control type of the episode, like DES.processes_generator
+        '''
+        self.schedule(TICK, 0, URGENT)
+        if self.control_type in (-1, 0, 2):
+            self.schedule(CONTROL, 0, URGENT)
+        if self.control_type in (0, 1, 2):
+            # one downtime process per slot of the downtime schedule
+            for slot in range(self.simulator.config.number_parallel_downtime_events):
+                self.schedule(DOWNTIME, 0, URGENT, value=(slot, 0))
+
+    def schedule(self, kind, delay, priority=NORMAL, value=0):
+        '''
+        schedule an event of the given kind delay time units from now, value is passed on to its handler
+        '''
+        heapq.heappush(self.queue, (self.time + delay, priority, self.scheduled, kind, value))
+        self.scheduled += 1
+
+    def peek(self):
+        '''
+        simulation time in seconds of the next event, infinity if there is none, like simpy.Environment.peek
+        '''
+        if not self.queue:
+            return float('inf')
+        return self.initial_time + self.queue[0][0] * self.seconds
+
+    def step(self):
+        '''
+        process the next event and tell whether control is required under the control type of the episode
+        '''
+        if not self.queue:
+            raise RuntimeError('no event left to process')
+        time, priority, _, kind, value = heapq.heappop(self.queue)
+        self.time = time
+        self.processed += 1
+        control = self.handlers[kind](priority == URGENT, value)
+        if control is not None:
+            self.control = control
+        return self.control
+
+    def run_until_control_event(self):
+        '''
+        process the events up to and including the next one that requires control, returns its kind. this is the loop of
+        DES.step, i.e. of DES.advance without a condition, a horizon or a limit on the number of events
+        '''
+        while True:
+            kind = self.queue[0][3] if self.queue else None
+            if self.step():
+                return KINDS[kind]
+
+    def run_until(self, predicate=None, until=float('inf'), max_events=None):
+        '''
+        process the events until the predicate holds after an event, or else until control is required, without going
+        past the simulation time until or processing more than max_events events
+        returns the reason it stopped for, see sim/advance.py, and the number of events processed
+        '''
+        events = 0
+        while True:
+            if not self.queue:
+                return EXHAUSTED, events
+            if self.initial_time + self.queue[0][0] * self.seconds > until:
+                return HORIZON, events
+            if max_events is not None and events >= max_events:
+                return MAX_EVENTS, events
+            control = self.step()
+            events += 1
+            if predicate is None:
+                if control:
+                    return CONTROL_REQUIRED, events
+            elif predicate():
+                return CONDITION, events
+
+    def state(self):
+        '''
+        pending events and clock of the episode as plain values, see DES.snapshot
+        '''
+        return {'time': self.time, 'scheduled': self.scheduled, 'control': self.control, 'queue': list(self.queue)}
+
+    def restore(self, state):
+        self.time = state['time']
+        self.scheduled = state['scheduled']
+        self.control = state['control']
+        self.queue = list(state['queue'])
+        heapq.heapify(self.queue)
+
+
+def _finished_event(initialize, value):
+    '''
+    end of a downtime process, stands for the termination event of the simpy process
+    '''
+    return None
@@ -0,0 +1,219 @@
+'''
+Line topology compiled into integer index arrays.
+
+A line is described by adj, the infeed and discharge of each machine, optionally adj_conv, the machines before and after
+each conveyor, and the junctions between conveyors of parallel lines:
+    con_balance: (conveyor_a, conveyor_b, bin) balances the load of two conveyors, products are moved from the fuller
+        conveyor to the other one at the given bin
+    con_join: (conveyor_a, conveyor_b, bin) adds the products of the last bin of conveyor_a, which has no machine after
+        it, to conveyor_b at the given bin
+
+Infeeds whose name contains source are sources with an infinite number of products, and discharges whose name contains
+sink are sinks with an infinite capacity, so a line may have several of each. LineTopology checks the description, e.g.
+that every machine is fed by a source and ends up in a sink, and compiles it into the index arrays the update of the line
+is driven by, e.g. the machines before and after each conveyor and the machines discharging into each sink.
+
+Products move over a junction at the general conveyor speed, and only as far as the receiving conveyor has room between
+the junction bin and its end, i.e. products cannot be added once the receiving conveyor is backed up to the junction.
+The junctions are applied in order, after the machines have moved the products of the simulation time step.
+'''
+import re
+from collections import deque
+
+import numpy as np
+
+
+def _natural_key(name):
+    '''
+    sort m2 before m10
+    '''
+    prefix, number = re.match(r'(.*?)(\d*)$', name).groups()
+    return prefix, int(number) if number else -1
+
+
+def _junctions(junctions, kind):
+    compiled = []
+    for junction in junctions:
+        if len(junction) != 3:
+            raise ValueError(f'{kind} junctions should be (conveyor, conveyor, bin), got {junction}')
+        compiled.append(tuple(junction))
+    return compiled
+
+
+class LineTopology:
+    '''
+    index arrays of a line configuration, see the module docstring
+    machines, conveyors: order of the machines and conveyors in the arrays, by default in natural order of their names
+    '''
+    def __init__(self, adj, adj_conv=None, con_balance=(), con_join=(), machines=None, conveyors=None):
+        for machine, ends in adj.items():
+            if len(ends) != 2:
+                raise ValueError(f'machine {machine} should have an infeed and a discharge, got {ends}')
+            infeed, discharge = ends
+            if 'sink' in infeed or 'source' in discharge:
+                raise ValueError(f'machine {machine} takes products from {infeed} and discharges them into {discharge}')
+        con_balance = _junctions(con_balance, 'balance')
+        con_join = _junctions(con_join, 'join')
+
+        def is_conveyor(name):
+            return 'source' not in name and 'sink' not in name
+
+        names = {name for ends in adj.values() for name in ends}
+        self.machines = list(machines) if machines is not None else sorted(adj, key=_natural_key)
+        if conveyors is None:
+            conveyors = {name for name in names if is_conveyor(name)}
+            conveyors.update(c for junction in con_balance + con_join for c in junction[:2])
+            conveyors.update(adj_conv or ())
+            conveyors = sorted(conveyors, key=_natural_key)
+        self.conveyors = list(conveyors)
+        self.sources = sorted({name for name in names if 'source' in name}, key=_natural_key)
+        self.sinks = sorted({name for name in names if 'sink' in name}, key=_natural_key)
+        if sorted(self.machines) != sorted(adj):
+            raise ValueError(f'the machines {self.machines} do not match the machines of the line {sorted(adj)}')
+        if not self.sources or not self.sinks:
+            raise ValueError('the line should have at least one source and one sink')
+        overlap = set(self.machines) & set(self.conveyors)
+        if overlap:
+            raise ValueError(f'{sorted(overlap)} are both machines and conveyors')
+
+        self.machine_index = {machine: ind for ind, machine in enumerate(self.machines)}
+        self.conveyor_index = {conveyor: ind for ind, conveyor in enumerate(self.conveyors)}
+        self.sink_index = {sink: ind for ind, sink in enumerate(self.sinks)}
+        unknown = {name for name in names if is_conveyor(name)} - set(self.conveyors)
+        if unknown:
+            raise ValueError(f'unknown conveyors {sorted(unknown)}')
+
+        # infeed/discharge conveyor of each machine, -1 refers to a source/sink
+        self.infeed_conveyor = np.array([self.conveyor_index.get(adj[m][0], -1) for m in self.machines], dtype=int)
+        self.discharge_conveyor = np.array([self.conveyor_index.get(adj[m][1], -1) for m in self.machines], dtype=int)
+
+        # machines before/after each conveyor, -1 when the conveyor is fed or drained by a junction only
+        self.upstream_machine = np.full(len(self.conveyors), -1, dtype=int)
+        self.downstream_machine = np.full(len(self.conveyors), -1, dtype=int)
+        for machine, conveyor in enumerate(self.discharge_conveyor):
+            if conveyor >= 0:
+                if self.upstream_machine[conveyor] >= 0:
+                    raise ValueError(f'conveyor {self.conveyors[conveyor]} is fed by more than one machine')
+                self.upstream_machine[conveyor] = machine
+        for machine, conveyor in enumerate(self.infeed_conveyor):
+            if conveyor >= 0:
+                if self.downstream_machine[conveyor] >= 0:
+                    raise ValueError(f'conveyor {self.conveyors[conveyor]} feeds more than one machine')
+                self.downstream_machine[conveyor] = machine
+        for conveyor, ends in (adj_conv or {}).items():
+            compiled = tuple(self.machines[m] if m >= 0 else None for m in (
+                self.upstream_machine[self.conveyor_index[conveyor]],
+                self.downstream_machine[self.conveyor_index[conveyor]]))
+            if tuple(ends) != compiled:
+                raise ValueError(f'adj_conv gives {tuple(ends)} for conveyor {conveyor}, adj gives {compiled}')
+
+        # machines discharging into a sink, in the order of the line configuration, and the sink they discharge into
+        self.sink_feeders = [(self.machine_index[machine], self.sink_index[discharge])
+                             for machine, (_, discharge) in adj.items() if 'sink' in discharge]
+        self.sink_machines = np.array([machine for machine, _ in self.sink_feeders], dtype=int)
+        self.feeder_sinks = np.array([sink for _, sink in self.sink_feeders], dtype=int)
+
+        # junctions as (conveyor, conveyor, bin) rows
+        def compile_junctions(junctions):
+            for a, b, _ in junctions:
+                if a not in self.conveyor_index or b not in self.conveyor_index or a == b:
+                    raise ValueError(f'junction between {a} and {b} should connect two conveyors of the line')
+            return np.array([(self.conveyor_index[a], self.conveyor_index[b], int(bin)) for a, b, bin in junctions],
+                            dtype=int).reshape(-1, 3)
+
+        self.balances = compile_junctions(con_balance)
+        self.joins = compile_junctions(con_join)
+        self.junctions = [('balance', tuple(row)) for row in self.balances] + [('join', tuple(row)) for row in self.joins]
+        self._check_ends()
+        self._check_connectivity()
+
+    def _check_ends(self):
+        '''
+        every conveyor takes products from a machine or a junction and hands them over to a machine or a join
+        '''
+        joined = self.joins[:, 0].tolist()
+        fed = set(self.joins[:, 1].tolist()) | set(self.balances[:, :2].ravel().tolist())
+        for conveyor, name in enumerate(self.conveyors):
+            if self.downstream_machine[conveyor] >= 0 and conveyor in joined:
+                raise ValueError(f'conveyor {name} feeds a machine and joins another conveyor')
+            if self.downstream_machine[conveyor] < 0 and joined.count(conveyor) != 1:
+                raise ValueError(f'conveyor {name} should feed a machine or join exactly one conveyor')
+            if self.upstream_machine[conveyor] < 0 and conveyor not in fed:
+                raise ValueError(f'conveyor {name} is not fed by any machine or junction')
+
+    def _check_connectivity(self):
+        '''
+        every machine is reachable from a source and reaches a sink
+        '''
+        num_machines = len(self.machines)
+        # machines are nodes 0..K-1 and conveyors K..K+N-1
+        forward = [[] for _ in range(num_machines + len(self.conveyors))]
+        for machine, conveyor in enumerate(self.discharge_conveyor):
+            if conveyor >= 0:
+                forward[machine].append(num_machines + conveyor)
+        for conveyor, machine in enumerate(self.downstream_machine):
+            if machine >= 0:
+                forward[num_machines + conveyor].append(machine)
+        for a, b, _ in self.joins:
+            forward[num_machines + a].append(num_machines + b)
+        for a, b, _ in self.balances:
+            forward[num_machines + a].append(num_machines + b)
+            forward[num_machines + b].append(num_machines + a)
+        backward = [[] for _ in forward]
+        for node, targets in enumerate(forward):
+            for target in targets:
+                backward[target].append(node)
+
+        def reachable(starts, edges):
+            visited = set(starts)
+            queue = deque(starts)
+            while queue:
+                for neighbor in edges[queue.popleft()]:
+                    if neighbor not in visited:
+                        visited.add(neighbor)
+                        queue.append(neighbor)
+            return visited
+
+        fed = reachable(np.flatnonzero(self.infeed_conveyor < 0).tolist(), forward)
+        drained = reachable(self.sink_machines.tolist(), backward)
+        for machine, name in enumerate(self.machines):
+            if machine not in fed:
+                raise ValueError(f'machine {name} is not fed by any source')
+            if machine not in drained:
+                raise ValueError(f'machine {name} does not discharge into any sink')
+
+    def check_bins(self, num_conveyor_bins):
+        '''
+        check that the junction bins exist on conveyors with the given number of bins
+        '''
+        for kind, (a, b, bin) in self.junctions:
+            if not 0 <= bin < num_conveyor_bins:
+                raise ValueError(f'{kind} junction between {self.conveyors[a]} and {self.conveyors[b]} is at bin {bin} '
+                                 f'but the conveyors have {num_conveyor_bins} bins')
+
+    def transfer(self, levels, bins_capacity, num_conveyor_bins, rate):
+        '''
+        move the products over the junctions, levels: conveyor levels with the conveyors on the last axis, updated in place
+        bins_capacity, rate: capacity of a bin and products that can cross a junction in one simulation time step,
+            scalars or arrays that broadcast against the levels of a single conveyor
+        '''
+        def room(conveyor, bin):
+            # products that still fit between the junction bin and the end of the conveyor
+            return np.maximum((num_conveyor_bins - bin) * bins_capacity - levels[..., conveyor], 0)
+
+        for a, b, bin in self.balances:
+            half_difference = (levels[..., a] - levels[..., b]) / 2
+            moved = np.where(half_difference >= 0,
+                             np.minimum(np.minimum(half_difference, room(b, bin)), rate),
+                             -np.minimum(np.minimum(-half_difference, room(a, bin)), rate))
+            levels[..., a] -= moved
+            levels[..., b] += moved
+        for a, b, bin in self.joins:
+            moved = np.minimum(np.minimum(levels[..., a], room(b, bin)), rate)
+            levels[..., a] -= moved
+            levels[..., b] += moved
+        return levels
+
+    def __repr__(self):
+        return (f'LineTopology with {len(self.machines)} machines, {len(self.conveyors)} conveyors, '
+                f'{len(self.sources)} sources, {len(self.sinks)} sinks and {len(self.junctions)} junctions')
@@ -0,0 +1,55 @@
+'''
+in-memory ring buffer of the diagnostic events of a simulator, e.g. downtime events, machine state transitions and
+control events. only the most recent events are kept, so a tracer can stay attached to long runs and be dumped when
+something looks wrong:
+
+    tracer = EventTrace(capacity=1000)
+    des = DES(simpy.Environment(), headless=True, tracer=tracer)
+    ...
+    tracer.dump('trace.jsonl')
+'''
+import json
+from collections import deque
+
+
+class EventTrace():
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.buffer = deque(maxlen=capacity)
+        # number of events recorded since the last clear, including the ones that were pushed out of the buffer
+        self.recorded = 0
+
+    def record(self, time, event, **data):
+        '''
+        record an event that happened at simulation time time, data holds the details of the event
+        '''
+        self.buffer.append((time, event, data))
+        self.recorded += 1
+
+    @property
+    def dropped(self):
+        return self.recorded - len(self.buffer)
+
+    def events(self, event=None):
+        '''
+        recorded events from oldest to newest, optionally only the ones of the given type
+        '''
+        return [dict(time=time, event=name, **data) for time, name, data in self.buffer
+                if event is None or name == event]
+
+    def dump(self, path=None):
+        '''
+        recorded events as json lines, written to path if given
+        '''
+        lines = '\n'.join(json.dumps(event) for event in self.events())
+        if path is not None:
+            with open(path, 'w') as file:
+                file.write(lines + '\n' if lines else '')
+        return lines
+
+    def clear(self):
+        self.buffer.clear()
+        self.recorded = 0
+
+    def __len__(self):
+        return len(self.buffer)
@@ -0,0 +1,317 @@
+'''
+Batched simulation of many independent episodes of the manufacturing line.
+
+VectorDES holds N episodes, each with its own configuration, as stacked arrays and steps them in lockstep. The line is
+updated for all the episodes at once with the LineKernel, and the events of each episode (simulation time steps,
+fixed frequency control events and downtime events) are processed in the same order as the simpy processes of DES,
+i.e. by time, then initialization before timeouts, then scheduling order. Each episode follows its own downtime
+schedule, sampled from its own random generator like in DES, so the episodes stay independent of each other and of the
+batch they are simulated in.
+'''
+import numpy as np
+from collections import deque
+from types import SimpleNamespace
+from .downtime import DowntimeSchedule, START
+from .line_kernel import LineKernel, DOWN, ACTIVE
+from .manufacturing_env import General, SimConfig
+
+# simpy priorities of the process initialization and of the timeouts
+URGENT, NORMAL = 0, 1
+# processes of each episode: the simulation time step, the control frequency and the downtime events, the process of
+# the downtime events of slot s of the downtime schedule being DOWNTIME + s
+TICK, CONTROL, DOWNTIME = 0, 1, 2
+
+LINE_ARRAYS = ('bin_levels', 'machine_speeds', 'machine_states', 'machine_target_speeds', 'machine_idle_counters',
+               'machine_counter', 'down_cnt', 'mean_downtime_offset', 'max_downtime_offset')
+
+def episode_parameters(config, num_machines=None):
+    '''
+    simulation parameters of one episode, i.e. a SimConfig built from the episode config like DES.reset
+    num_machines: number of machines of the line the parameters are sized to, see SimConfig.sized
+    '''
+    if isinstance(config, SimConfig):
+        parameters = config.sized(num_machines) if num_machines is not None else config
+    else:
+        parameters = SimConfig.from_dict(config, num_machines)
+    if parameters.control_type not in (-1, 0, 1, 2):
+        raise ValueError(f'unknown control type: {parameters.control_type}. \
+            available modes: -1: fixed time no downtime, 0:fixed time, 1: downtime event, 2: both at fixed time and downtime event')
+    return parameters
+
+
+class VectorDES:
+    '''
+    N independent episodes of the manufacturing line simulated in lockstep
+    episode_configs: one config per episode, either a SimConfig or a flat config dictionary like the config of DES.reset
+    seed: seed of the random generators, each episode gets its own generator spawned from it unless its config has a seed
+    topology: LineTopology of the line, by default the one of sim/line_config.py
+    '''
+    def __init__(self, episode_configs, seed=None, topology=None):
+        self.topology = topology if topology is not None else General.topology
+        self.machine_list = list(self.topology.machines)
+        self.conveyor_list = list(self.topology.conveyors)
+        self.sinks = list(self.topology.sinks)
+        self.reset(episode_configs, seed)
+
+    def reset(self, episode_configs, seed=None):
+        '''
+        start a new episode for each config
+        '''
+        self.parameters = [episode_parameters(config, len(self.machine_list)) for config in episode_configs]
+        num_episodes = len(self.parameters)
+        num_machines = len(self.machine_list)
+        num_conveyors = len(self.conveyor_list)
+        self.num_episodes = num_episodes
+        # the seed of an episode config takes precedence over the one spawned for the episode, and the downtime
+        # generator is spawned from it like in DES, so that an episode seed gives the downtime events of DES
+        episode_seeds = [np.random.SeedSequence(p.seed) if p.seed is not None else s
+                         for p, s in zip(self.parameters, np.random.SeedSequence(seed).spawn(num_episodes))]
+        self.rngs = [np.random.default_rng(episode_seed.spawn(2)[0]) for episode_seed in episode_seeds]
+        self.schedules = [DowntimeSchedule(p, rng) for p, rng in zip(self.parameters, self.rngs)]
+        # number of events processed by each slot of the downtime schedule of each episode
+        num_slots = max([p.number_parallel_downtime_events for p in self.parameters] + [0])
+        self.downtime_index = np.zeros((num_episodes, num_slots), dtype=int)
+        self.kernel = LineKernel(self.topology, self.parameters)
+        num_bins = self.parameters[0].num_conveyor_bins
+
+        def column(name, dtype=None):
+            return np.array([getattr(p, name) for p in self.parameters], dtype=dtype)
+
+        self.control_type = column('control_type')
+        self.control_frequency = column('control_frequency')
+        self.simulation_time_step = column('simulation_time_step')
+        self.machine_max_speed = np.array([p.machine_max_speed for p in self.parameters])
+
+        initial_speeds = np.array([p.machine_initial_speed for p in self.parameters], dtype=float)
+        self.line = SimpleNamespace(
+            bin_levels=np.repeat(column('initial_bin_level', float), num_conveyors * num_bins).reshape(
+                num_episodes, num_conveyors, num_bins),
+            machine_speeds=initial_speeds.copy(),
+            machine_states=np.where(initial_speeds == 0, 0, ACTIVE).astype(np.int8),
+            machine_target_speeds=initial_speeds.copy(),
+            machine_idle_counters=np.repeat(self.simulation_time_step[:, None], num_machines, axis=1).astype(float),
+            machine_counter=np.repeat(self.simulation_time_step[:, None], num_machines, axis=1).astype(float),
+            down_cnt=np.zeros((num_episodes, num_machines), dtype=int),
+            mean_downtime_offset=np.zeros((num_episodes, num_machines), dtype=int),
+            max_downtime_offset=np.zeros((num_episodes, num_machines), dtype=int))
+        self.previous_bin_levels = np.zeros_like(self.line.bin_levels)
+        self.brain_speed = np.zeros((num_episodes, num_machines))
+        self.iteration = np.ones(num_episodes, dtype=int)
+        self.sink_counts = np.zeros((num_episodes, len(self.sinks)))
+        # last two entries of the sinks count history and of the control frequency history
+        self.sink_count_history = np.zeros((num_episodes, len(self.sinks), 2))
+        self.control_frequency_history = np.zeros((num_episodes, 2))
+        self.downtime_machine_history = [deque([0, 0, 0], maxlen=10) for _ in range(num_episodes)]
+        # flags that a fixed control frequency event or a downtime event has occured
+        self.is_control_frequency_event = np.zeros(num_episodes, dtype=int)
+        self.is_control_downtime_event = np.zeros(num_episodes, dtype=int)
+
+        # pending event of each process of each episode, ordered like the simpy event queue
+        self.now = np.zeros(num_episodes)
+        num_processes = DOWNTIME + num_slots
+        self.event_time = np.full((num_episodes, num_processes), np.inf)
+        self.event_priority = np.full((num_episodes, num_processes), URGENT)
+        self.event_order = np.zeros((num_episodes, num_processes), dtype=int)
+        self.events_scheduled = np.zeros(num_episodes, dtype=int)
+        for episode, p in enumerate(self.parameters):
+            processes = [TICK]
+            if p.control_type in (-1, 0, 2):
+                processes.append(CONTROL)
+            if p.control_type in (0, 1, 2):
+                processes.extend(DOWNTIME + slot for slot in range(p.number_parallel_downtime_events))
+            for process in processes:
+                self._schedule(episode, process, 0, URGENT)
+
+        # determine the actual machines' speeds and the conveyors level prior to the first step
+        levels, actual_speeds, _ = self.kernel.update_line(self.line, initial=True)
+        self.all_conveyor_levels = levels
+        self.actual_speeds = actual_speeds
+
+    def _schedule(self, episodes, process, delay, priority=NORMAL):
+        self.event_time[episodes, process] = self.now[episodes] + delay
+        self.event_priority[episodes, process] = priority
+        self.event_order[episodes, process] = self.events_scheduled[episodes]
+        self.events_scheduled[episodes] += 1
+
+    def step(self, actions):
+        '''
+        run each episode until its next control event
+        actions: (episodes, machines) array of brain speeds, or one brain action dictionary per episode
+        returns the batched states, see get_states
+        '''
+        actions = self._action_array(actions)
+        too_fast = (actions > self.machine_max_speed) & (actions != 0)
+        if too_fast.any():
+            episode, machine = np.argwhere(too_fast)[0]
+            raise ValueError(f'speed must be 0 or smaller than {self.machine_max_speed[episode, machine]}')
+        self.iteration += 1
+        self.brain_speed = actions.copy()
+        line = self.line
+        line.machine_target_speeds[...] = actions
+        # using brain actions, machines that are down, idle or in startup keep a zero speed
+        active = line.machine_states == ACTIVE
+        line.machine_speeds[...] = np.where(active & (actions > 0), actions, np.where(active, line.machine_speeds, 0))
+
+        # step through the events of each episode until a controllable event occurs
+        pending = np.ones(self.num_episodes, dtype=bool)
+        while pending.any():
+            episodes = np.flatnonzero(pending)
+            self._process_next_event(episodes)
+            control_type = self.control_type[episodes]
+            frequency_event = self.is_control_frequency_event[episodes] == 1
+            downtime_event = self.is_control_downtime_event[episodes] == 1
+            is_control_event = np.where(control_type <= 0, frequency_event,
+                                        np.where(control_type == 1, downtime_event, frequency_event | downtime_event))
+            pending[episodes] = ~is_control_event
+
+        # register the time of the controllable event and track product accumulation in sinks
+        self.control_frequency_history[:, 0] = self.control_frequency_history[:, 1]
+        self.control_frequency_history[:, 1] = self.now
+        self.sink_count_history[:, :, 0] = self.sink_count_history[:, :, 1]
+        self.sink_count_history[:, :, 1] = self.sink_counts
+        return self.get_states()
+
+    def _action_array(self, actions):
+        if isinstance(actions, np.ndarray):
+            actions = actions.astype(float)
+        elif len(actions) and isinstance(actions[0], dict):
+            actions = np.array([[action.get(machine, 0) for machine in self.machine_list] for action in actions],
+                               dtype=float)
+        else:
+            actions = np.array(actions, dtype=float)
+        if actions.shape != (self.num_episodes, len(self.machine_list)):
+            raise ValueError(f'actions should have shape {(self.num_episodes, len(self.machine_list))}, got {actions.shape}')
+        return actions
+
+    def _process_next_event(self, episodes):
+        '''
+        process the next event of each of the given episodes
+        '''
+        times = self.event_time[episodes]
+        priorities = self.event_priority[episodes]
+        earliest = times == times.min(axis=1, keepdims=True)
+        first = earliest & (priorities == np.where(earliest, priorities, NORMAL + 1).min(axis=1, keepdims=True))
+        process = np.where(first, self.event_order[episodes], np.iinfo(int).max).argmin(axis=1)
+        rows = np.arange(len(episodes))
+        self.now[episodes] = times[rows, process]
+        initialize = priorities[rows, process] == URGENT
+
+        # simulation time step: update the line, then wait for the next time step
+        ticks = episodes[(process == TICK) & ~initialize]
+        if ticks.size:
+            self._update_line(ticks)
+        ticks = episodes[process == TICK]
+        self.is_control_frequency_event[ticks] = 0
+        self.is_control_downtime_event[ticks] = 0
+        self._schedule(ticks, TICK, self.simulation_time_step[ticks])
+
+        # fixed frequency control event: the next control event is flagged ahead of time
+        controls = episodes[process == CONTROL]
+        self.is_control_frequency_event[controls] = 1
+        self.is_control_downtime_event[controls] = 0
+        self._schedule(controls, CONTROL, self.control_frequency[controls])
+
+        for row in np.flatnonzero(process >= DOWNTIME):
+            self._downtime_event(episodes[row], process[row] - DOWNTIME, initialize[row])
+
+    def _update_line(self, episodes):
+        if episodes.size == self.num_episodes:
+            line, kernel = self.line, self.kernel
+        else:
+            line = SimpleNamespace(**{name: getattr(self.line, name)[episodes] for name in LINE_ARRAYS})
+            kernel = self.kernel.select(episodes)
+        levels, actual_speeds, sink_delta = kernel.update_line(line)
+        if line is not self.line:
+            for name in LINE_ARRAYS:
+                getattr(self.line, name)[episodes] = getattr(line, name)
+        self.all_conveyor_levels[episodes] = levels
+        self.actual_speeds[episodes] = actual_speeds
+        for feeder, (_, sink) in enumerate(self.kernel.sink_feeders):
+            self.sink_counts[episodes, sink] += sink_delta[:, feeder]
+
+    def _downtime_event(self, episode, slot, initialize):
+        '''
+        downtime process of one slot of one episode, see DES.downtime_generator
+        '''
+        schedule = self.schedules[episode]
+        line = self.line
+        if not initialize:
+            _, kind, machine, duration = schedule.event(schedule.slot_event(slot, self.downtime_index[episode, slot]))
+            self.downtime_index[episode, slot] += 1
+            if kind == START:
+                self.is_control_downtime_event[episode] = 1
+                self.is_control_frequency_event[episode] = 0
+                line.machine_states[episode, machine] = DOWN
+                line.machine_speeds[episode, machine] = 0
+                self.actual_speeds[episode, machine] = 0
+                self.downtime_machine_history[episode].append((self.now[episode], self.machine_list[machine], duration))
+            else:
+                # machine is back to active mode to receive the new speed from the brain
+                target_speed = line.machine_target_speeds[episode, machine]
+                line.machine_states[episode, machine] = ACTIVE
+                if target_speed > 0:
+                    line.machine_speeds[episode, machine] = target_speed
+                self.actual_speeds[episode, machine] = target_speed
+                self.is_control_downtime_event[episode] = 0
+                self.is_control_frequency_event[episode] = 0
+        index = schedule.slot_event(slot, self.downtime_index[episode, slot])
+        if index is None:
+            # no machine can go down anymore when the slot is due to take one down, the process ends without changing
+            # the state of the episode
+            self.event_time[episode, DOWNTIME + slot] = np.inf
+            return
+        self._schedule(episode, DOWNTIME + slot, schedule.times[index] - self.now[episode])
+
+    def get_states(self):
+        '''
+        batched states of all the episodes, with the same keys as DES.get_states and a leading episode axis
+        '''
+        line = self.line
+        num_episodes = self.num_episodes
+        bins = line.bin_levels
+        num_bins = bins.shape[-1]
+
+        def prox_level(levels, name, from_end=False):
+            index = np.array([getattr(p, name) for p in self.parameters]).reshape(-1, 1, 1)
+            return np.take_along_axis(levels, num_bins - index if from_end else index, axis=-1)[..., 0]
+
+        def limit(name):
+            return np.array([getattr(p, name) for p in self.parameters]).reshape(-1, 1)
+
+        sink_machines = self.kernel.sink_machines
+        sink_machines_rate = line.machine_speeds[:, sink_machines]
+        sinks_throughput_delta = self.sink_count_history[:, :, 1] - self.sink_count_history[:, :, 0]
+        sinks_throughput_abs = self.sink_count_history[:, :, 1]
+        num_conveyors = len(self.conveyor_list)
+        return {'machines_state': line.machine_states.astype(int),
+                'machines_actual_speed': self.actual_speeds.copy(),
+                'brain_speed': self.brain_speed.copy(),
+                'iteration_count': self.iteration.copy(),
+                'conveyors_speed': np.array([[p.conveyor_general_speed] * num_conveyors for p in self.parameters]),
+                'conveyors_state': np.full((num_episodes, num_conveyors), 'active'),
+                'conveyor_buffers': bins.copy(),
+                'conveyor_buffers_full': (bins == self.kernel.bins_capacity).astype(int),
+                'conveyors_level': bins.sum(axis=-1),
+                'conveyor_infeed_m1_prox_empty': (prox_level(bins, 'infeedProx_index1', True) <= limit('infeed_prox_lower_limit')).astype(int),
+                'conveyor_infeed_m2_prox_empty': (prox_level(bins, 'infeedProx_index2', True) <= limit('infeed_prox_upper_limit')).astype(int),
+                'conveyor_discharge_p1_prox_full': (prox_level(bins, 'dischargeProx_index1') >= limit('discharge_prox_lower_limit')).astype(int),
+                'conveyor_discharge_p2_prox_full': (prox_level(bins, 'dischargeProx_index2') >= limit('discharge_prox_upper_limit')).astype(int),
+                'illegal_machine_actions': (line.machine_speeds != line.machine_target_speeds).astype(int),
+                'sink_machines_rate': sink_machines_rate,
+                'sink_machines_rate_sum': sink_machines_rate.sum(axis=1),
+                'sink_throughput_delta': sinks_throughput_delta,
+                'sink_throughput_delta_sum': sinks_throughput_delta.sum(axis=1),
+                'sink_throughput_absolute_sum': sinks_throughput_abs.sum(axis=1),
+                'control_delta_t': self.control_frequency_history[:, 1] - self.control_frequency_history[:, 0],
+                'env_time': self.now.copy(),
+                'all_conveyor_levels': self.all_conveyor_levels.copy(),
+                'mean_downtime_offset': line.mean_downtime_offset.copy(),
+                'max_downtime_offset': line.max_downtime_offset.copy()}
+
+    def get_episode_states(self, states=None):
+        '''
+        split the batched states into one state dictionary per episode, formatted like DES.get_states
+        '''
+        if states is None:
+            states = self.get_states()
+        return [{key: value[episode].tolist() for key, value in states.items()} for episode in range(self.num_episodes)]
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Supervisor running many simulator instances in worker processes
+
+Forks --num-instances worker processes from one command. Each worker runs its
+own session loop, i.e. the sessions of async_host.py with their own DES. The
+simulator is imported once by the supervisor before the workers are forked.
+Workers that crash are restarted after a delay that doubles with every crash
+in a row, up to --max-backoff. Workers report their counters to the supervisor,
+which prints the steps per second and the error counts of all the workers.
+
+Usage:
+    python supervisor.py --num-instances 32 --headless
+    python supervisor.py --num-instances 8 --sessions-per-instance 4 --workspace <workspace id> --accesskey <access key>
+    python supervisor.py --num-instances 4 --fake-server --fake-latency 0.02 --duration 60
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import queue as queues
+import signal
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+# imported before the workers are forked, so that they do not pay for it
+import async_host
+
+# counters of the workers that are summed by the supervisor
+COUNTERS = ("registrations", "episodes", "steps", "idles", "errors")
+
+
+def restart_delay(crashes: int, backoff: float = 1.0, max_backoff: float = 60.0) -> float:
+    """Seconds to wait before restarting a worker that crashed crashes times in a row"""
+    return min(backoff * 2 ** (crashes - 1), max_backoff) if crashes > 0 else 0.0
+
+
+def run_worker(index: int, incarnation: int, options: Dict, reports):
+    """Worker process: run the sessions of async_host.py and report their counters
+
+    Parameters
+    ----------
+    index : int
+        index of the worker
+    incarnation : int
+        number of times the worker was restarted
+    options : Dict
+        server, workspace, access_key, sessions, timeout, headless, log_iterations and report_interval
+    reports : multiprocessing.Queue
+        queue the (index, incarnation, counters) reports are put on
+    """
+    # the supervisor stops the workers, with SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "interface.json")) as file:
+        interface = json.load(file)
+    host = async_host.SimulatorHost(
+        lambda: async_host.BonsaiSessionClient(options["server"], options["workspace"], options["access_key"],
+                                               options.get("timeout", 60)),
+        options.get("sessions", 1), interface, simulator_context=options.get("simulator_context"),
+        headless=options.get("headless", True), log_iterations=options.get("log_iterations", False))
+
+    async def report():
+        while True:
+            await asyncio.sleep(options.get("report_interval", 1.0))
+            reports.put((index, incarnation, host.summary()))
+
+    async def main():
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, host.stop)
+        reporter = asyncio.ensure_future(report())
+        try:
+            summary = await host.run()
+        finally:
+            reporter.cancel()
+        reports.put((index, incarnation, summary))
+
+    asyncio.run(main())
+
+
+@dataclass
+class Worker:
+    """A worker process of the supervisor and its restarts"""
+    index: int
+    process: Optional[multiprocessing.Process] = None
+    incarnation: int = -1
+    started: float = 0.0
+    # crashes in a row, and the time the worker is restarted at after a crash
+    crashes: int = 0
+    restart_at: Optional[float] = None
+    finished: bool = False
+    # latest counters reported by each incarnation of the worker
+    reports: Dict[int, Dict] = field(default_factory=dict)
+
+
+class Supervisor:
+    """Start, watch and restart worker processes
+
+    Parameters
+    ----------
+    num_instances : int
+        number of worker processes
+    options : Dict
+        options passed on to the workers, see run_worker
+    target : Callable, optional
+        function run by the workers with the arguments of run_worker, by default run_worker
+    backoff : float, optional
+        seconds before restarting a worker after its first crash in a row, doubled with every other crash, by default 1
+    max_backoff : float, optional
+        longest delay before a restart, by default 60
+    stable_time : float, optional
+        seconds a worker has to run before its crashes in a row are forgotten, by default 60
+    """
+
+    def __init__(self, num_instances: int, options: Dict, target: Callable = run_worker, backoff: float = 1.0,
+                 max_backoff: float = 60.0, stable_time: float = 60.0):
+        # forked rather than spawned, the workers reuse the modules imported by the supervisor
+        methods = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        self.options = options
+        self.target = target
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stable_time = stable_time
+        self.workers = [Worker(index) for index in range(num_instances)]
+        self.reports = self.context.Queue()
+        self.restarts = 0
+        self.crashes = 0
+        self.started = None
+        self.stopping = False
+
+    def _start(self, worker: Worker):
+        worker.incarnation += 1
+        worker.started = time.monotonic()
+        worker.restart_at = None
+        worker.process = self.context.Process(target=self.target, name=f"simulator-{worker.index}",
+                                              args=(worker.index, worker.incarnation, self.options, self.reports),
+                                              daemon=True)
+        worker.process.start()
+
+    def start(self):
+        self.started = time.monotonic()
+        for worker in self.workers:
+            self._start(worker)
+
+    def _drain(self):
+        while True:
+            try:
+                index, incarnation, counters = self.reports.get_nowait()
+            except queues.Empty:
+                return
+            self.workers[index].reports[incarnation] = counters
+
+    def poll(self):
+        """Collect the reports of the workers and restart the ones that crashed once their delay is over"""
+        self._drain()
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.finished or self.stopping:
+                continue
+            if worker.restart_at is not None:
+                if now >= worker.restart_at:
+                    self.restarts += 1
+                    self._start(worker)
+                continue
+            if worker.process.is_alive():
+                continue
+            worker.process.join()
+            if worker.process.exitcode == 0:
+                # the sessions of the worker ended on their own
+                worker.finished = True
+                continue
+            self.crashes += 1
+            if now - worker.started >= self.stable_time:
+                worker.crashes = 0
+            worker.crashes += 1
+            delay = restart_delay(worker.crashes, self.backoff, self.max_backoff)
+            print(f"worker {worker.index} exited with code {worker.process.exitcode}, "
+                  f"restarting it in {delay:.1f} s")
+            worker.restart_at = now + delay
+
+    def summary(self) -> Dict:
+        """Counters of all the workers, with the steps per second since the start"""
+        totals = {name: sum(counters.get(name, 0) for worker in self.workers for counters in worker.reports.values())
+                  for name in COUNTERS}
+        wall_time = time.monotonic() - self.started if self.started is not None else 0.0
+        totals.update(
+            instances=len(self.workers),
+            alive=sum(worker.process is not None and worker.process.is_alive() for worker in self.workers),
+            crashes=self.crashes, restarts=self.restarts, wall_time=wall_time,
+            steps_per_second=totals["steps"] / wall_time if wall_time > 0 else 0.0)
+        return totals
+
+    def stop(self, timeout: float = 10.0):
+        """Ask the workers to unregister their sessions and exit, kill the ones that do not in time"""
+        self.stopping = True
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join(max(deadline - time.monotonic(), 0))
+                if worker.process.is_alive():
+                    worker.process.kill()
+                    worker.process.join()
+        self._drain()
+
+    def run(self, duration: Optional[float] = None, max_steps: Optional[int] = None, poll_interval: float = 0.2,
+            status_interval: Optional[float] = 10.0) -> Dict:
+        """Run the workers for duration seconds, until max_steps steps in total, or until interrupted
+
+        Returns
+        -------
+        Dict
+            summary of all the workers, see summary
+        """
+        self.start()
+        last_status, last_steps = time.monotonic(), 0
+        try:
+            while not all(worker.finished for worker in self.workers):
+                time.sleep(poll_interval)
+                self.poll()
+                now = time.monotonic()
+                summary = self.summary()
+                if status_interval is not None and now - last_status >= status_interval:
+                    rate = (summary["steps"] - last_steps) / (now - last_status)
+                    print(f"[{time.strftime('%H:%M:%S')}] {summary['alive']}/{summary['instances']} workers alive, "
+                          f"{summary['steps']} steps ({rate:.1f} steps/s), {summary['errors']} errors, "
+                          f"{summary['crashes']} crashes")
+                    last_status, last_steps = now, summary["steps"]
+                if duration is not None and now - self.started >= duration:
+                    break
+                if max_steps is not None and summary["steps"] >= max_steps:
+                    break
+        except KeyboardInterrupt:
+            print("Stopping the workers...")
+        finally:
+            self.stop()
+        return self.summary()
+
+
+def _serve_fake(connection, server_options: Dict):
+    """Process running a FakeBonsaiServer, its url is sent on the connection"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    async def serve():
+        server = await async_host.FakeBonsaiServer(**server_options).start()
+        connection.send(server.url)
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def start_fake_server(**server_options):
+    """Start a FakeBonsaiServer in its own process, returns the process and the url of the server"""
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_serve_fake, args=(sender, server_options), name="fake-bonsai", daemon=True)
+    process.start()
+    return process, receiver.recv()
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run many simulator instances in supervised worker processes")
+    parser.add_argument("--num-instances", type=int, default=os.cpu_count(),
+                        help="number of worker processes, by default one per CPU")
+    parser.add_argument("--sessions-per-instance", type=int, default=1,
+                        help="simulator sessions run concurrently by each worker, see async_host.py")
+    parser.add_argument("--duration", type=float, default=None, help="seconds to run for, by default until interrupted")
+    parser.add_argument("--max-steps", type=int, default=None, help="steps of all the workers to stop after")
+    parser.add_argument("--backoff", type=float, default=1.0,
+                        help="seconds before restarting a crashed worker, doubled with every crash in a row")
+    parser.add_argument("--max-backoff", type=float, default=60.0, help="longest delay before a restart")
+    parser.add_argument("--status-interval", type=float, default=10.0, help="seconds between two status lines")
+    parser.add_argument("--headless", action="store_true", default=False,
+                        help="Run the simulators without printing states, actions and simulation events")
+    parser.add_argument("--log-iterations", action="store_true", default=False,
+                        help="Log the iterations of each session to its own file")
+    parser.add_argument("--workspace", type=str, default=None, help="your workspace id, by default SIM_WORKSPACE")
+    parser.add_argument("--accesskey", type=str, default=None, help="your access key, by default SIM_ACCESS_KEY")
+    parser.add_argument("--server", type=str, default=None,
+                        help=f"url of the platform, by default SIM_API_HOST or {async_host.DEFAULT_SERVER}")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for a response of the platform")
+    parser.add_argument("--fake-server", action="store_true", default=False,
+                        help="Run against a local fake advance endpoint instead of the platform")
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="latency of the fake endpoint in seconds")
+    parser.add_argument("--fake-steps", type=int, default=100, help="steps per episode of the fake endpoint")
+
+    args = parser.parse_args()
+
+    fake_server = None
+    if args.fake_server:
+        fake_server, server = start_fake_server(latency=args.fake_latency, steps_per_episode=args.fake_steps)
+        workspace, access_key = "fake-workspace", "fake-key"
+    else:
+        workspace = args.workspace or os.environ.get("SIM_WORKSPACE")
+        access_key = args.accesskey or os.environ.get("SIM_ACCESS_KEY")
+        if not (workspace and access_key):
+            parser.error("a workspace and an access key are needed, from the command line or from "
+                         "SIM_WORKSPACE and SIM_ACCESS_KEY")
+        server = args.server or os.environ.get("SIM_API_HOST", async_host.DEFAULT_SERVER)
+
+    options = {
+        "server": server,
+        "workspace": workspace,
+        "access_key": access_key,
+        "simulator_context": os.environ.get("SIM_CONTEXT"),
+        "sessions": args.sessions_per_instance,
+        "timeout": args.timeout,
+        "headless": args.headless,
+        "log_iterations": args.log_iterations,
+    }
+    supervisor = Supervisor(args.num_instances, options, backoff=args.backoff, max_backoff=args.max_backoff)
+    summary = supervisor.run(duration=args.duration, max_steps=args.max_steps, status_interval=args.status_interval)
+    if fake_server is not None:
+        fake_server.terminate()
+    print(f"{summary['instances']} workers, {summary['steps']} steps, {summary['episodes']} episodes, "
+          f"{summary['errors']} errors, {summary['crashes']} crashes, {summary['restarts']} restarts "
+          f"in {summary['wall_time']:.1f} s: {summary['steps_per_second']:.1f} steps/s")
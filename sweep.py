@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""
+Design-of-experiments sweep of the line parameters
+
+Expands parameter ranges into episode configs for DES.reset, e.g. to find the number
+of bins per conveyor or the positions of the prox sensors that maximize throughput,
+and runs every point of the design for every policy and replicate on a pool of worker
+processes. Parameters are given as name=values, where values are either a list of
+values, e.g. num_conveyor_bins=5,10,20, or a range low:high, e.g. infeedProx_index2=1:5.
+Ranges of integers give integers. The designs are:
+    grid: every combination of the values, ranges are split into --levels evenly spaced values
+    random: --points points drawn uniformly from the values and ranges
+    lhs: --points points of a latin hypercube, every parameter covers its values or range evenly
+
+Replicate r of every point runs with the same seed, so that points are compared on the same
+random downtime events. Results are appended to a tidy csv table, one row per point, policy and
+replicate, as soon as they are done. Running the same command again skips the rows already in
+the table, so an interrupted sweep resumes where it stopped. Points whose config is invalid,
+e.g. a prox sensor beyond the last bin, get a row with the error instead of their kpis. With a
+cache directory, runs that an earlier sweep or assessment already simulated are read from the
+episode cache, see episode_cache.py.
+
+Usage:
+    python sweep.py --param num_conveyor_bins=5,10,20 --param infeedProx_index2=1:5 --design grid --levels 5 --replicates 3 --output logs/sweep.csv
+    python sweep.py --param bin_maximum_capacity=50:150 --param dischargeProx_index2=0:4 --design lhs --points 1000 --engine vectorized --workers 32 --output logs/sweep.csv
+"""
+
+import concurrent.futures
+import csv
+import hashlib
+import itertools
+import json
+import os
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+ASSESSMENT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assessments",
+                          "three_random_machine_down.json")
+
+DESIGNS = ("grid", "random", "lhs")
+
+# derived parameters of SimConfig -> parameters they are derived from. A derived parameter of the
+# base config no longer matches once one of these is swept, so it is dropped and derived again
+DERIVED = {
+    "conveyor_capacity": ("bin_maximum_capacity", "num_conveyor_bins"),
+    "num_products_at_infeed_index1": ("infeedProx_index1", "bin_maximum_capacity", "infeed_prox_lower_limit"),
+    "num_products_at_infeed_index2": ("infeedProx_index2", "bin_maximum_capacity", "infeed_prox_upper_limit"),
+    "num_products_at_discharge_index1": ("num_conveyor_bins", "dischargeProx_index1", "bin_maximum_capacity",
+                                         "discharge_prox_lower_limit"),
+    "num_products_at_discharge_index2": ("num_conveyor_bins", "dischargeProx_index2", "bin_maximum_capacity",
+                                         "discharge_prox_upper_limit"),
+}
+
+KPIS = ("env_time", "sink_throughput_absolute_sum", "throughput_per_second", "illegal_machine_actions",
+        "cached", "wall_time", "error")
+
+
+def parse_parameter(text: str) -> Tuple[str, Dict]:
+    """Parse a parameter given as name=v1,v2,... or name=low:high
+
+    Returns
+    -------
+    Tuple[str, Dict]
+        name of the parameter and its spec, {"values": [...]} or {"low": ..., "high": ..., "integer": bool}
+    """
+    name, sep, values = text.partition("=")
+    if not sep or not name or not values:
+        raise ValueError(f"parameters should be given as name=v1,v2,... or name=low:high, got {text}")
+    if ":" in values:
+        low, high = (json.loads(value) for value in values.split(":"))
+        if low > high:
+            raise ValueError(f"the range of {name} should be low:high, got {values}")
+        return name, {"low": low, "high": high, "integer": isinstance(low, int) and isinstance(high, int)}
+    return name, {"values": [json.loads(value) for value in values.split(",")]}
+
+
+def _levels(spec: Dict, levels: int) -> List:
+    if "values" in spec:
+        return list(spec["values"])
+    values = np.linspace(spec["low"], spec["high"], levels)
+    if spec["integer"]:
+        # rounding can give the same integer twice on short ranges
+        return sorted({int(round(value)) for value in values})
+    return values.tolist()
+
+
+def _scale(spec: Dict, u: np.ndarray) -> List:
+    '''
+    map uniform samples in [0, 1) to the values or range of a parameter
+    '''
+    if "values" in spec:
+        return [spec["values"][i] for i in (u * len(spec["values"])).astype(int)]
+    if spec["integer"]:
+        # every integer of the range gets the same share of [0, 1)
+        return (spec["low"] + u * (spec["high"] - spec["low"] + 1)).astype(int).tolist()
+    return (spec["low"] + u * (spec["high"] - spec["low"])).tolist()
+
+
+def latin_hypercube(num_points: int, num_dimensions: int, rng: np.random.Generator) -> np.ndarray:
+    '''
+    num_points samples in [0, 1)^num_dimensions, every dimension has exactly one sample in each of its num_points strata
+    '''
+    strata = np.argsort(rng.random((num_dimensions, num_points)), axis=1).T
+    return (strata + rng.random((num_points, num_dimensions))) / num_points
+
+
+def make_design(parameters: Dict[str, Dict], design: str = "grid", num_points: int = 100, levels: int = 3,
+                seed: int = 0) -> List[Dict]:
+    """Expand parameter specs into the points of a design
+
+    Parameters
+    ----------
+    parameters : Dict[str, Dict]
+        parameter name -> spec from parse_parameter
+    design : str, optional
+        grid, random or lhs, by default grid
+    num_points : int, optional
+        number of points of the random and lhs designs, by default 100
+    levels : int, optional
+        number of values ranges are split into on a grid, by default 3
+    seed : int, optional
+        seed of the random and lhs designs, the same seed gives the same points, by default 0
+
+    Returns
+    -------
+    List[Dict]
+        parameter name -> value of every point
+    """
+    names = list(parameters)
+    if design == "grid":
+        values = [_levels(parameters[name], levels) for name in names]
+        return [dict(zip(names, point)) for point in itertools.product(*values)]
+    if design not in DESIGNS:
+        raise ValueError(f"unknown design: {design}, available designs: {', '.join(DESIGNS)}")
+    rng = np.random.default_rng(seed)
+    if design == "random":
+        samples = rng.random((num_points, len(names)))
+    else:
+        samples = latin_hypercube(num_points, len(names), rng)
+    columns = [_scale(parameters[name], samples[:, dim]) for dim, name in enumerate(names)]
+    return [dict(zip(names, point)) for point in zip(*columns)]
+
+
+def point_config(base_config: Dict, point: Dict) -> Dict:
+    '''
+    episode config for DES.reset with the parameters of a point, derived parameters of the base config that depend on
+    the point are left for SimConfig to derive again
+    '''
+    config = {key: value for key, value in base_config.items()
+              if not (key in DERIVED and key not in point and set(DERIVED[key]) & set(point))}
+    config.update(point)
+    return config
+
+
+def replicate_seed(seed: int, replicate: int) -> int:
+    """Seed of a replicate, shared by every point and policy of the sweep"""
+    return int(np.random.SeedSequence([seed, replicate]).generate_state(1)[0])
+
+
+def run_id(config: Dict, policy: str, seed: int, num_iterations: int) -> str:
+    '''
+    key of a run in the results table, the same run always gets the same key
+    '''
+    key = json.dumps({"config": config, "policy": policy, "seed": seed, "iterations": num_iterations},
+                     sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def make_jobs(points: List[Dict], base_config: Dict, policy_specs: List[str], replicates: int = 1,
+              num_iterations: int = 300, seed: int = 0) -> List[Dict]:
+    """List the runs of a sweep: every point for every policy and replicate"""
+    from assessment_runner import get_policy
+
+    jobs = []
+    for policy_spec in policy_specs:
+        get_policy(policy_spec)  # fail early on unknown policies
+    for index, point in enumerate(points):
+        config = point_config(base_config, point)
+        for policy_spec in policy_specs:
+            for replicate in range(replicates):
+                job_seed = replicate_seed(seed, replicate)
+                jobs.append({
+                    "run_id": run_id(config, policy_spec, job_seed, num_iterations),
+                    "point": index,
+                    "parameters": point,
+                    "assessment": "sweep",
+                    "policy": policy_spec,
+                    "episode": replicate,
+                    "config": config,
+                    "num_iterations": num_iterations,
+                    "seed": job_seed,
+                    "log_iterations": False,
+                })
+    return jobs
+
+
+def run_job(job: Dict, cache=None) -> Dict:
+    """Run a single point of the sweep, reading it from the EpisodeCache cache if it ran before
+
+    Returns
+    -------
+    Dict
+        row of the results table, with the error instead of the kpis if the simulator failed on the point
+    """
+    from assessment_runner import run_episode
+
+    row = {"run_id": job["run_id"], "point": job["point"], "policy": job["policy"], "replicate": job["episode"],
+           "seed": job["seed"], "iterations": job["num_iterations"]}
+    row.update(job["parameters"])
+    try:
+        kpis = run_episode(job, cache)["kpis"]
+    except Exception as err:
+        row["error"] = f"{type(err).__name__}: {err}"
+        return row
+    row.update({key: kpis[key] for key in ("env_time", "sink_throughput_absolute_sum",
+                                           "illegal_machine_actions", "cached", "wall_time")})
+    row["throughput_per_second"] = kpis["sink_throughput_absolute_sum"] / kpis["env_time"] if kpis["env_time"] else 0.0
+    return row
+
+
+def completed_runs(path: str) -> set:
+    '''
+    run ids already in a results table, rows cut off by an interruption are ignored
+    '''
+    if not os.path.exists(path):
+        return set()
+    with open(path, newline="") as fname:
+        return {row["run_id"] for row in csv.DictReader(fname) if row.get("wall_time") or row.get("error")}
+
+
+def run_sweep(jobs: List[Dict], output: str, num_workers: int = None, headless: bool = False, cache=None) -> int:
+    """Run the jobs that are not in the results table yet and append their rows as they finish
+
+    Parameters
+    ----------
+    jobs : List[Dict]
+        jobs from make_jobs
+    output : str
+        csv results table, created if it does not exist
+    num_workers : int, optional
+        number of worker processes, by default os.cpu_count(). 1 runs in the current process
+    headless : bool, optional
+        do not report the progress, by default False
+    cache : EpisodeCache, optional
+        cache of the episode results shared by the workers, by default None
+
+    Returns
+    -------
+    int
+        number of jobs that ran
+    """
+    done = completed_runs(output)
+    pending = [job for job in jobs if job["run_id"] not in done]
+    if not headless and done:
+        print(f"resuming: {len(jobs) - len(pending)} of {len(jobs)} runs already in {output}")
+    names = list(dict.fromkeys(name for job in jobs for name in job["parameters"]))
+    columns = ["run_id", "point", "policy", "replicate", "seed", "iterations"] + names + list(KPIS)
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    new_file = not os.path.exists(output) or os.path.getsize(output) == 0
+    if not new_file:
+        with open(output, newline="") as fname:
+            header = next(csv.reader(fname), [])
+        if header != columns:
+            raise ValueError(f"{output} has the columns {header}, this sweep writes {columns}")
+        with open(output, "rb+") as fname:
+            fname.seek(-1, os.SEEK_END)
+            if fname.read(1) != b"\n":
+                # the last row was cut off by an interruption, it is ignored and written again
+                fname.write(b"\n")
+
+    start = time.perf_counter()
+    with open(output, "a", newline="") as fname:
+        writer = csv.DictWriter(fname, fieldnames=columns)
+        if new_file:
+            writer.writeheader()
+
+        def write(row, count):
+            writer.writerow(row)
+            # flushed row by row so that an interrupted sweep keeps every finished run
+            fname.flush()
+            if not headless and (count % 100 == 0 or count == len(pending)):
+                elapsed = time.perf_counter() - start
+                print(f"{count}/{len(pending)} runs in {elapsed:.0f} s, "
+                      f"{elapsed / count * (len(pending) - count):.0f} s left")
+
+        num_workers = num_workers or os.cpu_count() or 1
+        if num_workers == 1:
+            for count, job in enumerate(pending, 1):
+                write(run_job(job, cache), count)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+                futures = [executor.submit(run_job, job, cache) for job in pending]
+                for count, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                    write(future.result(), count)
+    return len(pending)
+
+
+def summarize(path: str, top: int = 10):
+    '''
+    mean and standard deviation of the throughput over the replicates of each point and policy, best points first
+    '''
+    import pandas as pd
+    results = pd.read_csv(path)
+    if "error" in results:
+        results = results[results["error"].isna()]
+    parameters = [c for c in results.columns if c not in
+                  ("run_id", "replicate", "seed", "iterations") + KPIS]
+    summary = results.groupby(parameters)["sink_throughput_absolute_sum"].agg(["mean", "std", "count"])
+    return summary.sort_values("mean", ascending=False).head(top)
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sweep line parameters over a design of experiments")
+    parser.add_argument(
+        "--param", type=str, action="append", default=[], required=True,
+        help="swept parameter as name=v1,v2,... or name=low:high, can be repeated",
+    )
+    parser.add_argument("--design", type=str, choices=DESIGNS, default="grid")
+    parser.add_argument("--points", type=int, default=100, help="number of points of the random and lhs designs")
+    parser.add_argument("--levels", type=int, default=3, help="values per range on a grid")
+    parser.add_argument(
+        "--base-config", type=str, default=ASSESSMENT,
+        help="assessment json file the swept parameters are applied to, by default "
+             "assessments/three_random_machine_down.json",
+    )
+    parser.add_argument("--episode", type=int, default=0, help="episode of the base config file")
+    parser.add_argument(
+        "--engine", type=str, default=None,
+        help="engine of the simulator (loop, vectorized, analytic), by default the one of the base config",
+    )
+    parser.add_argument("--policies", type=str, nargs="+", default=["heuristic"],
+                        help="policies from policies.py or exported brain urls")
+    parser.add_argument("--replicates", type=int, default=3, help="seeds every point runs with")
+    parser.add_argument("--iteration-limit", type=int, default=300, help="iterations per run")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the design and of the replicates")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes, by default one per cpu")
+    parser.add_argument("--output", type=str, default=os.path.join("logs", "sweep.csv"),
+                        help="csv results table, an existing table is resumed")
+    parser.add_argument("--cache-dir", type=str, default=None,
+                        help="directory of the episode cache shared with the assessment runner")
+    parser.add_argument("--cache-size-mb", type=int, default=1024, help="size of the episode cache")
+
+    args = parser.parse_args()
+
+    parameters = dict(parse_parameter(text) for text in args.param)
+    with open(args.base_config) as fname:
+        base_config = json.load(fname)["episodeConfigurations"][args.episode]
+    if args.engine:
+        base_config = dict(base_config, engine=args.engine)
+
+    points = make_design(parameters, args.design, args.points, args.levels, args.seed)
+    jobs = make_jobs(points, base_config, args.policies, args.replicates, args.iteration_limit, args.seed)
+    print(f"{len(points)} points x {len(args.policies)} policies x {args.replicates} replicates = {len(jobs)} runs")
+
+    cache = None
+    if args.cache_dir:
+        from episode_cache import EpisodeCache
+        cache = EpisodeCache(args.cache_dir, max_bytes=args.cache_size_mb * 2**20)
+
+    start = time.perf_counter()
+    count = run_sweep(jobs, args.output, args.workers, cache=cache)
+    print(f"ran {count} runs in {time.perf_counter() - start:.1f} s, results in {args.output}")
+    print(summarize(args.output).to_string())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# make the simulator package and the integration modules importable from the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
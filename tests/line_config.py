@@ -25,7 +25,7 @@ adj = {
 }
 
 con_balance  = [('c1','c6', 4)]   # balancing load between two conveyors, the last number indicates where cans are added. Use same for both  
-con_join =  [['c8','c3', 4]]   # adding the load from first one on to the second conveyor, the last number indicates the joining on the second conveyor's bin from the last bin of the first conveyor. 
+con_join =  [('c8','c3', 4)]   # adding the load from first one on to the second conveyor, the last number indicates the joining on the second conveyor's bin from the last bin of the first conveyor. 
 
 def plot():
     pass
@@ -0,0 +1,100 @@
+'''
+DES.advance should run the events until a condition or a time horizon, the same way with both schedulers and all the
+engines
+'''
+import json
+import os
+import numpy as np
+import pytest
+import simpy
+from sim import manufacturing_env as MLS
+from sim.advance import any_downtime, any_of, machine_down, machines_down, prox_change
+from policies import heuristic_policy
+from test_engines import base_config
+
+ENGINES = ["loop", "vectorized", "analytic"]
+# episodes where the analytic engine jumps over many time steps with control type 1
+MACHINE_DOWN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            "assessments", "machine_10_down.json")
+
+
+def episode(scheduler, control_type=0, engine="loop", config=None):
+    des = MLS.DES(simpy.Environment(), headless=True)
+    des.reset(dict(config or base_config(), scheduler=scheduler, control_type=control_type, engine=engine, seed=4))
+    des.step(heuristic_policy(des.get_states()))
+    return des
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("scheduler", ["simpy", "heap"])
+def test_advance_until_a_downtime(scheduler, engine):
+    des = episode(scheduler, engine=engine)
+    count = des.downtime_count
+    result = des.advance(any_downtime)
+    assert result.reason == "condition" and result.events > 1 and result.wall_time > 0
+    assert des.downtime_count == count + 1 and des.machine_states[des.down_machine_no] == -1
+    assert result.time == des.now and result.elapsed > des.config.control_frequency
+
+
+@pytest.mark.parametrize("scheduler", ["simpy", "heap"])
+def test_advance_until_a_machine_goes_down(scheduler):
+    des = episode(scheduler)
+    result = des.advance(machine_down("m3"), horizon=100000)
+    assert result.reason == "condition" and des.down_machine_no == 3
+    assert des.downtime_event_times_history[-1] == des.now
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("scheduler", ["simpy", "heap"])
+def test_advance_to_the_horizon(scheduler, engine):
+    des = episode(scheduler, engine=engine)
+    start = des.now
+    all_down = machines_down(len(des.machine_list))
+    result = des.advance(all_down, horizon=25)
+    assert result.reason == "horizon" and start + 24 <= des.now <= start + 25
+    result = des.advance(all_down, max_events=3)
+    assert result.reason == "max_events" and result.events == 3
+
+
+def test_advance_until_a_prox_changes():
+    des = episode("heap", control_type=1)
+    before = des.prox_states()
+    result = des.advance(any_of(prox_change, machines_down(3)))
+    assert result.reason == "condition"
+    assert (des.prox_states() != before).any() or (des.machine_states == -1).sum() >= 3
+    states = des.get_states()
+    assert states["conveyor_discharge_p1_prox_full"] == des.prox_states()[2].astype(int).tolist()
+
+
+def test_schedulers_advance_alike():
+    results = []
+    for scheduler in ("simpy", "heap"):
+        des = episode(scheduler, control_type=2)
+        runs = [des.advance(condition, horizon=300) for condition in (prox_change, any_downtime, None)]
+        results.append([(r.reason, r.time, r.events) for r in runs] + [des.get_states()["conveyor_buffers"]])
+    assert results[0] == results[1]
+    assert np.isfinite(results[0][0][1])
+
+
+def sink_gain(amount):
+    # a condition that can start to hold between two events
+    def condition(des):
+        start = sum(sink.product_count for sink in des.sink_table)
+        return lambda: sum(sink.product_count for sink in des.sink_table) >= start + amount
+    return condition
+
+
+@pytest.mark.parametrize("scheduler", ["simpy", "heap"])
+@pytest.mark.parametrize("control_type", [-1, 1])
+def test_engines_stop_alike(scheduler, control_type):
+    with open(MACHINE_DOWN) as fname:
+        config = json.load(fname)["episodeConfigurations"][0]
+    plan = [(prox_change, 500)] * 4 + [(sink_gain(200), None), (None, 17), (any_downtime, 30)] * 3
+    stops = {}
+    for engine in ENGINES:
+        des = episode(scheduler, control_type, engine, config)
+        stops[engine] = []
+        for condition, horizon in plan:
+            result = des.advance(condition, horizon=horizon)
+            stops[engine].append((result.reason, result.time, des.get_states()["conveyor_buffers"]))
+    assert stops["analytic"] == stops["vectorized"] == stops["loop"]
@@ -0,0 +1,56 @@
+'''
+the assessment runner should give the same kpis and logs whatever the number of workers
+'''
+import os
+import pytest
+import simpy
+import policies
+from sim import manufacturing_env as MLS
+from assessment_runner import get_policy, make_jobs, run_assessments, run_episode
+
+ASSESSMENTS = os.path.join(os.path.dirname(__file__), os.pardir, "assessments")
+
+
+def test_results_do_not_depend_on_the_number_of_workers(tmp_path):
+    files = [os.path.join(ASSESSMENTS, name) for name in ("machine_0_down.json", "three_random_machine_down.json")]
+    runs = []
+    for num_workers in (1, 3):
+        log_file = str(tmp_path / f"log_{num_workers}.csv")
+        kpis = run_assessments(files, ["random", "heuristic"], num_iterations=100,
+                               num_workers=num_workers, seed=3, log_file=log_file)
+        for kpi in kpis:
+            kpi.pop("wall_time")
+        with open(log_file) as log, open(log_file.replace(".csv", "_config.csv")) as config_log:
+            runs.append((kpis, log.read(), config_log.read()))
+    assert runs[0] == runs[1]
+    kpis, log, config_log = runs[0]
+    assert [(k["assessment"], k["policy"]) for k in kpis[:2]] == [("machine_0_down.json", "random")] * 2
+    assert len(log.splitlines()) == 1 + len(kpis) * 101
+    assert len(config_log.splitlines()) == 1 + len(kpis)
+
+
+def test_seed_changes_random_episodes():
+    files = [os.path.join(ASSESSMENTS, "three_random_machine_down.json")]
+    throughputs = []
+    for seed in (0, 1):
+        kpis = run_assessments(files, ["random"], num_iterations=100, num_workers=1, seed=seed)
+        throughputs.append([k["sink_throughput_absolute_sum"] for k in kpis])
+    assert throughputs[0] != throughputs[1]
+
+
+def test_seed_gives_the_episode_of_the_seeded_config():
+    job = make_jobs([os.path.join(ASSESSMENTS, "three_random_machine_down.json")], ["random"], num_iterations=40,
+                    seed=5)[1]
+    des = MLS.DES(simpy.Environment(), headless=True)
+    des.reset(dict(job["config"], seed=job["seed"]))
+    policy = policies.with_rng(policies.random_policy, des.policy_rng)
+    for _ in range(job["num_iterations"]):
+        des.step(policy(des.get_states()))
+    assert run_episode(job)["kpis"]["sink_throughput_absolute_sum"] == des.get_states()["sink_throughput_absolute_sum"]
+
+
+def test_get_policy():
+    assert get_policy("bottleneck") is policies.max_bottleneck_policy
+    assert get_policy("http://localhost:5000").keywords == {"exported_brain_url": "http://localhost:5000"}
+    with pytest.raises(ValueError):
+        get_policy("brain")
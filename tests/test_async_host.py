@@ -0,0 +1,89 @@
+'''
+The asyncio host should run many sessions against the advance endpoint at once, re-registering the ones that fail
+'''
+import asyncio
+import json
+import os
+from async_host import (BonsaiSessionClient, FakeBonsaiServer, JsonConnection, SimulatorHost, read_message,
+                        run_fake)
+
+INTERFACE = os.path.join(os.path.dirname(__file__), os.pardir, "interface.json")
+
+
+def test_sessions_play_episodes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    summary = asyncio.run(run_fake(4, max_steps=120, steps_per_episode=20, idle_every=9, idle_time=0.001))
+    assert summary["steps"] >= 120 and summary["episodes"] >= 4 and summary["idles"] > 0
+    assert summary["errors"] == summary["sequence_errors"] == 0
+    assert summary["unregistered"] == summary["registrations"] == 4
+
+
+def test_advance_calls_overlap(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    latency, num_steps = 0.05, 80
+    summary = asyncio.run(run_fake(8, max_steps=num_steps, latency=latency, steps_per_episode=50))
+    # one session at a time would wait on every request
+    assert summary["wall_time"] < 0.5 * summary["requests"] * latency
+
+
+class FlakyServer(FakeBonsaiServer):
+    '''
+    fails the first advance calls
+    '''
+    failures = 2
+
+    async def _route(self, method, path, body):
+        if path.endswith("/advance") and self.failures:
+            self.failures -= 1
+            return 503, {"error": "busy"}
+        return await super()._route(method, path, body)
+
+
+def test_failed_sessions_register_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def run():
+        server = await FlakyServer(steps_per_episode=5).start()
+        with open(INTERFACE) as file:
+            interface = json.load(file)
+        host = SimulatorHost(lambda: BonsaiSessionClient(server.url, "workspace", "key"), 2, interface)
+        summary = await host.run(max_steps=20)
+        await server.close()
+        return summary
+
+    summary = asyncio.run(run())
+    assert summary["errors"] == 2 and summary["registrations"] == 4 and summary["steps"] >= 20
+
+
+def test_read_chunked_message():
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+                         b"4\r\n{\"a\"\r\n3\r\n: 1\r\n1\r\n}\r\n0\r\n\r\n")
+        return await read_message(reader)
+
+    status, headers, body = asyncio.run(read())
+    assert status == "HTTP/1.1 200 OK" and json.loads(body) == {"a": 1}
+
+
+def test_response_without_length_is_read_to_the_end():
+    async def handle(reader, writer):
+        await read_message(reader)
+        # neither Content-Length nor chunked encoding, the body ends with the connection
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: close\r\n\r\n"
+                     b"{\"sequenceId\": 2}")
+        await writer.drain()
+        writer.close()
+
+    async def request():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        connection = JsonConnection(f"http://127.0.0.1:{port}")
+        try:
+            return [await connection.request("POST", "/advance", {"sequenceId": 1}) for _ in range(2)]
+        finally:
+            await connection.close()
+            server.close()
+            await server.wait_closed()
+
+    assert asyncio.run(request()) == [{"sequenceId": 2}] * 2
@@ -0,0 +1,43 @@
+'''
+the benchmark should report every metric per case and flag regressions against a baseline
+'''
+import json
+
+from benchmark import ASSESSMENT, METRICS, compare, make_cases, run_benchmarks, run_case, speedups
+
+
+def test_run_benchmarks():
+    cases = make_cases([0, 2], [10], [12], ["heuristic"], ["loop"])
+    results = run_benchmarks(cases, num_steps=20, num_resets=5)
+    assert [(r["control_type"], r["line_length"]) for r in results] == [(0, 12), (2, 12)]
+    for result in results:
+        assert "error" not in result
+        assert all(result[metric] > 0 for metric in METRICS)
+        assert result["step_p99_ms"] >= result["step_p50_ms"]
+
+
+def test_line_lengths_run_in_the_same_process():
+    with open(ASSESSMENT) as fname:
+        config = json.load(fname)["episodeConfigurations"][0]
+    for case in make_cases([0], [10], [6, 30], ["heuristic"], ["vectorized"]):
+        result = run_case(case, config, num_steps=10, num_resets=2)
+        assert "error" not in result and result["sim_seconds"] > 0
+
+
+def test_compare():
+    case = make_cases([0], [10], [12], ["heuristic"], ["loop"])[0]
+    baseline = [dict(case, **{metric: 1.0 for metric in METRICS})]
+    result = dict(baseline[0], sim_seconds_per_wall_second=0.5, step_p50_ms=1.05, peak_memory_kb=2.0)
+    rows = {row["metric"]: row for row in compare([result], baseline, tolerance=0.1)}
+    assert set(rows) == set(METRICS)
+    assert {metric for metric, row in rows.items() if row["regression"]} == {"sim_seconds_per_wall_second",
+                                                                             "peak_memory_kb"}
+    assert compare([dict(result, error="ValueError")], baseline) == []
+
+
+def test_speedups():
+    loop, vectorized = make_cases([0], [10], [12, 500], ["heuristic"], ["loop", "vectorized"])[:2]
+    results = [dict(loop, sim_seconds_per_wall_second=2000.0), dict(vectorized, sim_seconds_per_wall_second=3000.0)]
+    rows = speedups(results)
+    assert [(row["engine"], row["speedup"], row["target_met"]) for row in rows] == [("vectorized", 1.5, False)]
+    assert speedups(results + [dict(vectorized, line_length=500, sim_seconds_per_wall_second=1.0)]) == rows
@@ -0,0 +1,43 @@
+'''
+The stand-in brain should answer predictions like an exported brain, and the load generator should measure it
+'''
+import pytest
+import requests
+import simpy
+from sim import manufacturing_env as MLS
+from brain_load import run_load
+from brain_server import BATCH_PATH, start_brain_server
+from policies import BrainClient, heuristic_policy
+
+
+@pytest.fixture(scope="module")
+def brain():
+    process, url = start_brain_server("heuristic", latency=0.001)
+    yield url
+    process.terminate()
+    process.join()
+
+
+def test_predictions_run_the_policy(brain):
+    des = MLS.DES(simpy.Environment(), headless=True)
+    des.reset({"seed": 3})
+    states = []
+    with BrainClient(brain, batch_path=BATCH_PATH) as client:
+        for _ in range(5):
+            states.append(des.get_states())
+            action = client.predict(states[-1])
+            assert action == heuristic_policy(states[-1])
+            des.step(action)
+        assert client.predict_many(states) == [heuristic_policy(state) for state in states]
+
+
+def test_bad_requests(brain):
+    assert requests.get(f"{brain}/v1/prediction", json={"machines_state": [1]}).status_code == 400
+    assert requests.get(f"{brain}/v2/clients").status_code == 404
+    assert requests.get(f"{brain}{BATCH_PATH}", json=[]).status_code == 405
+
+
+def test_load_generator(brain):
+    summary = run_load(brain, num_lines=3, steps=5)
+    assert summary["requests"] == 15 and summary["errors"] == 0
+    assert 0.001 <= summary["p50"] <= summary["p99"] <= summary["max"] and summary["requests_per_second"] > 0
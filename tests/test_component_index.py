@@ -0,0 +1,32 @@
+'''
+The component tables compiled from the line configuration should refer to the components of the simulator
+'''
+import simpy
+from sim import manufacturing_env as MLS
+from sim.line_config import adj, adj_conv
+from test_engines import base_config
+
+
+def test_component_tables_follow_reset():
+    des = MLS.DES(simpy.Environment())
+    des.reset(base_config())
+    for name, ind in des.machine_index.items():
+        assert des.machine_table[ind] is getattr(des, name)
+    for name, ind in des.conveyor_index.items():
+        assert des.conveyor_table[ind] is getattr(des, name)
+    for name, ind in des.sink_index.items():
+        assert des.sink_table[ind] is getattr(des, name)
+
+
+def test_topology():
+    des = MLS.DES(simpy.Environment())
+    for machine, (infeed, discharge) in adj.items():
+        ind = des.machine_index[machine]
+        assert des.machine_infeed[ind] == des.conveyor_index.get(infeed)
+        assert des.machine_discharge[ind] == des.conveyor_index.get(discharge)
+    for conveyor, (previous_machine, next_machine) in adj_conv.items():
+        ind = des.conveyor_index[conveyor]
+        assert des.machine_table[des.conveyor_upstream[ind]] is getattr(des, previous_machine)
+        assert des.machine_table[des.conveyor_downstream[ind]] is getattr(des, next_machine)
+    assert [MLS.General.machine_list[m] for m, _ in des.sink_feeders] == \
+        [machine for machine, (_, discharge) in adj.items() if 'sink' in discharge]
@@ -0,0 +1,43 @@
+'''
+Tests for the array-backed storage of the conveyor bins
+'''
+import simpy
+import numpy as np
+from sim import manufacturing_env as MLS
+
+
+def test_conveyors_are_views_over_line_arrays():
+    des = MLS.DES(simpy.Environment())
+    assert des.bin_levels.shape == (MLS.General.number_of_conveyors, MLS.General.num_conveyor_bins)
+    des.c2.bins[3] = 7
+    assert des.bin_levels[2, 3] == 7
+    des.previous_bin_levels[1, 0] = 4
+    assert des.c1.previous_bins[0] == 4
+
+
+def test_bin_attribute_compatibility_accessor():
+    des = MLS.DES(simpy.Environment())
+    des.c0.bin4 = 25
+    setattr(des.c0, "previous_bin_level9", 12)
+    assert des.bin_levels[0, 4] == 25
+    assert getattr(des.c0, "bin4") == 25
+    assert des.c0.previous_bin_level9 == 12
+    try:
+        des.c0.binx
+    except AttributeError:
+        pass
+    else:
+        raise AssertionError("unknown attributes should still raise AttributeError")
+
+
+def test_accumulation_fills_bins_from_right_to_left():
+    des = MLS.DES(simpy.Environment())
+    des.all_conveyor_levels = [250] * MLS.General.number_of_conveyors
+    for machine in MLS.General.machine_list:
+        getattr(des, machine).state = "idle"
+    des.accumulate_conveyor_bins()
+    capacity = des.c0.bins_capacity
+    expected = np.zeros(MLS.General.num_conveyor_bins)
+    expected[-2:] = capacity
+    expected[-3] = 250 - 2 * capacity
+    assert np.array_equal(des.bin_levels[0], expected)
@@ -0,0 +1,110 @@
+'''
+The downtime schedule should sample the downtime events of an episode ahead of the simulation, with machines drawn in
+proportion to their downtime probabilities, and DES and VectorDES should follow it
+'''
+import numpy as np
+import pytest
+import simpy
+from sim import manufacturing_env as MLS
+from sim.downtime import AliasTable, DowntimeSchedule, START, END
+from sim.trace import EventTrace
+from sim.vector_env import VectorDES
+from policies import heuristic_policy
+from test_engines import base_config
+
+
+def schedule(chunk=1000, seed=5, **config):
+    parameters = MLS.SimConfig.from_dict(base_config(**config), MLS.General.number_of_machines)
+    return DowntimeSchedule(parameters, np.random.default_rng(seed), chunk=chunk)
+
+
+# machine states after each step with two slots taking the first machine that is up down for its mean duration, as
+# simulated with one simpy process per slot before the downtime schedule, D for down
+TWO_SLOTS = dict(number_parallel_downtime_events=2, down_machine_index=0, interval_downtime_event_dev=0,
+                 downtime_event_duration_dev=[0] * 12, seed=1)
+EVENT_DRIVEN_STEPS = [(50, 'D11111111111'), (50, 'DD1111111111'), (81, 'D10000000000'), (82, 'DD2000000000'),
+                      (112, 'D00100000000'), (114, 'DD0020000000'), (143, 'D00001000000'), (146, 'DD0000200000'),
+                      (174, 'D00000010000'), (178, 'DD0000002000')]
+# both slots go down before the time step and the control event of the same second
+MIXED_STEPS = [(49, '111111111111', 5666.0), (50, 'D11111111111', 5666.0), (50, 'DD1111111111', 5666.0),
+               (50, 'DD1111111111', 5486.0), (51, 'DD1111111111', 5306.0), (52, 'DD0111111111', 5126.0)]
+
+
+def machine_states(des):
+    return ''.join('D' if state == -1 else str(state) for state in des.get_states()['machines_state'])
+
+
+@pytest.mark.parametrize("scheduler", ["simpy", "heap"])
+def test_simultaneous_slots_keep_the_order_of_the_simpy_processes(scheduler):
+    des = MLS.DES(simpy.Environment(), headless=True)
+    des.reset(dict(TWO_SLOTS, control_type=1, scheduler=scheduler))
+    steps = []
+    for _ in EVENT_DRIVEN_STEPS:
+        des.step(heuristic_policy(des.get_states()))
+        steps.append((des.now, machine_states(des)))
+    assert steps == EVENT_DRIVEN_STEPS
+
+    des.reset(dict(TWO_SLOTS, control_type=2, scheduler=scheduler))
+    steps = []
+    while des.now < 52:
+        des.step(heuristic_policy(des.get_states()))
+        if des.now >= 49:
+            steps.append((des.now, machine_states(des), round(sum(des.get_states()['conveyors_level']), 3)))
+    assert steps == MIXED_STEPS
+
+
+def test_alias_table_frequencies():
+    weights = np.array([0.5, 0.1, 0, 2.4, 1.0])
+    draws = AliasTable(weights).sample(np.random.default_rng(0), 200000)
+    frequencies = np.bincount(draws, minlength=len(weights)) / len(draws)
+    assert frequencies[2] == 0
+    assert np.allclose(frequencies, weights / weights.sum(), atol=0.01)
+
+
+def test_events_do_not_depend_on_the_chunk_size():
+    events = []
+    for chunk in (7, 1000):
+        timeline = schedule(chunk)
+        events.append([timeline.event(index) for index in range(300)])
+    assert events[0] == events[1]
+    assert [event[1] for event in events[0]].count(START) > 100
+
+
+def test_machines_go_down_once_at_a_time():
+    timeline = schedule(number_parallel_downtime_events=4)
+    timeline.extend(20000)
+    down = set()
+    for time, kind, machine in zip(timeline.times, timeline.kinds, timeline.machines):
+        if kind == START:
+            assert machine not in down
+            down.add(machine)
+        else:
+            assert kind == END
+            down.remove(machine)
+    assert timeline.times == sorted(timeline.times)
+    starts = timeline.starts()
+    assert set(starts) == {'time', 'machine', 'duration', 'slot'}
+    assert len(set(starts['slot'])) == 4
+
+
+def test_down_machine_index_skips_the_machines_that_are_down():
+    timeline = schedule(number_parallel_downtime_events=2, down_machine_index=0)
+    timeline.extend(5000)
+    starts = timeline.starts()
+    assert set(starts['machine'].tolist()) <= {0, 1, 2}
+    # the second slot takes down the first machine that is still up
+    assert starts['machine'][:2].tolist() == [0, 1]
+
+
+def test_vector_env_follows_the_des_schedule():
+    config = base_config(control_type=1, number_parallel_downtime_events=2, seed=4)
+    tracer = EventTrace(10000)
+    des = MLS.DES(simpy.Environment(), headless=True, tracer=tracer)
+    des.reset(config)
+    vsim = VectorDES([config])
+    for _ in range(30):
+        des.step(heuristic_policy(des.get_states()))
+        vsim.step([heuristic_policy(s) for s in vsim.get_episode_states()])
+    des_starts = [(event['time'], event['machine']) for event in tracer.events('downtime_start')]
+    vector_starts = [(time, machine) for time, machine, _ in list(vsim.downtime_machine_history[0])[3:]]
+    assert des_starts[-len(vector_starts):] == vector_starts
@@ -0,0 +1,106 @@
+'''
+The engines of the simulator should give the same trajectories as the default per-component engine
+'''
+import json
+import os
+import pytest
+import simpy
+from sim import manufacturing_env as MLS
+from policies import heuristic_policy, random_policy, with_rng
+
+ASSESSMENT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          "assessments", "three_random_machine_down.json")
+
+
+def base_config(**overrides):
+    with open(ASSESSMENT) as fname:
+        config = json.load(fname)["episodeConfigurations"][0]
+    config.update(overrides)
+    return config
+
+
+def run_episode(config, policy, num_steps=60, seed=3):
+    des = MLS.DES(simpy.Environment())
+    des.reset(dict(config, seed=seed))
+    policy = with_rng(policy, des.policy_rng)
+    des.step(heuristic_policy(des.get_states()))
+    trajectory = []
+    for _ in range(num_steps):
+        des.step(policy(des.get_states()))
+        trajectory.append(json.loads(json.dumps(des.get_states())))
+    return trajectory
+
+
+@pytest.mark.parametrize("engine", ["vectorized", "analytic"])
+@pytest.mark.parametrize("control_type", [-1, 0, 1, 2])
+@pytest.mark.parametrize("policy", [heuristic_policy, random_policy])
+def test_engine_matches_loop_engine(engine, control_type, policy):
+    config = base_config(control_type=control_type, control_frequency=2)
+    num_steps = 15 if control_type == 1 else 60
+    expected = run_episode(dict(config, engine="loop"), policy, num_steps)
+    assert run_episode(dict(config, engine=engine), policy, num_steps) == expected
+
+
+@pytest.mark.parametrize("engine", ["vectorized", "analytic"])
+def test_engine_matches_loop_engine_with_full_conveyors(engine):
+    config = base_config(initial_bin_level=95, num_conveyor_bins=8, conveyor_capacity=800)
+    expected = run_episode(dict(config, engine="loop"), heuristic_policy)
+    assert run_episode(dict(config, engine=engine), heuristic_policy) == expected
+
+
+def test_analytic_engine_jumps_between_downtime_events():
+    # machines running at the same speed keep the conveyor levels constant between downtime events
+    config = base_config(control_type=1, number_parallel_downtime_events=1, interval_downtime_event_mean=200,
+                         interval_downtime_event_dev=0, interval_first_down_event=100)
+    policy = lambda states: {machine: 100 for machine in MLS.General.machine_list}
+    events = {}
+    for engine in ("loop", "analytic"):
+        env = simpy.Environment()
+        count = [0]
+        step = env.step
+        def counting_step():
+            count[0] += 1
+            step()
+        env.step = counting_step
+        des = MLS.DES(env)
+        des.reset(dict(config, engine=engine, seed=3))
+        trajectory = []
+        for _ in range(6):
+            des.step(policy(des.get_states()))
+            trajectory.append(json.loads(json.dumps(des.get_states())))
+        events[engine] = (count[0], trajectory)
+    assert events["analytic"][1] == events["loop"][1]
+    assert events["analytic"][0] * 5 < events["loop"][0]
+
+
+def test_jumps_do_not_cross_a_prox(monkeypatch):
+    # the levels change linearly over a jump, so a prox that has the same status at both ends was not crossed
+    jumps = []
+    advance_line = MLS.DES.advance_line
+
+    def checked(des, ticks):
+        before = des.prox_states()
+        advance_line(des, ticks)
+        jumps.append((des.prox_states() == before).all())
+    monkeypatch.setattr(MLS.DES, "advance_line", checked)
+    run_episode(base_config(control_type=1, engine="analytic"), heuristic_policy, 40)
+    assert jumps and all(jumps)
+
+
+def test_analytic_engine_backs_off_on_busy_lines(monkeypatch):
+    # with random speeds the machines keep going idle and starting up, and quiet time steps are rare
+    calls = {"probe": 0, "update": 0}
+    kernel = MLS.LineKernel
+    for name, key in (("quiet_ticks", "probe"), ("update_line", "update")):
+        def counted(self, *args, method=getattr(kernel, name), key=key):
+            calls[key] += 1
+            return method(self, *args)
+        monkeypatch.setattr(kernel, name, counted)
+    run_episode(base_config(control_type=1, engine="analytic"), random_policy, 40)
+    assert 0 < calls["probe"] * 5 < calls["update"]
+
+
+def test_unknown_engine():
+    des = MLS.DES(simpy.Environment())
+    with pytest.raises(ValueError):
+        des.reset(base_config(engine="warp"))
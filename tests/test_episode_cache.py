@@ -0,0 +1,95 @@
+'''
+Episodes that ran before should be read from the cache with the same kpis and logs, and the cache should stay within its
+size by evicting the least recently used entries
+'''
+import os
+import time
+from functools import partial
+import bonsai_integration
+import policies
+from assessment_runner import run_assessments
+import episode_cache
+from episode_cache import EpisodeCache, policy_identity, simulator_version
+from test_engines import base_config
+
+ASSESSMENTS = os.path.join(os.path.dirname(__file__), os.pardir, "assessments")
+
+
+def test_keys_of_equivalent_configs_match(tmp_path):
+    cache = EpisodeCache(str(tmp_path))
+    identity = policy_identity(policies.heuristic_policy)
+    speeds = {f"machine{i}_initial_speed": 100 for i in range(12)}
+    key = cache.key(base_config(**speeds), identity, 0, 10)
+    config = {name: value for name, value in base_config().items() if name not in speeds}
+    assert key == cache.key(dict(config, machine_initial_speed=[100] * 12), identity, 0, 10)
+    assert key != cache.key(base_config(**speeds), identity, 1, 10)
+    assert key != cache.key(base_config(**speeds), policy_identity(policies.max_policy), 0, 10)
+
+
+def test_policy_identity():
+    assert policy_identity(policies.heuristic_policy) != policy_identity(policies.random_policy)
+    brain = partial(policies.brain_policy, exported_brain_url="http://localhost:5000")
+    assert policy_identity(brain) is None
+    assert policy_identity(brain, "v1") != policy_identity(brain, "v2")
+    assert policy_identity(lambda state: {}) is None
+
+
+def test_assessment_reruns_read_the_cache(tmp_path):
+    cache = EpisodeCache(str(tmp_path / "cache"))
+    files = [os.path.join(ASSESSMENTS, "three_random_machine_down.json")]
+    runs = []
+    for _ in range(2):
+        log_file = str(tmp_path / f"log_{len(runs)}.csv")
+        kpis = run_assessments(files, ["random"], num_iterations=50, num_workers=1, seed=3, log_file=log_file,
+                               cache=cache)
+        with open(log_file) as log:
+            runs.append((kpis, log.read()))
+    assert cache.hits == len(runs[0][0]) and cache.misses == len(runs[0][0])
+    assert [k["cached"] for k in runs[1][0]] == [True] * len(runs[1][0])
+    for kpis, _ in runs:
+        for kpi in kpis:
+            kpi.pop("wall_time"), kpi.pop("cached")
+    assert runs[0] == runs[1]
+
+
+def test_test_policy_reads_the_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = EpisodeCache(str(tmp_path / "cache"))
+    scenario_file = os.path.join(ASSESSMENTS, "machine_0_down.json")
+    for _ in range(2):
+        bonsai_integration.test_policy(num_iterations=5, headless=True, scenario_file=scenario_file,
+                                       seed=0, cache=cache)
+    assert cache.hits == cache.misses == len(cache) > 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = EpisodeCache(str(tmp_path))
+    for key in ("a1", "b2", "c3"):
+        cache.put(key, {"sink_throughput_absolute_sum": 0}, [{"state": list(range(1000))}])
+    entry_size = cache.size() // 3
+    past = time.time() - 100
+    for key, age in (("a1", 0), ("b2", 2), ("c3", 1)):
+        os.utime(cache._path(key), (past + age, past + age))
+    assert cache.get("a1", trajectory=True) is not None
+    cache.max_bytes = 2 * entry_size
+    cache.put("d4", {"sink_throughput_absolute_sum": 0}, [{"state": list(range(1000))}])
+    # b2 and c3 were used least recently once a1 was read
+    assert cache.get("c3") is None and cache.get("b2") is None
+    assert cache.get("a1") is not None and cache.get("d4") is not None
+    assert cache.size() <= cache.max_bytes
+
+
+def test_overwritten_entries_are_counted_once(tmp_path):
+    cache = EpisodeCache(str(tmp_path))
+    for trajectory in ([{"state": list(range(1000))}], None, [{"state": list(range(10))}]):
+        cache.put("a1", {"sink_throughput_absolute_sum": 0}, trajectory)
+        assert cache._size == cache.size()
+
+
+def test_simulator_version_covers_the_runners(tmp_path, monkeypatch):
+    runner = tmp_path / "assessment_runner.py"
+    runner.write_text("def run_episode(job):\n    pass\n")
+    monkeypatch.setattr(episode_cache, "RUNNER_SOURCES", [str(runner)])
+    version = simulator_version()
+    runner.write_text("def run_episode(job):\n    return job\n")
+    assert simulator_version() != version
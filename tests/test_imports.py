@@ -0,0 +1,43 @@
+'''
+the simulator and the local test entry points should import without the rendering, analysis and platform packages
+'''
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ('matplotlib', 'networkx', 'pandas', 'scipy', 'pdb', 'tkinter', 'dotenv', 'azure', 'microsoft_bonsai_api')
+
+
+def loaded_modules(module):
+    code = f"import sys, {module}; print(' '.join(sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return {name.split('.')[0] for name in output.split()}
+
+
+def test_simulator_imports_without_rendering_packages():
+    assert not loaded_modules("sim.manufacturing_env") & set(HEAVY)
+
+
+def test_bonsai_integration_imports_without_platform_packages():
+    assert not loaded_modules("bonsai_integration") & set(HEAVY)
+
+
+def test_policy_runs_headless(tmp_path, capsys, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import bonsai_integration
+    sim = bonsai_integration.test_policy(num_iterations=5, log_iterations=True, headless=True,
+                                        scenario_file=os.path.join(ROOT, "assessments", "machine_0_down.json"))
+    assert capsys.readouterr().out == ""
+    assert sim.simulator.get_states()["env_time"] > 0
+    assert len(os.listdir(tmp_path / "logs")) == 2
+
+
+def test_batched_policy_runs_headless(capsys):
+    import bonsai_integration
+    scenario_file = os.path.join(ROOT, "assessments", "three_random_machine_down.json")
+    runs = [bonsai_integration.test_policy_batched(num_iterations=5, scenario_file=scenario_file, seed=1,
+                                                   headless=True) for _ in range(2)]
+    assert capsys.readouterr().out == ""
+    assert runs[0] == runs[1]
@@ -0,0 +1,54 @@
+'''
+IterationLogger should write every buffered row once, with list states as array columns and configs once per episode
+'''
+import pandas as pd
+import pytest
+from iteration_logger import IterationLogger
+
+
+def iterations(num_episodes, num_iterations):
+    for episode in range(num_episodes):
+        for iteration in range(1, num_iterations + 1):
+            state = {"machines_speed": [episode, iteration, 3], "env_time": iteration * 1.5,
+                     "conveyor_buffers": [[0, 1], [iteration, 100]]}
+            action = {"m0": None if iteration == 1 else 10.0 * iteration, "m1": 2.0}
+            yield episode, iteration, state, action
+
+
+def write_log(path, **kwargs):
+    config = {"control_type": 0, "machine_initial_speed": [100, 30]}
+    with IterationLogger(path, chunk_size=7, **kwargs) as logger:
+        for episode, iteration, state, action in iterations(3, 20):
+            if iteration == 1:
+                logger.log_episode(episode, config, policy="heuristic")
+            logger.log(state, action, episode, iteration, policy="heuristic")
+            state["machines_speed"][0] = -1  # the simulator may keep updating the lists it handed out
+    return logger
+
+
+def test_csv_log(tmp_path):
+    logger = write_log(str(tmp_path / "run_log.csv"))
+    log = pd.read_csv(logger.paths["iterations"])
+    assert len(log) == 60
+    assert list(log.columns[:3]) == ["policy", "episode", "iteration"]
+    assert log["state_machines_speed_0"].tolist() == [e for e in range(3) for _ in range(20)]
+    assert log["state_machines_speed_1"].tolist() == list(range(1, 21)) * 3
+    assert log["action_m0"].isna().sum() == 3
+    assert log["state_conveyor_buffers_1_0"].tolist() == list(range(1, 21)) * 3
+    config = pd.read_csv(logger.paths["config"])
+    assert config["episode"].tolist() == [0, 1, 2]
+    assert config["config_machine_initial_speed_1"].tolist() == [30] * 3
+
+
+def test_parquet_log(tmp_path):
+    pytest.importorskip("pyarrow")
+    logger = write_log(str(tmp_path / "run_log"), format="parquet")
+    assert logger.paths["iterations"].endswith("run_log.parquet")
+    log = pd.read_parquet(logger.paths["iterations"])
+    assert len(log) == 60
+    assert list(log["state_machines_speed"][21]) == [1, 2, 3]
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        IterationLogger(str(tmp_path / "run_log.csv"), format="xlsx")
@@ -9,6 +9,7 @@ import os
 # p= Path(os.getcwd())
 # os.chdir(p.parent)
 from line_config import adj, con_balance, con_join 
+from sim.topology import LineTopology
 
 def test_adj_format():
     assert type(adj) == dict
@@ -26,6 +27,19 @@ def test_line_con_join():
         assert type(con_join[0]) == tuple
 
 def test_adj_machine_name_unique():
-    
-    
+    conveyors = {element for ends in adj.values() for element in ends}
+    assert not set(adj) & conveyors
 
+def test_adj_source_sink_position():
+    for infeed, discharge in adj.values():
+        assert 'sink' not in infeed
+        assert 'source' not in discharge
+
+def test_junction_shape():
+    for junction in con_balance + con_join:
+        assert len(junction) == 3
+
+def test_line_compiles():
+    # connectivity, at least one source and one sink and no dangling machine/conveyor are checked by LineTopology
+    topology = LineTopology(adj, None, con_balance, con_join)
+    assert topology.sources and topology.sinks
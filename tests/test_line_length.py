@@ -0,0 +1,39 @@
+'''
+The simulator and the policies should handle lines of any number of machines
+'''
+import json
+import pytest
+import simpy
+from sim import manufacturing_env as MLS
+from sim.line_config import serial_line
+from sim.topology import LineTopology
+from policies import heuristic_policy, max_bottleneck_policy, random_policy, with_rng
+from test_engines import base_config
+
+
+@pytest.mark.parametrize("policy", [heuristic_policy, random_policy])
+def test_engines_match_on_a_long_line(policy):
+    topology = LineTopology(*serial_line(40))
+    trajectories = []
+    for engine in ("loop", "vectorized", "analytic"):
+        des = MLS.DES(simpy.Environment(), headless=True, topology=topology)
+        des.reset(base_config(engine=engine, machine30_initial_speed=0, seed=5))
+        episode_policy = with_rng(policy, des.policy_rng)
+        trajectory = []
+        for _ in range(20):
+            des.step(episode_policy(des.get_states()))
+            trajectory.append(json.loads(json.dumps(des.get_states())))
+        trajectories.append(trajectory)
+    assert trajectories[0] == trajectories[1] == trajectories[2]
+    state = trajectories[0][-1]
+    assert len(state['machines_state']) == 40 and len(state['conveyors_level']) == 39
+    assert state['sink_throughput_absolute_sum'] > 0
+
+
+def test_policies_are_sized_from_the_state():
+    state = {'machines_state': [1] * 30, 'conveyor_discharge_p1_prox_full': [0] * 29,
+             'conveyor_discharge_p2_prox_full': [0] * 29, 'conveyor_infeed_m1_prox_empty': [0] * 29,
+             'conveyor_infeed_m2_prox_empty': [0] * 29}
+    for policy in (heuristic_policy, random_policy, max_bottleneck_policy):
+        assert list(policy(state)) == ['m' + str(i) for i in range(30)]
+    assert heuristic_policy(state)['m29'] == MLS.General.machine_max_speed[29 % 12]
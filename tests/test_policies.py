@@ -0,0 +1,102 @@
+'''
+The exported brain client should reuse its connections, send the fields of the brain state and retry busy brains
+'''
+import json
+import threading
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pytest
+import simpy
+from sim import manufacturing_env as MLS
+from policies import BrainClient, brain_policy, brain_state_fields, max_policy, predict_batch
+
+
+class BrainHandler(BaseHTTPRequestHandler):
+    '''
+    answers max_policy to the predictions, busy for the first requests
+    '''
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.connections.add(self.client_address)
+            server.requests.append((self.command, self.path, body))
+            busy = server.busy > 0
+            server.busy -= busy
+        if busy:
+            self._respond(503, {"error": "busy"})
+        elif self.path == "/v1/prediction":
+            self._respond(200, max_policy(body))
+        elif self.path == "/v1/predictions":
+            self._respond(200, [max_policy(state) for state in body])
+        else:
+            self._respond(404, {})
+
+    do_GET = do_POST = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def brain():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BrainHandler)
+    server.lock, server.connections, server.requests, server.busy = threading.Lock(), set(), [], 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def states(num_states):
+    des = MLS.DES(simpy.Environment(), headless=True)
+    des.reset({"seed": 1})
+    return [des.get_states() for _ in range(num_states)]
+
+
+def test_predictions_reuse_the_connection(brain):
+    state = states(1)[0]
+    with BrainClient(url(brain)) as client:
+        actions = [client.predict(state) for _ in range(5)]
+    assert actions == [max_policy(state)] * 5 and len(brain.connections) == 1
+    assert all(set(body) == set(brain_state_fields()) for _, _, body in brain.requests)
+
+
+def test_busy_brain_is_retried(brain):
+    brain.busy = 2
+    state = states(1)[0]
+    with BrainClient(url(brain), fields=None, backoff=0) as client:
+        assert client(state) == max_policy(state)
+    assert len(brain.requests) == 3 and brain.requests[-1][2] == state
+
+
+def test_batched_predictions(brain):
+    batch = states(6)
+    with BrainClient(url(brain), batch_path="/v1/predictions") as client:
+        assert client.predict_many(batch) == [max_policy(state) for state in batch]
+    assert [(command, path) for command, path, _ in brain.requests] == [("POST", "/v1/predictions")]
+    # without a batch endpoint, one request per state over the pooled connections
+    policy = partial(brain_policy, exported_brain_url=url(brain))
+    assert predict_batch(policy, batch) == [max_policy(state) for state in batch]
+    assert len(brain.requests) == 7 and len(brain.connections) <= 1 + 8
+
+
+def test_numpy_states_are_sent_as_lists():
+    client = BrainClient(fields=["machines_state"])
+    assert client.brain_state({"machines_state": np.array([1, -1]), "other": 0}) == {"machines_state": [1, -1]}
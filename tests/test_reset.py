@@ -0,0 +1,47 @@
+'''
+resetting a simulator in place should start the same episode as a freshly built simulator
+'''
+import json
+import pytest
+import simpy
+from sim import manufacturing_env as MLS
+from policies import heuristic_policy, random_policy, with_rng
+from test_engines import base_config
+
+
+def run(des, config, seed, num_steps=60):
+    des.reset(dict(config, seed=seed))
+    policy = with_rng(random_policy, des.policy_rng)
+    trajectory = [json.loads(json.dumps(des.get_states()))]
+    for _ in range(num_steps):
+        des.step(policy(des.get_states()))
+        trajectory.append(json.loads(json.dumps(des.get_states())))
+    return trajectory
+
+
+@pytest.mark.parametrize("engine", ["loop", "vectorized", "analytic"])
+def test_reset_in_place_matches_fresh_simulator(engine):
+    configs = [base_config(engine=engine),
+               base_config(engine=engine, num_conveyor_bins=5, initial_bin_level=20, control_type=2),
+               base_config(engine=engine, num_conveyor_bins=5, control_frequency=3),
+               base_config(engine=engine)]
+    des = MLS.DES(simpy.Environment(), headless=True)
+    for seed, config in enumerate(configs):
+        fresh = run(MLS.DES(simpy.Environment(), headless=True), config, seed)
+        assert run(des, config, seed) == fresh
+
+
+def test_reset_drops_the_previous_episode():
+    env = simpy.Environment()
+    des = MLS.DES(env, headless=True)
+    des.reset(base_config())
+    machines = list(des.machine_table)
+    for _ in range(100):
+        des.step(heuristic_policy(des.get_states()))
+    des.reset(base_config())
+    fresh_env = simpy.Environment()
+    MLS.DES(fresh_env, headless=True).reset(base_config())
+    assert env.now == 0
+    assert [event[:3] for event in env._queue] == [event[:3] for event in fresh_env._queue]
+    assert des.machine_table == machines
+    assert des.iteration == 1
@@ -0,0 +1,64 @@
+'''
+The heap scheduler should run the events of an episode like the simpy processes, for every control type and engine
+'''
+import pickle
+from fractions import Fraction
+import pytest
+import simpy
+from sim import manufacturing_env as MLS
+from sim.scheduler import time_unit
+from policies import random_policy
+from test_engines import base_config, run_episode
+from test_snapshot import rollout, started_episode
+
+
+@pytest.mark.parametrize("engine", ["loop", "analytic"])
+@pytest.mark.parametrize("control_type", [-1, 0, 1, 2])
+def test_heap_scheduler_matches_simpy(engine, control_type):
+    config = base_config(engine=engine, control_type=control_type, control_frequency=2)
+    num_steps = 15 if control_type == 1 else 60
+    expected = run_episode(config, random_policy, num_steps)
+    assert run_episode(dict(config, scheduler="heap"), random_policy, num_steps) == expected
+
+
+def test_half_second_time_steps():
+    config = base_config(control_type=2, control_frequency=1.5, simulation_time_step=0.5)
+    expected = run_episode(config, random_policy, 40)
+    assert run_episode(dict(config, scheduler="heap"), random_policy, 40) == expected
+
+
+def test_run_until_control_event():
+    des = MLS.DES(simpy.Environment(), headless=True)
+    des.reset(base_config(control_type=1, scheduler="heap", seed=2))
+    assert des.scheduler.run_until_control_event() == "downtime"
+    assert des.is_control_downtime_event == 1 and des.now == des.config.interval_first_down_event
+
+
+def test_step_runs_until_the_control_event(monkeypatch):
+    des = MLS.DES(simpy.Environment(), headless=True)
+    des.reset(base_config(control_type=2, scheduler="heap", seed=2))
+    monkeypatch.setattr(des.scheduler, "run_until", None)
+    result = des.advance(brain_actions=random_policy(des.get_states()))
+    assert result.reason == "control" and result.events == des.scheduler.processed > 0
+
+
+@pytest.mark.parametrize("control_type", [0, 1])
+def test_restore_continues_the_episode(control_type):
+    des = started_episode(base_config(control_type=control_type, scheduler="heap"), 20)
+    snapshot = pickle.loads(pickle.dumps(des.snapshot()))
+    expected = rollout(des)
+    restored = MLS.DES(simpy.Environment(), headless=True)
+    restored.restore(snapshot)
+    assert rollout(restored) == expected
+
+
+def test_time_unit():
+    assert time_unit(1, 2, 1) == 1
+    assert time_unit(0.5, 1.5, 1) == Fraction(1, 2)
+    assert time_unit(0.1, 1) == Fraction(1, 10)
+
+
+def test_unknown_scheduler():
+    des = MLS.DES(simpy.Environment(), headless=True)
+    with pytest.raises(ValueError):
+        des.reset(base_config(scheduler="threads"))
@@ -0,0 +1,62 @@
+'''
+Each simulator should draw from its own generators, so that an episode only depends on its seed and not on the other
+simulators of the process or on the draws of the policy
+'''
+import json
+import pytest
+import simpy
+from sim import manufacturing_env as MLS
+from sim.trace import EventTrace
+from policies import max_policy, random_policy, with_rng
+from test_engines import base_config
+
+
+def trajectory(des, policy, num_steps=60):
+    states = []
+    for _ in range(num_steps):
+        des.step(policy(des.get_states()))
+        states.append(json.loads(json.dumps(des.get_states())))
+    return states
+
+
+def test_interleaved_simulators_do_not_share_draws():
+    config = base_config(seed=11)
+    alone = MLS.DES(simpy.Environment(), headless=True)
+    alone.reset(config)
+    expected = trajectory(alone, with_rng(random_policy, alone.policy_rng))
+
+    first, second = (MLS.DES(simpy.Environment(), headless=True) for _ in range(2))
+    first.reset(config)
+    second.reset(base_config(seed=12))
+    policies = [with_rng(random_policy, des.policy_rng) for des in (first, second)]
+    interleaved = []
+    for _ in range(60):
+        for des, policy in zip((first, second), policies):
+            des.step(policy(des.get_states()))
+        interleaved.append(json.loads(json.dumps(first.get_states())))
+    assert interleaved == expected
+
+
+def test_simulator_seed_spawns_reproducible_episodes():
+    episodes = []
+    for _ in range(2):
+        des = MLS.DES(simpy.Environment(), headless=True, seed=7)
+        runs = []
+        for _ in range(2):
+            des.reset(base_config())
+            runs.append(trajectory(des, with_rng(random_policy, des.policy_rng), 30))
+        episodes.append(runs)
+    assert episodes[0] == episodes[1]
+    assert episodes[0][0] != episodes[0][1]
+
+
+@pytest.mark.parametrize("engine", ["loop", "analytic"])
+def test_policy_draws_do_not_change_the_downtime_events(engine):
+    downtimes = []
+    for policy in (random_policy, max_policy):
+        tracer = EventTrace(10000)
+        des = MLS.DES(simpy.Environment(), headless=True, tracer=tracer)
+        des.reset(base_config(engine=engine, control_type=1, seed=3))
+        trajectory(des, with_rng(policy, des.policy_rng), 40)
+        downtimes.append(tracer.events('downtime_start'))
+    assert downtimes[0] == downtimes[1] and downtimes[0]
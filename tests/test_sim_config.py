@@ -0,0 +1,42 @@
+'''
+Each simulator should read its parameters from its own immutable config
+'''
+import dataclasses
+import pytest
+import simpy
+from sim import manufacturing_env as MLS
+from test_engines import base_config
+
+
+def test_derived_quantities():
+    config = MLS.SimConfig.from_dict({"bin_maximum_capacity": 50, "num_conveyor_bins": 20, "machine3_initial_speed": 42})
+    assert config.conveyor_capacity == 1000
+    assert config.bins_capacity == 50
+    assert config.num_products_at_discharge_index1 == 19 * 50 + config.discharge_prox_lower_limit
+    assert config.machine_initial_speed[3] == 42
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        config.control_type = 1
+
+
+def test_simulators_do_not_share_configuration():
+    defaults = {name: getattr(MLS.General, name) for name in ("control_type", "num_conveyor_bins", "machine_initial_speed")}
+    first = MLS.DES(simpy.Environment())
+    second = MLS.DES(simpy.Environment())
+    first.reset(base_config(control_type=1, num_conveyor_bins=8, conveyor_capacity=800, machine0_initial_speed=150))
+    second.reset(base_config(control_type=-1))
+    assert first.config.control_type == 1 and second.config.control_type == -1
+    assert first.bin_levels.shape[1] == 8 and second.bin_levels.shape[1] == 10
+    assert first.c0.bins_capacity == 100 and first.m0.config is first.config
+    assert first.m0.speed == 150 and second.m0.speed == base_config()["machine0_initial_speed"]
+    assert {name: getattr(MLS.General, name) for name in defaults} == defaults
+
+
+def test_config_sized_to_the_machines_of_the_line():
+    config = MLS.SimConfig.from_dict({"machine13_initial_speed": 42, "downtime_prob": [1] * 14}, num_machines=14)
+    assert all(len(getattr(config, name)) == 14 for name in MLS.PER_MACHINE_PARAMETERS)
+    # the defaults of the 12 machine line are repeated
+    assert config.machine_max_speed[12:] == tuple(MLS.General.machine_max_speed[:2])
+    assert config.machine_initial_speed[13] == 42
+    assert MLS.SimConfig.from_dict({}, num_machines=4).idletime_duration == tuple(MLS.General.idletime_duration[:4])
+    with pytest.raises(ValueError):
+        MLS.SimConfig.from_dict({"machine_max_speed": [170] * 12}, num_machines=14)
@@ -0,0 +1,60 @@
+'''
+a simulator restored from a snapshot should continue exactly like the one the snapshot was taken from
+'''
+import json
+import pickle
+import pytest
+import simpy
+from sim import manufacturing_env as MLS
+from policies import heuristic_policy, random_policy, with_rng
+from test_engines import base_config
+
+
+def rollout(des, num_steps=40, policy=heuristic_policy):
+    trajectory = []
+    for _ in range(num_steps):
+        des.step(policy(des.get_states()))
+        trajectory.append(json.loads(json.dumps(des.get_states())))
+    return trajectory
+
+
+def started_episode(config, num_steps, seed=5):
+    des = MLS.DES(simpy.Environment(), headless=True)
+    des.reset(dict(config, seed=seed))
+    rollout(des, num_steps, with_rng(random_policy, des.policy_rng))
+    return des
+
+
+@pytest.mark.parametrize("engine", ["loop", "analytic"])
+@pytest.mark.parametrize("control_type", [0, 1, 2])
+@pytest.mark.parametrize("num_steps", [0, 1, 30])
+def test_restore_continues_the_episode(engine, control_type, num_steps):
+    des = started_episode(base_config(engine=engine, control_type=control_type, control_frequency=2), num_steps)
+    snapshot = pickle.loads(pickle.dumps(des.snapshot()))
+    expected = rollout(des)
+    restored = MLS.DES(simpy.Environment(), headless=True)
+    restored.restore(snapshot)
+    assert rollout(restored) == expected
+
+
+def test_branch_rollouts_from_one_snapshot():
+    des = started_episode(base_config(), 30)
+    snapshot = des.snapshot()
+    branches = []
+    for _ in range(2):
+        des.restore(snapshot)
+        branches.append(rollout(des))
+    assert branches[0] == branches[1]
+    assert branches[0][0]["env_time"] > snapshot["time"] > 0
+
+
+def test_fork_is_independent():
+    des = started_episode(base_config(), 30)
+    fork = des.fork()
+    assert fork.env is not des.env and fork.bin_levels is not des.bin_levels
+    expected = rollout(des, 10)
+    rollout(fork, 10, with_rng(random_policy, fork.policy_rng))
+    assert fork.get_states() != des.get_states()
+    des.restore(fork.snapshot())
+    assert des.get_states() == fork.get_states()
+    assert expected[-1]["env_time"] == fork.env.now
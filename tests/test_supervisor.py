@@ -0,0 +1,41 @@
+'''
+The supervisor should run the workers in their own processes, restart the ones that crash and sum their counters
+'''
+import os
+import time
+from supervisor import Supervisor, restart_delay, start_fake_server
+
+
+def crashing_worker(index, incarnation, options, reports):
+    '''
+    crashes the first time it runs, reports some steps afterwards
+    '''
+    if incarnation == 0:
+        os._exit(3)
+    reports.put((index, incarnation, {"steps": 10, "errors": 1}))
+    time.sleep(60)
+
+
+def test_restart_delay():
+    assert restart_delay(0) == 0
+    assert [restart_delay(crashes, 0.5, 3) for crashes in range(1, 6)] == [0.5, 1, 2, 3, 3]
+
+
+def test_crashed_workers_are_restarted():
+    supervisor = Supervisor(2, {}, target=crashing_worker, backoff=0.05)
+    summary = supervisor.run(duration=1.5, poll_interval=0.05, status_interval=None)
+    assert summary["crashes"] == summary["restarts"] == 2
+    assert summary["steps"] == 20 and summary["errors"] == 2 and summary["alive"] == 0
+    assert all(worker.incarnation == 1 and worker.crashes == 1 for worker in supervisor.workers)
+
+
+def test_workers_play_episodes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server, url = start_fake_server(steps_per_episode=20)
+    try:
+        options = {"server": url, "workspace": "w", "access_key": "k", "sessions": 2, "report_interval": 0.1}
+        summary = Supervisor(2, options).run(duration=60, max_steps=100, poll_interval=0.05, status_interval=None)
+    finally:
+        server.terminate()
+    assert summary["steps"] >= 100 and summary["episodes"] >= 4
+    assert summary["registrations"] == 4 and summary["errors"] == summary["crashes"] == 0
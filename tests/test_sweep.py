@@ -0,0 +1,49 @@
+'''
+The sweep should expand parameter ranges into designs and resume an interrupted results table
+'''
+import csv
+import numpy as np
+import pytest
+import sweep
+from test_engines import base_config
+
+
+def test_parse_parameter():
+    assert sweep.parse_parameter("num_conveyor_bins=5,10") == ("num_conveyor_bins", {"values": [5, 10]})
+    assert sweep.parse_parameter("bin_maximum_capacity=50:150") == \
+        ("bin_maximum_capacity", {"low": 50, "high": 150, "integer": True})
+    with pytest.raises(ValueError):
+        sweep.parse_parameter("num_conveyor_bins")
+
+
+def test_designs():
+    parameters = dict(map(sweep.parse_parameter, ["num_conveyor_bins=5,10", "infeedProx_index2=1:3"]))
+    assert len(sweep.make_design(parameters, "grid", levels=3)) == 6
+    points = sweep.make_design(parameters, "lhs", num_points=30, seed=1)
+    assert points == sweep.make_design(parameters, "lhs", num_points=30, seed=1)
+    # every value and integer of the range is covered evenly
+    assert sorted(p["num_conveyor_bins"] for p in points) == [5] * 15 + [10] * 15
+    assert sorted(p["infeedProx_index2"] for p in points) == [1] * 10 + [2] * 10 + [3] * 10
+    samples = sweep.latin_hypercube(8, 2, np.random.default_rng(0))
+    assert (np.sort((samples * 8).astype(int), axis=0) == np.arange(8)[:, None]).all()
+
+
+def test_point_config_derives_again():
+    config = sweep.point_config(base_config(conveyor_capacity=1000), {"num_conveyor_bins": 5})
+    assert "conveyor_capacity" not in config and config["num_conveyor_bins"] == 5
+
+
+def test_sweep_resumes(tmp_path):
+    output = str(tmp_path / "sweep.csv")
+    parameters = dict(map(sweep.parse_parameter, ["num_conveyor_bins=5,10", "infeedProx_index2=4,8"]))
+    points = sweep.make_design(parameters, "grid")
+    jobs = sweep.make_jobs(points, base_config(), ["heuristic"], replicates=2, num_iterations=10)
+    assert sweep.run_sweep(jobs[:3], output, num_workers=1, headless=True) == 3
+    assert sweep.run_sweep(jobs, output, num_workers=1, headless=True) == len(jobs) - 3
+    with open(output, newline="") as fname:
+        rows = list(csv.DictReader(fname))
+    assert sorted(row["run_id"] for row in rows) == sorted(job["run_id"] for job in jobs)
+    # a prox beyond the last of 5 bins is reported, not raised
+    errors = [row for row in rows if row["error"]]
+    assert {(row["num_conveyor_bins"], row["infeedProx_index2"]) for row in errors} == {("5", "8")}
+    assert all(float(row["sink_throughput_absolute_sum"]) > 0 for row in rows if not row["error"])
@@ -0,0 +1,99 @@
+'''
+The topology compiler should turn parallel lines with junctions into index arrays, and every engine should simulate
+them the same way
+'''
+import json
+import numpy as np
+import pytest
+import simpy
+import line_config as parallel
+from sim import manufacturing_env as MLS
+from sim.line_config import serial_line
+from sim.topology import LineTopology
+from sim.vector_env import VectorDES
+from policies import random_policy, with_rng
+from test_engines import base_config
+
+
+def parallel_topology():
+    return LineTopology(parallel.adj, None, parallel.con_balance, parallel.con_join)
+
+
+def test_parallel_line_index_arrays():
+    topology = parallel_topology()
+    assert topology.machines == ['m' + str(i) for i in range(10)]
+    assert topology.conveyors == ['c' + str(i) for i in range(9)]
+    assert topology.sources == ['source1', 'source2']
+    assert topology.infeed_conveyor[[0, 6]].tolist() == [-1, -1]
+    assert topology.upstream_machine.tolist() == [0, 1, 2, 3, 4, 6, 7, 8, 9]
+    # c8 has no machine after it, its products join c3
+    assert topology.downstream_machine.tolist() == [1, 2, 3, 4, 5, 7, 8, 9, -1]
+    assert topology.sink_feeders == [(5, 0)]
+    assert topology.balances.tolist() == [[1, 6, 4]]
+    assert topology.joins.tolist() == [[8, 3, 4]]
+
+
+def test_serial_line_matches_adj_conv():
+    adj, adj_conv = serial_line(5)
+    topology = LineTopology(adj, adj_conv)
+    assert topology.upstream_machine.tolist() == [0, 1, 2, 3]
+    assert topology.downstream_machine.tolist() == [1, 2, 3, 4]
+    assert not topology.junctions
+
+
+@pytest.mark.parametrize("adj, con_join", [
+    ({'m0': ('source', 'c0'), 'm1': ('c0', 'c1')}, []), # c1 goes nowhere
+    ({'m0': ('source', 'c0'), 'm1': ('c1', 'sink')}, []), # m1 is not fed by any source
+    ({'m0': ('source', 'c0'), 'm1': ('c0', 'sink'), 'm2': ('c0', 'sink')}, []), # c0 feeds two machines
+    ({'m0': ('source', 'c0'), 'm1': ('c0', 'sink'), 'm2': ('source', 'c1')}, [('c1', 'c0', 12)]), # join beyond the bins
+    ({'m0': ('c0', 'source'), 'm1': ('c0', 'sink')}, []), # source as a discharge
+])
+def test_invalid_lines(adj, con_join):
+    with pytest.raises(ValueError):
+        LineTopology(adj, None, [], con_join).check_bins(10)
+
+
+def test_junction_transfers():
+    topology = parallel_topology()
+    levels = np.array([0, 700, 0, 500, 0, 0, 300, 0, 250], dtype=float)
+    topology.transfer(levels, bins_capacity=100, num_conveyor_bins=10, rate=1000)
+    # c1 balances c6 up to half their difference, the last bin of c8 joins c3 as long as c3 has room after bin 4
+    assert levels[[1, 6]].tolist() == [500, 500]
+    assert levels[[3, 8]].tolist() == [600, 150]
+    assert levels.sum() == 1750
+
+
+@pytest.mark.parametrize("control_type", [-1, 0, 1, 2])
+def test_engines_match_on_parallel_line(control_type):
+    topology = parallel_topology()
+    trajectories = []
+    for engine in ("loop", "vectorized", "analytic"):
+        des = MLS.DES(simpy.Environment(), headless=True, topology=topology)
+        des.reset(base_config(engine=engine, control_type=control_type, seed=3))
+        policy = with_rng(random_policy, des.policy_rng)
+        trajectory = []
+        for _ in range(30):
+            des.step(policy(des.get_states()))
+            trajectory.append(json.loads(json.dumps(des.get_states())))
+        trajectories.append(trajectory)
+    assert trajectories[0] == trajectories[1] == trajectories[2]
+    assert len(trajectories[0][-1]['machines_state']) == 10
+    assert trajectories[0][-1]['sink_throughput_absolute_sum'] > 0
+
+
+def test_vector_env_on_parallel_line():
+    topology = parallel_topology()
+    env = VectorDES([base_config(control_type=0)] * 2, seed=0, topology=topology)
+    for _ in range(20):
+        states = env.step(np.full((2, 10), 100.0))
+    assert states['conveyor_buffers'].shape == (2, 9, 10)
+    assert (states['sink_throughput_absolute_sum'] > 0).all()
+
+
+def test_fork_keeps_the_topology():
+    des = MLS.DES(simpy.Environment(), headless=True, topology=parallel_topology())
+    des.reset(base_config())
+    des.step(random_policy(des.get_states()))
+    fork = des.fork()
+    assert fork.topology is des.topology
+    assert fork.get_states() == des.get_states()
@@ -0,0 +1,49 @@
+'''
+a headless simulator should print nothing, and its tracer should record the same events whatever the engine
+'''
+import pytest
+import simpy
+from sim import manufacturing_env as MLS
+from sim.trace import EventTrace
+from policies import heuristic_policy
+from test_engines import base_config
+
+
+def traced_episode(engine, num_steps=80, seed=3, capacity=10000):
+    tracer = EventTrace(capacity)
+    des = MLS.DES(simpy.Environment(), headless=True, tracer=tracer)
+    des.reset(base_config(engine=engine, seed=seed))
+    for _ in range(num_steps):
+        des.step(heuristic_policy(des.get_states()))
+    return tracer
+
+
+def test_headless_prints_nothing(capsys):
+    traced_episode("loop", num_steps=20)
+    assert capsys.readouterr().out == ""
+
+
+@pytest.mark.parametrize("engine", ["vectorized", "analytic"])
+def test_trace_matches_loop_engine(engine):
+    expected = traced_episode("loop").events()
+    assert traced_episode(engine).events() == expected
+    assert {e["event"] for e in expected} >= {"downtime_start", "downtime_end", "machine_state"}
+
+
+def test_downtime_events_are_paired():
+    tracer = traced_episode("loop")
+    starts = tracer.events("downtime_start")
+    ends = {(e["time"], e["machine"]) for e in tracer.events("downtime_end")}
+    for start in starts:
+        if start["time"] + start["duration"] <= 80:
+            assert (start["time"] + start["duration"], start["machine"]) in ends
+
+
+def test_ring_buffer_keeps_latest_events(tmp_path):
+    full = traced_episode("loop").events()
+    tracer = traced_episode("loop", capacity=5)
+    assert tracer.events() == full[-5:]
+    assert tracer.dropped == len(full) - 5
+    path = tmp_path / "trace.jsonl"
+    tracer.dump(str(path))
+    assert len(path.read_text().splitlines()) == 5
@@ -0,0 +1,62 @@
+'''
+VectorDES should simulate each episode like DES, independently of the other episodes of the batch
+'''
+import json
+import numpy as np
+import pytest
+import simpy
+from sim import manufacturing_env as MLS
+from sim.vector_env import VectorDES
+from policies import heuristic_policy
+from test_engines import base_config
+
+
+def des_trajectory(config, num_steps):
+    des = MLS.DES(simpy.Environment())
+    des.reset(config)
+    trajectory = []
+    for _ in range(num_steps):
+        des.step(heuristic_policy(des.get_states()))
+        trajectory.append(json.loads(json.dumps(des.get_states())))
+    return trajectory
+
+
+def vector_trajectories(configs, num_steps, seed=0):
+    vsim = VectorDES(configs, seed=seed)
+    trajectories = [[] for _ in configs]
+    for _ in range(num_steps):
+        states = vsim.step([heuristic_policy(s) for s in vsim.get_episode_states()])
+        for episode, state in enumerate(vsim.get_episode_states(states)):
+            trajectories[episode].append(state)
+    return trajectories
+
+
+def test_matches_des_without_downtime():
+    configs = [base_config(control_type=-1, control_frequency=cf, initial_bin_level=level)
+               for cf, level in [(1, 50), (2, 10), (5, 90)]]
+    trajectories = vector_trajectories(configs, 40)
+    for config, trajectory in zip(configs, trajectories):
+        assert trajectory == des_trajectory(config, 40)
+
+
+def test_episodes_are_independent_of_the_batch():
+    configs = [base_config(control_type=ct, control_frequency=2) for ct in (2, 0, 1)]
+    alone = vector_trajectories(configs[:1], 60, seed=7)
+    batched = vector_trajectories(configs, 60, seed=7)
+    assert batched[0] == alone[0]
+    assert any(s['machines_state'].count(-1) for s in alone[0])
+
+
+def test_downtime_events_are_controllable():
+    vsim = VectorDES([base_config(control_type=1)] * 4, seed=1)
+    for _ in range(10):
+        vsim.step(np.array([MLS.General.machine_initial_speed] * 4))
+    states = vsim.get_states()
+    assert states['machines_state'].shape == (4, MLS.General.number_of_machines)
+    assert (states['machines_state'] == -1).any(axis=1).all()
+
+
+def test_actions_faster_than_max_speed():
+    vsim = VectorDES([base_config()], seed=0)
+    with pytest.raises(ValueError):
+        vsim.step(np.full((1, MLS.General.number_of_machines), 1000.0))